@@ -14,17 +14,33 @@ This script roughly implements the following steps:
 -> Each task object has a uuid attached to that.
 
 -> These task objects are then pickle serialized and sent to the broker. Here the
-   broker is a Redis database that stores the serialized tasks.
+   broker is a Redis database that stores the serialized tasks. Alternatively, the
+   queue can be given a `serializer`. Then only a compact envelope with the task's
+   registered name, id, and arguments goes over the wire. Payloads above an
+   `offload_threshold` are compressed and stored under their own key, and only a
+   stub pointing to it is queued.
 
--> Broker stores the tasks in a FIFO queue.
+-> Broker stores the tasks in a FIFO queue per priority level. Delayed tasks wait
+   in a sorted set until a `scheduler` promotes them to their queue.
 
--> A single worker picks up the tasks.
+-> A single worker picks up the tasks. Alternatively, `worker_pool` keeps up to N
+   tasks running concurrently until it receives SIGINT or SIGTERM.
 
 -> When a task is found by the worker, it pops that from the FIFO queue, performs
-   deserialization, and executes it in a non-blocking fashion.
+   deserialization, and executes it in a non-blocking fashion. A task that runs
+   past its timeout is cancelled with `ephemera` from `async_timeout.py`.
+
+-> In reliable mode, the task is moved to a per-worker processing list and leased
+   instead of being popped. A `reaper` puts the tasks of crashed workers back into
+   the queue once their lease expires.
 
 -> The worker sends the task result to a result backend which is just another
-   Redis database.
+   Redis database. Results expire after `result_ttl` seconds, and clients can
+   wait for them with `get_result` instead of polling.
+
+-> A `group` of tasks counts its finished tasks down with an atomic counter. The
+   worker that finishes the last one enqueues a reducer with all the results. A
+   task that raises counts as finished, with a None result.
 
 ============
 Instructions
@@ -65,17 +81,43 @@ Copyright (c) 2021 Redowan Delowar.
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import enum
+import functools
+import hashlib
+import json
 import logging
+import math
+import os
 import pickle
 import random
+import signal
+import socket
 import sys
+import time
 import uuid
-from collections.abc import Awaitable, Callable
-from typing import Any
+import zlib
+from collections.abc import Awaitable, Iterable
+from concurrent.futures import Executor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Protocol, Tuple
 
 import aioredis
 import uvloop
 
+from patterns.async_timeout import ephemera
+from patterns.redis_scripts import evalsha_pipeline
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import lz4.frame
+except ImportError:  # pragma: no cover
+    lz4 = None
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 sh = logging.StreamHandler(stream=sys.stdout)
@@ -84,13 +126,326 @@ logger.addHandler(sh)
 
 uvloop.install()
 
+# A `(func, args, kwargs)` triple accepted by `RedisQueue.enqueue_many`.
+Call = Tuple[Callable[..., Any], Tuple[Any, ...], Dict[str, Any]]
+
+# Pop up to ARGV[1] tasks, draining the queues in priority order.
+#
+# KEYS: queues in priority order. ARGV: max tasks.
+_POP_BATCH = """
+local payloads = {}
+for _, key in ipairs(KEYS) do
+    local remaining = tonumber(ARGV[1]) - #payloads
+    if remaining == 0 then
+        break
+    end
+    local popped = redis.call('LPOP', key, remaining)
+    if popped then
+        for _, payload in ipairs(popped) do
+            payloads[#payloads + 1] = payload
+        end
+    end
+end
+return payloads
+"""
+
+# Acknowledge finished tasks, then move up to ARGV[2] tasks into the worker's
+# processing list and lease them until ARGV[1]. Lease members are
+# `<processing list>\0<queue>\0<payload>` so that the reaper knows where to
+# reclaim an expired task from and where to put it back.
+#
+# Every call also renews the worker's heartbeat until ARGV[3]. With a queue in
+# ARGV[4], the tasks in the processing list that have no lease, i.e. the ones
+# that a blocking move from that queue left behind, are leased and returned too.
+#
+# KEYS: processing list, leases, heartbeats, queues in priority order.
+# ARGV: deadline, max tasks, heartbeat deadline, queue of blocking moves or '',
+# ack count, *acked lease members.
+_RELIABLE_POP = """
+for i = 6, 5 + tonumber(ARGV[5]) do
+    local member = ARGV[i]
+    local sep = string.find(member, '\\0', #KEYS[1] + 2, true)
+    redis.call('LREM', KEYS[1], 1, string.sub(member, sep + 1))
+    redis.call('ZREM', KEYS[2], member)
+end
+redis.call('ZADD', KEYS[3], ARGV[3], KEYS[1])
+local members = {}
+if ARGV[4] ~= '' then
+    local prefix = KEYS[1] .. '\\0'
+    for _, payload in ipairs(redis.call('LRANGE', KEYS[1], 0, -1)) do
+        local leased = false
+        for k = 4, #KEYS do
+            if redis.call('ZSCORE', KEYS[2], prefix .. KEYS[k] .. '\\0' .. payload) then
+                leased = true
+                break
+            end
+        end
+        if not leased then
+            local member = prefix .. ARGV[4] .. '\\0' .. payload
+            redis.call('ZADD', KEYS[2], ARGV[1], member)
+            members[#members + 1] = member
+        end
+    end
+end
+for k = 4, #KEYS do
+    while #members < tonumber(ARGV[2]) do
+        local payload = redis.call('LMOVE', KEYS[k], KEYS[1], 'LEFT', 'RIGHT')
+        if not payload then
+            break
+        end
+        local member = KEYS[1] .. '\\0' .. KEYS[k] .. '\\0' .. payload
+        redis.call('ZADD', KEYS[2], ARGV[1], member)
+        members[#members + 1] = member
+    end
+end
+return members
+"""
+
+# Requeue up to ARGV[2] tasks whose lease expired before ARGV[1]. Tasks go back to
+# the head of their queue so that they're retried first.
+#
+# Then requeue the tasks without a lease from the processing lists of up to
+# ARGV[2] workers whose heartbeat expired. Only a blocking move leaves a task
+# unleased, so they go back to the queue in ARGV[3]. The leased tasks of those
+# lists come back once their lease expires.
+#
+# KEYS: leases, heartbeats, queues in priority order.
+# ARGV: now, batch size, queue of blocking moves.
+_REAP_LEASES = """
+local expired = redis.call(
+    'ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2]
+)
+for _, member in ipairs(expired) do
+    local first = string.find(member, '\\0', 1, true)
+    local second = string.find(member, '\\0', first + 1, true)
+    local processing = string.sub(member, 1, first - 1)
+    local queue = string.sub(member, first + 1, second - 1)
+    local payload = string.sub(member, second + 1)
+    if redis.call('LREM', processing, 1, payload) > 0 then
+        redis.call('LPUSH', queue, payload)
+    end
+    redis.call('ZREM', KEYS[1], member)
+end
+local requeued = #expired
+local dead = redis.call(
+    'ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2]
+)
+for _, processing in ipairs(dead) do
+    local prefix = processing .. '\\0'
+    for _, payload in ipairs(redis.call('LRANGE', processing, 0, -1)) do
+        local leased = false
+        for k = 3, #KEYS do
+            if redis.call('ZSCORE', KEYS[1], prefix .. KEYS[k] .. '\\0' .. payload) then
+                leased = true
+                break
+            end
+        end
+        if not leased then
+            redis.call('LREM', processing, 1, payload)
+            redis.call('LPUSH', ARGV[3], payload)
+            requeued = requeued + 1
+        end
+    end
+    if redis.call('LLEN', processing) == 0 then
+        redis.call('ZREM', KEYS[2], processing)
+    end
+end
+return requeued
+"""
+
+# Move up to ARGV[2] due tasks from every delayed set to its queue.
+#
+# KEYS: (delayed set, queue) pairs. ARGV: now, batch size.
+_PROMOTE_DUE = """
+local promoted = 0
+for i = 1, #KEYS, 2 do
+    local due = redis.call(
+        'ZRANGEBYSCORE', KEYS[i], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2]
+    )
+    if #due > 0 then
+        redis.call('RPUSH', KEYS[i + 1], unpack(due))
+        redis.call('ZREM', KEYS[i], unpack(due))
+        promoted = promoted + #due
+    end
+end
+return promoted
+"""
+
+
+# Enqueue the task unless an identical one is already in flight.
+#
+# KEYS: in-flight marker, queue. ARGV: payload, marker TTL.
+_ENQUEUE_ONCE = """
+if redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[2]) then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# Queued payloads that were offloaded to their own key are replaced by this prefix
+# and the key. Pickle, JSON, and msgpack payloads never start with a NUL byte.
+_OFFLOAD_PREFIX = b"\0offload\0"
+
+# The first byte of an offloaded blob names the codec that compressed it.
+_CODECS = {"zlib": b"z", "lz4": b"4"}
+
+# Count the finished tasks of groups down, and return the positions of the tasks
+# whose group has finished. A task only counts once, even if it's redelivered. The
+# counter is only deleted once the reducer is queued, so a retry after a failed
+# reduce finds the group finished again, and tasks redelivered later are ignored.
+#
+# KEYS: (pending counter, done set) per task. ARGV: TTL or 0, *task ids.
+_GROUP_DONE = """
+local finished = {}
+for i = 1, #KEYS / 2 do
+    local pending, done = KEYS[2 * i - 1], KEYS[2 * i]
+    if redis.call('EXISTS', pending) == 1 then
+        if redis.call('SADD', done, ARGV[i + 1]) == 1 then
+            if tonumber(ARGV[1]) > 0 then
+                redis.call('EXPIRE', done, ARGV[1])
+            end
+            redis.call('DECR', pending)
+        end
+        if tonumber(redis.call('GET', pending)) == 0 then
+            finished[#finished + 1] = i
+        end
+    end
+end
+return finished
+"""
+
+# Result record of a task that ran past its timeout. Like offload stubs, it can't
+# be mistaken for a serialized result.
+_TIMED_OUT = b"\0timeout\0"
+
+# Result record of a grouped task that raised.
+_FAILED = b"\0failed\0"
+
+
+def _is_memoized(head: bytes | None) -> bool:
+    """Tell from the head of a result record whether it can be served as is.
+
+    Timed out calls get another chance.
+    """
+    return bool(head) and head != _TIMED_OUT
+
+
+class TaskTimeout(Exception):
+    """The task ran past its timeout and was cancelled."""
+
+
+class TaskFailed(Exception):
+    """The grouped task raised, so it has no result."""
+
+
+class Priority(str, enum.Enum):
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
+
+
+class TaskRegistry:
+    """Map task names to callables so that tasks can be sent by name."""
+
+    def __init__(self) -> None:
+        self._funcs = {}  # type: dict[str, Callable[..., Any]]
+        self._names = {}  # type: dict[Callable[..., Any], str]
+        self._executors = {}  # type: dict[Callable[..., Any], str]
+
+    def task(
+        self, name: str | None = None, executor: str | None = None
+    ) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """Register the decorated function under `name` or its qualified name.
+
+        `executor` names the `RedisQueue` executor that runs a synchronous
+        function. Without one, the event loop's default thread pool runs it.
+        """
+
+        def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+            task_name = name or func.__qualname__
+            if self._funcs.get(task_name, func) is not func:
+                raise ValueError(f"task '{task_name}' is already registered")
+
+            self._funcs[task_name] = func
+            self._names[func] = task_name
+            if executor:
+                self._executors[func] = executor
+            return func
+
+        return decorator
+
+    def executor_of(self, func: Callable[..., Any]) -> str | None:
+        try:
+            return self._executors.get(func)
+        except TypeError:
+            return None
+
+    def name_of(self, func: Callable[..., Any]) -> str:
+        try:
+            return self._names[func]
+        except (KeyError, TypeError):
+            raise LookupError(f"{func!r} isn't a registered task") from None
+
+    def get(self, name: str) -> Callable[..., Any]:
+        try:
+            return self._funcs[name]
+        except KeyError:
+            raise LookupError(f"no task registered under '{name}'") from None
+
+
+registry = TaskRegistry()
+
+
+class Serializer(Protocol):
+    def dumps(self, obj: Any) -> bytes:
+        ...
+
+    def loads(self, data: bytes) -> Any:
+        ...
+
+
+class PickleSerializer:
+    def dumps(self, obj: Any) -> bytes:
+        return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data: bytes) -> Any:
+        return pickle.loads(data)
+
+
+class JSONSerializer:
+    """Compact JSON. Tuples in the payload come back as lists."""
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class MsgpackSerializer:
+    """Requires the optional `msgpack` package."""
+
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise RuntimeError("MsgpackSerializer requires the 'msgpack' package")
+
+    def dumps(self, obj: Any) -> bytes:
+        return msgpack.packb(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data)
+
+
+_PICKLE = PickleSerializer()
+
 
 class SimpleTask:
     """Assign a unique `task_id` to the target function."""
 
     def __init__(
         self,
-        func: Callable[..., Awaitable],
+        func: Callable[..., Any],
         *args: Any,
         **kwargs: Any,
     ) -> None:
@@ -98,56 +453,751 @@ class SimpleTask:
         self.func = func
         self.args = args
         self.kwargs = kwargs
+        self.timeout = None  # type: float | None
+        self.group_id = None  # type: str | None
 
-    async def process_task(self) -> Awaitable[Any]:
-        """Execute the function."""
-        return await self.func(*self.args, **self.kwargs)
+    async def process_task(self, executor: Executor | None = None) -> Awaitable[Any]:
+        """Execute the function.
+
+        Coroutine functions run on the event loop. Synchronous functions run in
+        `executor`, or the loop's default thread pool, so that they don't block it.
+        """
+        if asyncio.iscoroutinefunction(self.func):
+            return await self.func(*self.args, **self.kwargs)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, functools.partial(self.func, *self.args, **self.kwargs)
+        )
+
+    def to_envelope(self, registry: TaskRegistry) -> dict[str, Any]:
+        """Describe the task by its registered name instead of the function."""
+        return {
+            "id": self.id,
+            "name": registry.name_of(self.func),
+            "args": self.args,
+            "kwargs": self.kwargs,
+            "timeout": self.timeout,
+            "group_id": self.group_id,
+        }
+
+    @classmethod
+    def from_envelope(
+        cls, envelope: dict[str, Any], registry: TaskRegistry
+    ) -> SimpleTask:
+        task = cls(
+            registry.get(envelope["name"]),
+            *envelope["args"],
+            **envelope["kwargs"],
+        )
+        task.id = envelope["id"]
+        task.timeout = envelope.get("timeout")
+        task.group_id = envelope.get("group_id")
+        return task
 
 
 class RedisQueue:
-    """Simplified FIFO queue with Redis."""
+    """Simplified FIFO queue with Redis.
+
+    By default, whole `SimpleTask` objects are pickled. With a `serializer`, the
+    queue only sends task envelopes, so every enqueued function has to be in the
+    queue's `registry`.
+
+    Every `Priority` level has its own list, and workers drain the higher ones
+    first. The `NORMAL` list is `queue_name` itself. Delayed tasks wait in a
+    sorted set per level, scored by their due time, until `promote_due` moves
+    them to their list.
+
+    Synchronous tasks run in the executor that their registry entry names, looked
+    up in `executors`, e.g. `{"process": ProcessPoolExecutor()}` for CPU-bound
+    work. The worker keeps consuming while they run.
+
+    With a `dedupe_ttl`, tasks that `submit` or `enqueue_many` enqueue right away
+    are identified by a hash of their function and arguments instead of a random
+    id. A call that's already in flight isn't enqueued again, and a call whose
+    result is still in the result backend isn't run again; both return the
+    existing task id. The in-flight marker expires after `dedupe_ttl` seconds in
+    case its worker dies. Groups can't be deduplicated.
+
+    Payloads larger than `offload_threshold` bytes are compressed with
+    `compression`, "zlib" or "lz4", and stored once under their own key for
+    `offload_ttl` seconds. The queue only holds a short stub, so big arguments
+    neither bloat the lists nor stall Redis on large pushes and pops. Workers
+    fetch the payloads of a whole batch with one `MGET` and delete them once the
+    tasks succeed.
+
+    A task submitted with a `timeout` is cancelled once it runs for longer, which
+    frees its worker slot right away. A synchronous task's thread or process
+    can't be interrupted and runs to completion in the background. The timeout
+    is recorded as the task's result, and `get_result` raises `TaskTimeout`.
+
+    In `reliable` mode, a fetched task is atomically moved into a per-worker
+    processing list and leased for `visibility_timeout` seconds instead of being
+    popped. Finished tasks are acknowledged on the next fetch, so the hot path
+    still costs one round trip per task. `reap` puts the tasks whose lease ran
+    out, e.g. because their worker crashed, back into the queue. An idle worker
+    blocks with `BLMOVE` and leases the moved task on its next pop. If it dies in
+    between, its heartbeat runs out and `reap` requeues the task as well.
+    `BLMOVE` only watches the `NORMAL` queue, so an idle worker wakes up every
+    `poll_interval` seconds to pop the other levels too.
+    """
 
     def __init__(
         self,
         broker: aioredis.Redis,
         result_backend: aioredis.Redis,
         queue_name: str,
+        reliable: bool = False,
+        visibility_timeout: float = 30,
+        worker_id: str | None = None,
+        serializer: Serializer | None = None,
+        registry: TaskRegistry = registry,
+        result_ttl: int | None = 24 * 60 * 60,
+        executors: dict[str, Executor] | None = None,
+        dedupe_ttl: int | None = None,
+        offload_threshold: int | None = None,
+        compression: str = "zlib",
+        offload_ttl: int = 24 * 60 * 60,
+        poll_interval: float = 0.2,
     ) -> None:
+        if compression not in _CODECS:
+            raise ValueError(f"unknown compression '{compression}'")
+        if compression == "lz4" and lz4 is None:
+            raise RuntimeError("lz4 compression requires the 'lz4' package")
+
         self.broker = broker
         self.result_backend = result_backend
         self.queue_name = queue_name
+        self.serializer = serializer
+        self.registry = registry
+        self.result_ttl = result_ttl
+        self.executors = executors or {}
+        self.dedupe_ttl = dedupe_ttl
+        self.offload_threshold = offload_threshold
+        self.compression = compression
+        self.offload_ttl = offload_ttl
+        self.queue_keys = {
+            Priority.HIGH: f"{queue_name}:high",
+            Priority.NORMAL: queue_name,
+            Priority.LOW: f"{queue_name}:low",
+        }
+        self.delayed_keys = {
+            priority: f"{key}:delayed" for priority, key in self.queue_keys.items()
+        }
 
-    async def enqueue(self, func: Callable, *args: Any, **kwargs: Any) -> str:
+        self.reliable = reliable
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.processing_key = f"{queue_name}:processing:{self.worker_id}"
+        self.leases_key = f"{queue_name}:leases"
+        self.heartbeats_key = f"{queue_name}:heartbeats"
+
+        self._pop_batch = broker.register_script(_POP_BATCH)
+        self._reliable_pop = broker.register_script(_RELIABLE_POP)
+        self._reap_leases = broker.register_script(_REAP_LEASES)
+        self._promote_due = broker.register_script(_PROMOTE_DUE)
+        self._enqueue_once = broker.register_script(_ENQUEUE_ONCE)
+        self._group_done = result_backend.register_script(_GROUP_DONE)
+        self._receipts = {}  # type: dict[str, bytes]
+        self._pending_acks = []  # type: list[bytes]
+        # Lease what a blocking move or a previous worker with the same id left
+        # in the processing list.
+        self._adopt = True
+        self._offloaded = {}  # type: dict[str, str]
+
+    def _dump_task(self, task: SimpleTask) -> bytes:
+        if self.serializer is None:
+            return pickle.dumps(task, protocol=pickle.HIGHEST_PROTOCOL)
+        return self.serializer.dumps(task.to_envelope(self.registry))
+
+    def _dump_result(self, result: Any) -> bytes:
+        return (self.serializer or _PICKLE).dumps(result)
+
+    def _load_result(self, payload: bytes) -> Any:
+        return (self.serializer or _PICKLE).loads(payload)
+
+    def _content_hash(self, task: SimpleTask) -> str:
+        # Sort the kwargs so that their order doesn't change the hash.
+        kwargs = sorted(task.kwargs.items())
+        if self.serializer is None:
+            content = pickle.dumps(
+                (task.func, task.args, kwargs), protocol=pickle.HIGHEST_PROTOCOL
+            )
+        else:
+            name = self.registry.name_of(task.func)
+            content = self.serializer.dumps([name, list(task.args), kwargs])
+        return hashlib.sha256(content).hexdigest()
+
+    def _inflight_key(self, task_id: str) -> str:
+        return f"{self.queue_name}:inflight:{task_id}"
+
+    def _payload_key(self, task_id: str) -> str:
+        return f"{self.queue_name}:payload:{task_id}"
+
+    def _offload(
+        self, task_id: str, serialized_task: bytes
+    ) -> tuple[bytes, bytes | None]:
+        """Split a payload into what's queued and the blob to store separately.
+
+        Payloads up to `offload_threshold` bytes are queued as is, without a blob.
+        """
+        if (
+            self.offload_threshold is None
+            or len(serialized_task) <= self.offload_threshold
+        ):
+            return serialized_task, None
+
+        if self.compression == "lz4":
+            compressed = lz4.frame.compress(serialized_task)
+        else:
+            # Favor speed; compression runs on the event loop.
+            compressed = zlib.compress(serialized_task, 1)
+        stub = _OFFLOAD_PREFIX + self._payload_key(task_id).encode()
+        return stub, _CODECS[self.compression] + compressed
+
+    @staticmethod
+    def _decompress(blob: bytes) -> bytes:
+        codec, compressed = blob[:1], blob[1:]
+        if codec == _CODECS["lz4"]:
+            if lz4 is None:
+                raise RuntimeError("lz4 compression requires the 'lz4' package")
+            return lz4.frame.decompress(compressed)
+        return zlib.decompress(compressed)
+
+    def _load_task(self, serialized_task: bytes) -> SimpleTask:
+        if self.serializer is None:
+            return pickle.loads(serialized_task)
+        return SimpleTask.from_envelope(
+            self.serializer.loads(serialized_task), self.registry
+        )
+
+    async def submit(
+        self,
+        func: Callable,
+        args: tuple[Any, ...] = (),
+        kwargs: dict[str, Any] | None = None,
+        *,
+        priority: Priority = Priority.NORMAL,
+        eta: float | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        """Enqueue a call with a `priority`, optionally delayed until `eta`.
+
+        `eta` is a Unix timestamp. Delayed tasks are only moved to their queue by
+        `promote_due`, so a `scheduler` has to run alongside the workers. They're
+        never deduplicated. The worker cancels the task after `timeout` seconds.
+        """
         # Apply `SimpleTask` on the target function to convert it to a `task` object.
-        task = SimpleTask(func, *args, **kwargs)
+        task = SimpleTask(func, *args, **(kwargs or {}))
+        task.timeout = timeout
+        deduplicate = self.dedupe_ttl and eta is None
+        if deduplicate:
+            task.id = self._content_hash(task)
+            # Serve the memoized result instead of running the task again.
+            head = await self.result_backend.getrange(
+                f"result:{task.id}", 0, len(_TIMED_OUT) - 1
+            )
+            if _is_memoized(head):
+                return task.id
 
-        # Pickle serialize the `task` object.
-        serialized_task = pickle.dumps(task, protocol=pickle.HIGHEST_PROTOCOL)
+        # Serialize the `task` object.
+        serialized_task, blob = self._offload(task.id, self._dump_task(task))
+        if blob is not None:
+            # Store the payload before its stub becomes visible to the workers.
+            ttl = self.offload_ttl + max(0, int((eta or 0) - time.time()))
+            await self.broker.set(self._payload_key(task.id), blob, ex=ttl)
 
-        # Append the `task` to the right side of Redis's native `list` structure.
-        await self.broker.rpush(self.queue_name, serialized_task)
+        priority = Priority(priority)
+        if deduplicate:
+            # Collapse onto the identical task if it's still in flight.
+            await self._enqueue_once(
+                keys=[self._inflight_key(task.id), self.queue_keys[priority]],
+                args=[serialized_task, self.dedupe_ttl],
+            )
+        elif eta is None:
+            # Append the `task` to the right side of Redis's native `list` structure.
+            await self.broker.rpush(self.queue_keys[priority], serialized_task)
+        else:
+            await self.broker.zadd(self.delayed_keys[priority], {serialized_task: eta})
 
         # Return the `task_id` just like Celery.
         return task.id
 
-    async def dequeue(self) -> None:
-        # Fetch the pickle serialized `task` object from Redis.
-        serialized_task = await self.broker.blpop(self.queue_name)
-        serialized_task = serialized_task[1]
+    async def enqueue(self, func: Callable, *args: Any, **kwargs: Any) -> str:
+        return await self.submit(func, args, kwargs)
+
+    async def enqueue_at(
+        self, when: datetime | float, func: Callable, *args: Any, **kwargs: Any
+    ) -> str:
+        """Run the task at `when`, a datetime or a Unix timestamp."""
+        eta = when.timestamp() if isinstance(when, datetime) else when
+        return await self.submit(func, args, kwargs, eta=eta)
+
+    async def enqueue_in(
+        self, delay: timedelta | float, func: Callable, *args: Any, **kwargs: Any
+    ) -> str:
+        """Run the task after `delay`, a timedelta or a number of seconds."""
+        if isinstance(delay, timedelta):
+            delay = delay.total_seconds()
+        return await self.submit(func, args, kwargs, eta=time.time() + delay)
+
+    async def enqueue_many(
+        self,
+        calls: Iterable[Call],
+        chunk_size: int = 1000,
+        priority: Priority = Priority.NORMAL,
+        timeout: float | None = None,
+    ) -> list[str]:
+        """Enqueue a batch of `(func, args, kwargs)` calls in one round trip.
+
+        Tasks are pushed with variadic `RPUSH` commands of at most `chunk_size`
+        payloads each, and all the commands are flushed through a single
+        non-transactional pipeline. Every task gets the same `timeout`.
+
+        With a `dedupe_ttl`, the calls are deduplicated like in `submit`: one
+        pipelined round trip looks up the memoized results, and the others are
+        enqueued one by one in the pipeline, unless they're already in flight.
+        """
+        if chunk_size < 1:
+            raise ValueError("'chunk_size' must be a positive integer")
+
+        tasks = (SimpleTask(func, *args, **kwargs) for func, args, kwargs in calls)
+        return await self._push_tasks(
+            tasks, chunk_size, priority, timeout, deduplicate=bool(self.dedupe_ttl)
+        )
+
+    async def group(
+        self,
+        calls: Iterable[Call],
+        reducer: Callable[[list[Any]], Any],
+        chunk_size: int = 1000,
+        priority: Priority = Priority.NORMAL,
+        timeout: float | None = None,
+    ) -> str:
+        """Fan `calls` out as a group of tasks and reduce their results.
+
+        The worker that stores the group's last result fetches all of them with
+        one `MGET` and enqueues `reducer(results)` with `HIGH` priority. The
+        results are in the order of `calls`; the ones that timed out, expired or
+        raised are None. A task that raises isn't retried, so the group still
+        finishes. Returns the group id, which is also the reducer's task id, so
+        `get_result(group_id)` waits for the reduced value.
+
+        Groups can't be deduplicated: their results are stored by position, and
+        a task collapsed onto another group's wouldn't count for this one.
+        """
+        if chunk_size < 1:
+            raise ValueError("'chunk_size' must be a positive integer")
+        if self.dedupe_ttl:
+            raise ValueError("groups aren't supported with 'dedupe_ttl'")
+
+        group_id = str(uuid.uuid4())
+        tasks = []
+        for i, (func, args, kwargs) in enumerate(calls):
+            task = SimpleTask(func, *args, **kwargs)
+            task.id = f"{group_id}:{i}"
+            task.group_id = group_id
+            tasks.append(task)
+
+        reduce_task = SimpleTask(reducer)
+        reduce_task.id = group_id
+        if not tasks:
+            reduce_task.args = ([],)
+            await self._push_tasks([reduce_task], 1, Priority.HIGH, None)
+            return group_id
+
+        # The group must be known before any of its tasks can finish.
+        async with self.result_backend.pipeline(transaction=False) as pipe:
+            key = f"group:{group_id}"
+            pipe.set(f"{key}:reducer", self._dump_task(reduce_task), ex=self.result_ttl)
+            pipe.set(f"{key}:size", len(tasks), ex=self.result_ttl)
+            pipe.set(f"{key}:pending", len(tasks), ex=self.result_ttl)
+            await pipe.execute()
+
+        await self._push_tasks(tasks, chunk_size, priority, timeout)
+        return group_id
+
+    async def _push_tasks(
+        self,
+        tasks: Iterable[SimpleTask],
+        chunk_size: int,
+        priority: Priority,
+        timeout: float | None,
+        deduplicate: bool = False,
+    ) -> list[str]:
+        queue_key = self.queue_keys[Priority(priority)]
+        task_ids = []
+
+        if deduplicate:
+            tasks = list(tasks)
+            for task in tasks:
+                task.id = self._content_hash(task)
+                task_ids.append(task.id)
+            async with self.result_backend.pipeline(transaction=False) as pipe:
+                for task in tasks:
+                    pipe.getrange(f"result:{task.id}", 0, len(_TIMED_OUT) - 1)
+                heads = await pipe.execute()
+            tasks = [task for task, head in zip(tasks, heads) if not _is_memoized(head)]
+
+        blobs = []  # type: list[tuple[str, bytes]]
+        payloads = []  # type: list[tuple[str, bytes]]
+        for task in tasks:
+            task.timeout = timeout
+            serialized_task, blob = self._offload(task.id, self._dump_task(task))
+            if blob is not None:
+                blobs.append((self._payload_key(task.id), blob))
+            payloads.append((task.id, serialized_task))
+            if not deduplicate:
+                task_ids.append(task.id)
+
+        def queue(pipe: aioredis.client.Pipeline) -> None:
+            # Queued ahead of the pushes, so the blobs land first.
+            for key, blob in blobs:
+                pipe.set(key, blob, ex=self.offload_ttl)
+            if deduplicate:
+                # Also collapses the duplicates within the batch.
+                for task_id, payload in payloads:
+                    pipe.evalsha(
+                        self._enqueue_once.sha,
+                        2,
+                        self._inflight_key(task_id),
+                        queue_key,
+                        payload,
+                        self.dedupe_ttl,
+                    )
+                return
+
+            for start in range(0, len(payloads), chunk_size):
+                chunk = payloads[start : start + chunk_size]
+                pipe.rpush(queue_key, *(payload for _, payload in chunk))
+
+        await evalsha_pipeline(self.broker, self._enqueue_once, queue)
+        return task_ids
+
+    async def fetch(self, timeout: float = 0) -> SimpleTask | None:
+        """Pop the next `task`, blocking for at most `timeout` seconds.
+
+        A `timeout` of 0 blocks indefinitely. Returns None when the wait expires.
+        """
+        # Fetch the serialized `task` object from Redis.
+        if self.reliable:
+            serialized_tasks = await self._fetch_reliable(1, timeout)
+        elif popped := await self.broker.blpop(
+            list(self.queue_keys.values()), timeout=timeout
+        ):
+            serialized_tasks = [popped[1]]
+        else:
+            serialized_tasks = []
+
+        tasks = await self._accept(serialized_tasks)
+        return tasks[0] if tasks else None
+
+    async def dequeue_batch(
+        self, max_items: int, max_wait: float = 1
+    ) -> list[SimpleTask]:
+        """Pop up to `max_items` tasks in one round trip.
+
+        The tasks are popped with `LPOP <queue> <count>` from the queues in
+        priority order, all in one script. Only when every queue is empty, wait up
+        to `max_wait` seconds for a single task. A `max_wait` of 0
+        returns right away.
+        """
+        if max_items < 1:
+            raise ValueError("'max_items' must be a positive integer")
+
+        timeout = max_wait or None
+        if self.reliable:
+            serialized_tasks = await self._fetch_reliable(max_items, timeout)
+        else:
+            queue_keys = list(self.queue_keys.values())
+            serialized_tasks = await self._pop_batch(keys=queue_keys, args=[max_items])
+            if not serialized_tasks and timeout:
+                if popped := await self.broker.blpop(queue_keys, timeout=timeout):
+                    serialized_tasks = [popped[1]]
+
+        return await self._accept(serialized_tasks)
+
+    async def _accept(self, popped: list[bytes]) -> list[SimpleTask]:
+        # Reliable pops return lease members, which end with the payload.
+        payloads = [
+            member.split(b"\0", 2)[2] if self.reliable else member for member in popped
+        ]
+
+        # Fetch the offloaded payloads of the whole batch in one round trip.
+        offloaded = {
+            i: payload[len(_OFFLOAD_PREFIX) :].decode()
+            for i, payload in enumerate(payloads)
+            if payload.startswith(_OFFLOAD_PREFIX)
+        }
+        blobs = {}  # type: dict[int, bytes | None]
+        if offloaded:
+            blobs = dict(zip(offloaded, await self.broker.mget(*offloaded.values())))
+
+        tasks = []
+        for i, (member, payload) in enumerate(zip(popped, payloads)):
+            if i in offloaded:
+                if (blob := blobs[i]) is None:
+                    # Retrying can't bring the payload back, so drop the task.
+                    logger.error(f"Payload {offloaded[i]} expired, dropping its task.")
+                    if self.reliable:
+                        self._pending_acks.append(member)
+                    continue
+                payload = self._decompress(blob)
+
+            # Deserialize the payload to the `task` object.
+            task = self._load_task(payload)
+            if self.reliable:
+                self._receipts[task.id] = member
+            if i in offloaded:
+                self._offloaded[task.id] = offloaded[i]
+
+            logger.info(f"Task ID: {task.id}, Args: {task.args}, Kwargs: {task.kwargs}")
+            tasks.append(task)
+        return tasks
+
+    async def _fetch_reliable(self, count: int, timeout: float | None) -> list[bytes]:
+        # A `timeout` of None doesn't block and 0 blocks indefinitely.
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else math.inf
+        while True:
+            serialized_tasks = await self._pop_reliable(count)
+            if serialized_tasks or timeout is None:
+                return serialized_tasks
+            if (remaining := deadline - loop.time()) <= 0:
+                return []
+
+            # The queues are empty, so block until a task shows up. `BLMOVE` only
+            # watches the `NORMAL` queue, so wake up now and then to pop the other
+            # levels.
+            if (
+                await self.broker.execute_command(
+                    "BLMOVE",
+                    self.queue_name,
+                    self.processing_key,
+                    "LEFT",
+                    "RIGHT",
+                    min(remaining, self.poll_interval),
+                )
+                is not None
+            ):
+                # The next pop leases the moved task. If the worker dies first,
+                # `reap` requeues it once the heartbeat runs out.
+                self._adopt = True
 
-        # Deserialize the pickled object to the `task` object.
-        task = pickle.loads(serialized_task)
-        logger.info(f"Task ID: {task.id}, Args: {task.args}, Kwargs: {task.kwargs}")
+    async def _pop_reliable(self, count: int) -> list[bytes]:
+        # Piggyback the pending acks on the pop so that they don't cost a round trip.
+        acks, self._pending_acks = self._pending_acks, []
+        now = time.time()
+        try:
+            serialized_tasks = await self._reliable_pop(
+                keys=[
+                    self.processing_key,
+                    self.leases_key,
+                    self.heartbeats_key,
+                    *self.queue_keys.values(),
+                ],
+                args=[
+                    now + self.visibility_timeout,
+                    count,
+                    # Outlive the block that may follow.
+                    now + self.visibility_timeout + self.poll_interval,
+                    self.queue_name if self._adopt else "",
+                    len(acks),
+                    *acks,
+                ],
+            )
+        except Exception:
+            self._pending_acks[:0] = acks
+            raise
+        self._adopt = False
+        return serialized_tasks
 
+    async def run(self, task: SimpleTask) -> Any:
+        """Execute the task without storing its result.
+
+        Returns a `TaskTimeout` instead of the result if the task timed out, and
+        a `TaskFailed` if a grouped task raised.
+        """
+        try:
+            executor = None
+            if executor_name := self.registry.executor_of(task.func):
+                try:
+                    executor = self.executors[executor_name]
+                except KeyError:
+                    raise LookupError(f"no executor named '{executor_name}'") from None
+            if not task.timeout:
+                return await task.process_task(executor)
+
+            try:
+                async with ephemera(timeout=task.timeout):
+                    return await task.process_task(executor)
+            except asyncio.TimeoutError:
+                logger.warning(f"Task {task.id} timed out after {task.timeout}s.")
+                return TaskTimeout(f"task {task.id} timed out")
+        except BaseException as exc:
+            if task.group_id and isinstance(exc, Exception):
+                # Settle the task so that its group still finishes.
+                logger.error(f"Task {task.id} failed.", exc_info=exc)
+                return TaskFailed(f"task {task.id} failed")
+            # A failed task isn't acknowledged, so it's retried once its lease
+            # expires.
+            self._receipts.pop(task.id, None)
+            self._offloaded.pop(task.id, None)
+            if self.dedupe_ttl:
+                await self.broker.delete(self._inflight_key(task.id))
+            raise
+
+    async def store_results(self, completed: list[tuple[SimpleTask, Any]]) -> None:
+        """Save the results of several tasks in one round trip.
+
+        Every result expires after `result_ttl` seconds. Pushing to the task's
+        `result:<task_id>:ready` list wakes up the clients waiting in `get_result`.
+        """
+        async with self.result_backend.pipeline(transaction=False) as pipe:
+            for task, result in completed:
+                # Save the result using Redis's `key:val` structure.
+                if isinstance(result, TaskTimeout):
+                    payload = _TIMED_OUT
+                elif isinstance(result, TaskFailed):
+                    payload = _FAILED
+                else:
+                    payload = self._dump_result(result)
+                pipe.set(f"result:{task.id}", payload, ex=self.result_ttl)
+                pipe.rpush(f"result:{task.id}:ready", 1)
+                if self.result_ttl:
+                    pipe.expire(f"result:{task.id}:ready", self.result_ttl)
+            await pipe.execute()
+
+        grouped = [task for task, _ in completed if task.group_id]
+        if grouped:
+            keys = []  # type: list[str]
+            for task in grouped:
+                keys.extend(
+                    (f"group:{task.group_id}:pending", f"group:{task.group_id}:done")
+                )
+            finished = await self._group_done(
+                keys=keys,
+                args=[self.result_ttl or 0, *(task.id for task in grouped)],
+            )
+            for group_id in dict.fromkeys(grouped[i - 1].group_id for i in finished):
+                await self._reduce(group_id)
+
+        stale_keys = [
+            key
+            for task, _ in completed
+            if (key := self._offloaded.pop(task.id, None)) is not None
+        ]
+        if self.dedupe_ttl:
+            # The result backend serves the duplicates from now on.
+            stale_keys.extend(self._inflight_key(task.id) for task, _ in completed)
+        if stale_keys:
+            await self.broker.delete(*stale_keys)
+
+        for task, _ in completed:
+            if (receipt := self._receipts.pop(task.id, None)) is not None:
+                self._pending_acks.append(receipt)
+            logger.info("Task processing complete.")
+
+    async def _reduce(self, group_id: str) -> None:
+        key = f"group:{group_id}"
+        async with self.result_backend.pipeline(transaction=False) as pipe:
+            pipe.get(f"{key}:reducer")
+            pipe.get(f"{key}:size")
+            serialized_task, size = await pipe.execute()
+        if serialized_task is None:
+            logger.error(f"Group {group_id} expired before it finished.")
+            return
+
+        payloads = await self.result_backend.mget(
+            [f"result:{group_id}:{i}" for i in range(int(size))]
+        )
+        task = self._load_task(serialized_task)
+        task.args = (
+            [
+                None
+                if payload is None or payload in (_TIMED_OUT, _FAILED)
+                else self._load_result(payload)
+                for payload in payloads
+            ],
+        )
+        await self._push_tasks([task], 1, Priority.HIGH, None)
+        # Only now, so that `store_results` can be retried if the push fails.
+        await self.result_backend.delete(
+            f"{key}:reducer", f"{key}:size", f"{key}:pending", f"{key}:done"
+        )
+
+    async def execute(self, task: SimpleTask) -> None:
         # Execute the task here.
-        result = await task.process_task()
+        result = await self.run(task)
+        await self.store_results([(task, result)])
+
+    async def get_result(self, task_id: str, timeout: float | None = None) -> Any:
+        """Wait for the result of `task_id` without polling.
 
-        # Save the result using Redis's `key:val` structure.
-        await self.result_backend.set(f"result:{task.id}", result)
-        logger.info("Task processing complete.")
+        Raises `asyncio.TimeoutError` if the result doesn't land in `timeout`
+        seconds. A `timeout` of None waits indefinitely. Raises `TaskTimeout` if
+        the task itself timed out, and `TaskFailed` if it was grouped and raised.
+        """
+        key = f"result:{task_id}"
+        if (payload := await self.result_backend.get(key)) is None:
+            ready_key = f"{key}:ready"
+            if not await self.result_backend.blpop(ready_key, timeout=timeout or 0):
+                raise asyncio.TimeoutError
+
+            # Put the token back for the other waiters of the same task.
+            async with self.result_backend.pipeline(transaction=False) as pipe:
+                pipe.rpush(ready_key, 1)
+                if self.result_ttl:
+                    pipe.expire(ready_key, self.result_ttl)
+                pipe.get(key)
+                *_, payload = await pipe.execute()
+
+        if payload == _TIMED_OUT:
+            raise TaskTimeout(f"task {task_id} timed out")
+        if payload == _FAILED:
+            raise TaskFailed(f"task {task_id} failed")
+        return self._load_result(payload)
+
+    async def flush_acks(self) -> None:
+        """Acknowledge the finished tasks that haven't been piggybacked yet."""
+        acks, self._pending_acks = self._pending_acks, []
+        if not acks:
+            return
+
+        async with self.broker.pipeline(transaction=False) as pipe:
+            for ack in acks:
+                pipe.lrem(self.processing_key, 1, ack.split(b"\0", 2)[2])
+                pipe.zrem(self.leases_key, ack)
+            await pipe.execute()
+
+    async def reap(self, batch_size: int = 100) -> int:
+        """Requeue up to `batch_size` tasks with expired leases in one round trip.
+
+        The unleased tasks of up to `batch_size` dead workers are requeued too.
+        """
+        return await self._reap_leases(
+            keys=[self.leases_key, self.heartbeats_key, *self.queue_keys.values()],
+            args=[time.time(), batch_size, self.queue_name],
+        )
+
+    async def promote_due(self, batch_size: int = 100) -> int:
+        """Move up to `batch_size` due tasks per priority level in one round trip."""
+        keys = []  # type: list[str]
+        for priority, queue_key in self.queue_keys.items():
+            keys.extend((self.delayed_keys[priority], queue_key))
+        return await self._promote_due(keys=keys, args=[time.time(), batch_size])
+
+    async def dequeue(self) -> None:
+        task = await self.fetch()
+        await self.execute(task)  # type: ignore
 
     async def get_length(self) -> Awaitable[int]:
-        return await self.broker.llen(self.queue_name)
+        """Count the queued tasks of every priority level, delayed ones excluded."""
+        async with self.broker.pipeline(transaction=False) as pipe:
+            for queue_key in self.queue_keys.values():
+                pipe.llen(queue_key)
+            return sum(await pipe.execute())
 
 
 async def worker(queue: RedisQueue) -> None:
@@ -164,7 +1214,184 @@ async def worker(queue: RedisQueue) -> None:
         await _execute_task(queue)
 
 
+async def worker_pool(
+    queue: RedisQueue,
+    concurrency: int = 10,
+    stop: asyncio.Event | None = None,
+    poll_timeout: float = 1,
+    batch_size: int = 1,
+    on_processed: Callable[[int], None] | None = None,
+) -> None:
+    """Long-running worker that keeps up to `concurrency` tasks in flight.
+
+    A single fetcher pulls new tasks whenever slots free up, so one slow
+    coroutine no longer stalls the rest of the queue. With a `batch_size` above
+    1, the fetcher pops up to that many tasks per round trip. `on_processed` is
+    called with the number of tasks whose results were just stored.
+
+    Failed fetches and result stores are logged and retried with exponential
+    backoff, so a Redis hiccup doesn't take the pool down. The pool runs until
+    `stop` is set; when no event is passed, SIGINT and SIGTERM set it. On
+    shutdown, and when the pool exits with an error, it stops fetching, waits
+    for the in-flight tasks to finish, stores their results and flushes the
+    pending acks.
+    """
+    if concurrency < 1:
+        raise ValueError("'concurrency' must be a positive integer")
+    if batch_size < 1:
+        raise ValueError("'batch_size' must be a positive integer")
+
+    loop = asyncio.get_running_loop()
+    signals = ()  # type: tuple[signal.Signals, ...]
+    if stop is None:
+        stop = asyncio.Event()
+        signals = (signal.SIGINT, signal.SIGTERM)
+        for sig in signals:
+            loop.add_signal_handler(sig, stop.set)
+
+    in_flight = {}  # type: dict[asyncio.Task, SimpleTask]
+    fetcher = None  # type: asyncio.Task | None
+
+    try:
+        while True:
+            if fetcher is None and len(in_flight) < concurrency and not stop.is_set():
+                # The blocking pop wakes up every `poll_timeout` seconds to check
+                # `stop`. It's never cancelled, so a popped task can't be lost.
+                max_items = min(batch_size, concurrency - len(in_flight))
+                fetch = functools.partial(
+                    queue.dequeue_batch, max_items, max_wait=poll_timeout
+                )
+                fetcher = asyncio.create_task(_retry(fetch, "Fetching tasks", stop))
+
+            pending = in_flight.keys() | {fetcher} if fetcher else in_flight.keys()
+            if not pending:
+                break
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+            if fetcher in done:
+                if exc := fetcher.exception():
+                    # Only raised once `stop` is set, so there's nothing to fetch.
+                    logger.error("Fetching tasks failed.", exc_info=exc)
+                else:
+                    for task in fetcher.result():
+                        in_flight[asyncio.create_task(queue.run(task))] = task
+                fetcher = None
+
+            # Tasks that finished together have their results stored together.
+            completed = []
+            for fut in done & in_flight.keys():
+                task = in_flight.pop(fut)
+                if exc := fut.exception():
+                    logger.error("Task failed.", exc_info=exc)
+                else:
+                    completed.append((task, fut.result()))
+            if completed:
+                store = functools.partial(queue.store_results, completed)
+                await _retry(store, "Storing results", stop)
+                if on_processed:
+                    on_processed(len(completed))
+    finally:
+        for sig in signals:
+            loop.remove_signal_handler(sig)
+        # Also ends the retries of a pool that exits with an error.
+        stop.set()
+        await _drain(queue, fetcher, in_flight)
+
+    logger.info("Worker pool stopped.")
+
+
+async def _retry(
+    call: Callable[[], Awaitable[Any]], what: str, stop: asyncio.Event
+) -> Any:
+    # Retry with exponential backoff until `stop` is set, then try once more.
+    delay = 0.1
+    while True:
+        try:
+            return await call()
+        except Exception:
+            if stop.is_set():
+                raise
+            logger.exception(f"{what} failed, retrying in {delay:.1f}s.")
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(stop.wait(), timeout=delay)
+        delay = min(delay * 2, 10)
+
+
+async def _drain(
+    queue: RedisQueue,
+    fetcher: asyncio.Task | None,
+    in_flight: dict[asyncio.Task, SimpleTask],
+) -> None:
+    # Finish the tasks that a stopped pool has already taken, so that none of
+    # them is abandoned halfway, then acknowledge them.
+    if fetcher is not None:
+        try:
+            for task in await fetcher:
+                in_flight[asyncio.create_task(queue.run(task))] = task
+        except Exception:
+            logger.exception("Fetching tasks failed.")
+
+    if in_flight:
+        await asyncio.wait(in_flight)
+        completed = []
+        for fut, task in in_flight.items():
+            if exc := fut.exception():
+                logger.error("Task failed.", exc_info=exc)
+            else:
+                completed.append((task, fut.result()))
+        in_flight.clear()
+        try:
+            if completed:
+                await queue.store_results(completed)
+        except Exception:
+            logger.exception("Storing results failed.")
+
+    try:
+        await queue.flush_acks()
+    except Exception:
+        logger.exception("Flushing acks failed.")
+
+
+async def _run_periodically(
+    step: Callable[[int], Awaitable[int]],
+    interval: float,
+    batch_size: int,
+    stop: asyncio.Event | None,
+) -> None:
+    # Full batches are handled back to back; sleep only after catching up.
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        if await step(batch_size) >= batch_size:
+            continue
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def reaper(
+    queue: RedisQueue,
+    interval: float = 1,
+    batch_size: int = 100,
+    stop: asyncio.Event | None = None,
+) -> None:
+    """Periodically requeue the tasks whose lease has expired."""
+    await _run_periodically(queue.reap, interval, batch_size, stop)
+
+
+async def scheduler(
+    queue: RedisQueue,
+    interval: float = 1,
+    batch_size: int = 100,
+    stop: asyncio.Event | None = None,
+) -> None:
+    """Periodically move the due delayed tasks to their queue."""
+    await _run_periodically(queue.promote_due, interval, batch_size, stop)
+
+
 # Define a task to be run asynchronously.
+@registry.task()
 async def foo(start: int, end: int) -> int:
     await asyncio.sleep(0)
     return random.randint(start, end)
@@ -181,10 +1408,9 @@ async def orchestrator() -> None:
             funcs = [foo for _ in range(10)]
             args = [(i, j) for (i, j) in zip(range(10), range(100, 110))]
 
-            # Enqueue tasks.
-            for func, arg in zip(funcs, args):
-                logger.info("enqueing task")
-                await queue.enqueue(func, *arg)
+            # Enqueue tasks in a single round trip.
+            logger.info("enqueing tasks")
+            await queue.enqueue_many((func, arg, {}) for func, arg in zip(funcs, args))
 
             # Dequeue and execute tasks.
             await worker(queue)
@@ -0,0 +1,348 @@
+"""Benchmarks for the Redis task queue in `async_redis_queue.py`.
+
+===========
+Description
+===========
+
+Compare the wire formats that `RedisQueue` can use for its tasks. The default
+format pickles the whole `SimpleTask`, function object included. The other
+formats only encode a task envelope with the registered task name, id, and
+arguments.
+
+For every serializer, the script reports the payload size and the mean encode and
+decode time per task.
+
+It then measures the queue's enqueue and dequeue throughput and latency
+percentiles against the in-process `InMemoryBroker` and, if one is reachable,
+against a local Redis server. The gap between the two is the server and network
+overhead; the in-memory numbers are the client's own overhead.
+
+Finally, it compares inline and offloaded payloads from 1 KB to 1 MB: how many
+bytes every task occupies in the queue list and under its offload key, and the
+median enqueue and fetch latency.
+
+============
+Instructions
+============
+
+-> Optionally, spin up Redis as described in `async_redis_queue.py`.
+
+-> Install the dependencies. Install `msgpack` as well to include it:
+```
+pip install -r requirements.txt
+
+```
+-> Run the script:
+
+```
+python -m patterns.async_redis_queue_benchmark
+```
+
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any, NamedTuple
+
+import aioredis
+
+from patterns import async_redis_queue as arq
+from patterns.inmemory_redis_broker import InMemoryBroker
+
+
+class SerializerStats(NamedTuple):
+    name: str
+    payload_bytes: int
+    encode_us: float
+    decode_us: float
+
+
+def _time_per_call(func: Any, arg: Any, rounds: int) -> float:
+    """Return the mean wall time of `func(arg)` in microseconds."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(arg)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def benchmark_serializers(rounds: int = 10_000) -> list[SerializerStats]:
+    task = arq.SimpleTask(arq.foo, 1, 100)
+    pickle_serializer = arq.PickleSerializer()
+
+    # The legacy format pickles the task object itself.
+    candidates = [
+        ("pickled task", pickle_serializer, task)
+    ]  # type: list[tuple[str, arq.Serializer, Any]]
+
+    envelope = task.to_envelope(arq.registry)
+    envelope_serializers = [
+        ("pickle envelope", pickle_serializer),
+        ("json envelope", arq.JSONSerializer()),
+    ]  # type: list[tuple[str, arq.Serializer]]
+    try:
+        envelope_serializers.append(("msgpack envelope", arq.MsgpackSerializer()))
+    except RuntimeError:
+        pass
+    candidates.extend((name, ser, envelope) for name, ser in envelope_serializers)
+
+    stats = []
+    for name, serializer, obj in candidates:
+        payload = serializer.dumps(obj)
+        stats.append(
+            SerializerStats(
+                name=name,
+                payload_bytes=len(payload),
+                encode_us=_time_per_call(serializer.dumps, obj, rounds),
+                decode_us=_time_per_call(serializer.loads, payload, rounds),
+            )
+        )
+    return stats
+
+
+def report(stats: list[SerializerStats]) -> None:
+    print(f"{'format':<20}{'bytes':>8}{'encode (us)':>14}{'decode (us)':>14}")
+    for row in stats:
+        print(
+            f"{row.name:<20}{row.payload_bytes:>8}"
+            f"{row.encode_us:>14.2f}{row.decode_us:>14.2f}"
+        )
+
+
+class QueueStats(NamedTuple):
+    broker: str
+    operation: str
+    tasks: int
+    tasks_per_sec: float
+    p50_us: float
+    p95_us: float
+    p99_us: float
+
+
+def _percentile(samples: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of the already sorted `samples`."""
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+async def _measure(
+    broker_name: str,
+    operation: str,
+    rounds: int,
+    tasks_per_round: int,
+    func: Callable[[], Awaitable[Any]],
+) -> QueueStats:
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        await func()
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return QueueStats(
+        broker=broker_name,
+        operation=operation,
+        tasks=rounds * tasks_per_round,
+        tasks_per_sec=rounds * tasks_per_round / elapsed,
+        p50_us=_percentile(latencies, 0.50),
+        p95_us=_percentile(latencies, 0.95),
+        p99_us=_percentile(latencies, 0.99),
+    )
+
+
+async def benchmark_queue(
+    broker_name: str,
+    broker: Any,
+    result_backend: Any,
+    n_tasks: int = 10_000,
+    batch_size: int = 100,
+) -> list[QueueStats]:
+    """Measure one-by-one and batched enqueue and dequeue against `broker`.
+
+    Latencies are per call, i.e. per task for `enqueue` and `fetch` and per
+    batch of `batch_size` tasks for `enqueue_many` and `dequeue_batch`.
+    """
+    queue = arq.RedisQueue(broker, result_backend, "benchmark")
+    await broker.delete(*queue.queue_keys.values())
+    batch = [(arq.foo, (1, 100), {})] * batch_size  # type: list[arq.Call]
+    rounds = max(1, n_tasks // batch_size)
+
+    # Per-task logging would dominate the measurements.
+    level = arq.logger.level
+    arq.logger.setLevel(logging.WARNING)
+    try:
+        stats = [
+            await _measure(
+                broker_name,
+                "enqueue",
+                n_tasks,
+                1,
+                lambda: queue.enqueue(arq.foo, 1, 100),
+            ),
+            await _measure(
+                broker_name, "fetch", n_tasks, 1, lambda: queue.fetch(timeout=1)
+            ),
+            await _measure(
+                broker_name,
+                "enqueue_many",
+                rounds,
+                batch_size,
+                lambda: queue.enqueue_many(batch, chunk_size=batch_size),
+            ),
+            await _measure(
+                broker_name,
+                "dequeue_batch",
+                rounds,
+                batch_size,
+                lambda: queue.dequeue_batch(batch_size, max_wait=1),
+            ),
+        ]
+    finally:
+        arq.logger.setLevel(level)
+        await broker.delete(*queue.queue_keys.values())
+    return stats
+
+
+async def benchmark_brokers(
+    redis_url: str = "redis://localhost:6379", n_tasks: int = 10_000
+) -> list[QueueStats]:
+    """Run `benchmark_queue` in-process and, if it's reachable, against Redis."""
+    stats = await benchmark_queue(
+        "in-memory", InMemoryBroker(), InMemoryBroker(), n_tasks
+    )
+
+    broker = aioredis.from_url(f"{redis_url}/0")
+    result_backend = aioredis.from_url(f"{redis_url}/1")
+    try:
+        stats.extend(await benchmark_queue("redis", broker, result_backend, n_tasks))
+    except (OSError, aioredis.exceptions.ConnectionError):
+        print(f"Redis isn't reachable at {redis_url}, skipping it.")
+    return stats
+
+
+class PayloadStats(NamedTuple):
+    broker: str
+    mode: str
+    payload_bytes: int
+    list_bytes: int
+    offloaded_bytes: int
+    enqueue_p50_us: float
+    fetch_p50_us: float
+
+
+async def benchmark_payloads(
+    broker_name: str,
+    broker: Any,
+    result_backend: Any,
+    sizes: tuple[int, ...] = (1 << 10, 16 << 10, 128 << 10, 1 << 20),
+    rounds: int = 100,
+    offload_threshold: int = 16 << 10,
+) -> list[PayloadStats]:
+    """Compare inline and offloaded tasks whose argument is `size` bytes long.
+
+    The argument is random text over a small alphabet, so it compresses about as
+    well as typical JSON or log lines.
+    """
+    modes = {"inline": None, "offload": offload_threshold}
+
+    level = arq.logger.level
+    arq.logger.setLevel(logging.WARNING)
+    stats = []
+    try:
+        for size in sizes:
+            data = "".join(random.choices("abcdefghijklmnop ", k=size))
+            for mode, threshold in modes.items():
+                queue = arq.RedisQueue(
+                    broker,
+                    result_backend,
+                    "benchmark-payloads",
+                    offload_threshold=threshold,
+                )
+                await broker.delete(*queue.queue_keys.values())
+
+                task = arq.SimpleTask(arq.foo, data, 0)
+                inline, blob = queue._offload(task.id, queue._dump_task(task))
+                enqueue = await _measure(
+                    broker_name,
+                    "enqueue",
+                    rounds,
+                    1,
+                    lambda: queue.enqueue(arq.foo, data, 0),
+                )
+                fetch = await _measure(
+                    broker_name, "fetch", rounds, 1, lambda: queue.fetch(timeout=1)
+                )
+                stats.append(
+                    PayloadStats(
+                        broker=broker_name,
+                        mode=mode,
+                        payload_bytes=size,
+                        list_bytes=len(inline),
+                        offloaded_bytes=len(blob or b""),
+                        enqueue_p50_us=enqueue.p50_us,
+                        fetch_p50_us=fetch.p50_us,
+                    )
+                )
+                await broker.delete(*queue._offloaded.values())
+                queue._offloaded.clear()
+    finally:
+        arq.logger.setLevel(level)
+    return stats
+
+
+async def benchmark_payload_brokers(
+    redis_url: str = "redis://localhost:6379", rounds: int = 100
+) -> list[PayloadStats]:
+    """Run `benchmark_payloads` in-process and, if it's reachable, against Redis."""
+    stats = await benchmark_payloads(
+        "in-memory", InMemoryBroker(), InMemoryBroker(), rounds=rounds
+    )
+
+    broker = aioredis.from_url(f"{redis_url}/0")
+    result_backend = aioredis.from_url(f"{redis_url}/1")
+    try:
+        stats.extend(
+            await benchmark_payloads("redis", broker, result_backend, rounds=rounds)
+        )
+    except (OSError, aioredis.exceptions.ConnectionError):
+        print(f"Redis isn't reachable at {redis_url}, skipping it.")
+    return stats
+
+
+def report_payloads(stats: list[PayloadStats]) -> None:
+    print(
+        f"{'broker':<12}{'mode':<10}{'payload':>10}{'list':>10}{'offloaded':>12}"
+        f"{'enqueue p50 (us)':>18}{'fetch p50 (us)':>16}"
+    )
+    for row in stats:
+        print(
+            f"{row.broker:<12}{row.mode:<10}{row.payload_bytes:>10}"
+            f"{row.list_bytes:>10}{row.offloaded_bytes:>12}"
+            f"{row.enqueue_p50_us:>18.1f}{row.fetch_p50_us:>16.1f}"
+        )
+
+
+def report_queue(stats: list[QueueStats]) -> None:
+    print(
+        f"{'broker':<12}{'operation':<16}{'tasks':>8}{'tasks/s':>12}"
+        f"{'p50 (us)':>12}{'p95 (us)':>12}{'p99 (us)':>12}"
+    )
+    for row in stats:
+        print(
+            f"{row.broker:<12}{row.operation:<16}{row.tasks:>8}"
+            f"{row.tasks_per_sec:>12.0f}{row.p50_us:>12.1f}"
+            f"{row.p95_us:>12.1f}{row.p99_us:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    report(benchmark_serializers())
+    print()
+    report_queue(asyncio.run(benchmark_brokers()))
+    print()
+    report_payloads(asyncio.run(benchmark_payload_brokers()))
@@ -0,0 +1,237 @@
+"""Prefork supervisor for the Redis task queue in `async_redis_queue.py`.
+
+===========
+Description
+===========
+
+A single `worker_pool` coroutine only ever uses one core. This script forks N
+worker processes that consume the same queue, each with its own uvloop event
+loop and Redis connections.
+
+This script roughly implements the following steps:
+
+-> The supervisor forks one child per slot. Each child builds its `RedisQueue`
+   with a factory, after the fork, and runs `worker_pool` on it.
+
+-> Every child adds the number of processed tasks to its slot of a counter array
+   in shared memory.
+   The supervisor periodically logs the aggregated throughput.
+
+-> Whenever a child dies, the supervisor forks a replacement in its slot. A child
+   that dies soon after it started, e.g. because Redis is down, is replaced
+   after an exponentially growing delay, so that the supervisor doesn't fork in
+   a tight loop. The delay resets once a child stays up for `min_uptime`.
+
+-> On SIGINT or SIGTERM, the supervisor forwards SIGTERM to the children, which
+   finish their in-flight tasks, and waits for them to exit.
+
+============
+Instructions
+============
+
+-> Spin up Redis as described in `async_redis_queue.py`.
+
+-> Run the script:
+
+```
+python -m patterns.async_redis_queue_prefork
+```
+
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import sys
+import time
+from collections.abc import Callable
+from multiprocessing.sharedctypes import SynchronizedArray
+from types import FrameType
+
+import aioredis
+
+from patterns.async_redis_queue import RedisQueue, worker_pool
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+sh = logging.StreamHandler(stream=sys.stdout)
+sh.setLevel(logging.INFO)
+logger.addHandler(sh)
+
+# Children must be forked so that they inherit the queue factory as is.
+_CONTEXT = multiprocessing.get_context("fork")
+
+
+def _work(
+    queue_factory: Callable[[], RedisQueue],
+    counters: SynchronizedArray,
+    slot: int,
+    concurrency: int,
+    batch_size: int,
+) -> None:
+    """Entry point of a child process."""
+    # Drop the supervisor's handlers; `worker_pool` installs its own.
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    def on_processed(count: int) -> None:
+        with counters.get_lock():
+            counters[slot] += count
+
+    async def serve() -> None:
+        await worker_pool(
+            queue_factory(),
+            concurrency=concurrency,
+            batch_size=batch_size,
+            on_processed=on_processed,
+        )
+
+    asyncio.run(serve())
+
+
+class Supervisor:
+    """Keep `processes` worker processes consuming the queue.
+
+    A child that exits within `min_uptime` seconds is restarted after a delay
+    that starts at `restart_delay` and doubles up to `max_restart_delay`.
+    """
+
+    def __init__(
+        self,
+        queue_factory: Callable[[], RedisQueue],
+        processes: int | None = None,
+        concurrency: int = 10,
+        batch_size: int = 1,
+        report_interval: float = 5,
+        restart_delay: float = 0.1,
+        max_restart_delay: float = 30,
+        min_uptime: float = 10,
+    ) -> None:
+        self.queue_factory = queue_factory
+        self.processes = processes or os.cpu_count() or 1
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.report_interval = report_interval
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.min_uptime = min_uptime
+
+        self.restarts = 0
+        self._stopping = False
+        self._children = {}  # type: dict[int, multiprocessing.process.BaseProcess]
+        self._started = {}  # type: dict[int, float]
+        self._delays = [0.0] * self.processes
+        # Slots whose child died, by the time it's restarted.
+        self._restart_at = {}  # type: dict[int, float]
+        self._counters = _CONTEXT.Array("Q", self.processes)
+
+    @property
+    def processed(self) -> int:
+        """Number of tasks processed by all the children so far."""
+        return sum(self._counters[slot] for slot in range(self.processes))
+
+    def _spawn(self, slot: int) -> None:
+        child = _CONTEXT.Process(
+            target=_work,
+            args=(
+                self.queue_factory,
+                self._counters,
+                slot,
+                self.concurrency,
+                self.batch_size,
+            ),
+            name=f"worker-{slot}",
+        )
+        child.start()
+        self._children[slot] = child
+        self._started[slot] = time.monotonic()
+
+    def stop(self, signum: int | None = None, frame: FrameType | None = None) -> None:
+        """Ask every child to finish its in-flight tasks and exit."""
+        self._stopping = True
+        for child in self._children.values():
+            if child.is_alive() and child.pid:
+                os.kill(child.pid, signal.SIGTERM)
+
+    def run(self) -> None:
+        """Supervise the children until SIGINT, SIGTERM, or `stop`."""
+        previous_handlers = {
+            sig: signal.signal(sig, self.stop)
+            for sig in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            for slot in range(self.processes):
+                self._spawn(slot)
+            self._supervise()
+        finally:
+            for sig, handler in previous_handlers.items():
+                signal.signal(sig, handler)
+
+        for child in self._children.values():
+            child.join()
+        logger.info(f"Supervisor stopped. Processed: {self.processed}")
+
+    def _supervise(self) -> None:
+        last_report, last_processed = time.monotonic(), 0
+
+        while not self._stopping:
+            # Wake up as soon as a child dies, a restart is due, or to report the
+            # throughput.
+            sentinels = [
+                child.sentinel
+                for slot, child in self._children.items()
+                if slot not in self._restart_at
+            ]
+            timeout = min(
+                [self.report_interval]
+                + [at - time.monotonic() for at in self._restart_at.values()]
+            )
+            multiprocessing.connection.wait(sentinels, timeout=max(timeout, 0))
+
+            for slot, child in self._children.items():
+                if child.exitcode is not None and slot not in self._restart_at:
+                    delay = self._restart_delay(slot)
+                    logger.warning(
+                        f"{child.name} exited with code {child.exitcode}, "
+                        f"restarting in {delay:.1f}s."
+                    )
+                    self._restart_at[slot] = time.monotonic() + delay
+
+            for slot, at in list(self._restart_at.items()):
+                if at <= time.monotonic() and not self._stopping:
+                    del self._restart_at[slot]
+                    self.restarts += 1
+                    self._spawn(slot)
+
+            now, processed = time.monotonic(), self.processed
+            if now - last_report >= self.report_interval:
+                rate = (processed - last_processed) / (now - last_report)
+                logger.info(f"Processed: {processed}, throughput: {rate:.1f} tasks/s")
+                last_report, last_processed = now, processed
+
+    def _restart_delay(self, slot: int) -> float:
+        if time.monotonic() - self._started[slot] >= self.min_uptime:
+            # The child ran long enough, so whatever killed it has passed.
+            self._delays[slot] = 0.0
+            return 0.0
+
+        delay = min(
+            self._delays[slot] * 2 or self.restart_delay, self.max_restart_delay
+        )
+        self._delays[slot] = delay
+        return delay
+
+
+def make_queue() -> RedisQueue:
+    broker = aioredis.from_url("redis://localhost:6379/0")
+    result_backend = aioredis.from_url("redis://localhost:6379/1")
+    return RedisQueue(broker, result_backend, "default")
+
+
+if __name__ == "__main__":
+    Supervisor(make_queue).run()
@@ -0,0 +1,291 @@
+"""Sharded variant of the Redis task queue in `async_redis_queue.py`.
+
+===========
+Description
+===========
+
+A `RedisQueue` keeps its tasks in a single list, which is one hot key on one
+Redis instance. `ShardedRedisQueue` spreads the tasks over K shards instead. Every
+shard is a plain `RedisQueue` named `<queue_name>:<i>`, and a consistent hashing
+ring places the shards on one or more Redis instances.
+
+This script roughly implements the following steps:
+
+-> Producers hand out tasks to the shards round robin. Deduplicated tasks go to
+   the shard that their content hash points at, so that their duplicates meet.
+
+-> Every fetch starts at the worker's next shard in turn and steals from the
+   following shards until the batch is full. So no shard is starved, and no
+   worker idles while another shard has a backlog.
+
+-> Only when every shard is empty does a worker block, on all the lists of one
+   instance with a single `BLPOP`. The instance changes from one wait to the
+   next, so a worker never holds more than one blocking connection. Tasks that
+   land on other instances are picked up by the next fetch.
+
+-> The worker remembers which shard every task came from and stores results and
+   acknowledgements through that shard.
+
+Priorities only hold within a shard; a worker drains the shard it's visiting
+before it moves on.
+
+============
+Instructions
+============
+
+-> Spin up Redis as described in `async_redis_queue.py`.
+
+-> Run the script:
+
+```
+python -m patterns.async_redis_queue_sharded
+```
+
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import random
+from collections.abc import Iterable, Mapping
+from typing import Any, Callable
+
+import aioredis
+
+from patterns.async_redis_queue import (
+    Call,
+    Priority,
+    RedisQueue,
+    SimpleTask,
+    foo,
+    worker_pool,
+)
+from patterns.consistent_hash import HashRing
+
+
+class ShardedRedisQueue:
+    """Task queue spread over `shards` lists on the Redis instances of `brokers`.
+
+    `brokers` is a single client or a `{name: client}` mapping, e.g. keyed by
+    URL. The remaining keyword arguments configure every shard's `RedisQueue`.
+    All the shards share the `result_backend`.
+    """
+
+    def __init__(
+        self,
+        brokers: aioredis.Redis | Mapping[str, aioredis.Redis],
+        result_backend: aioredis.Redis,
+        queue_name: str,
+        shards: int = 8,
+        **options: Any,
+    ) -> None:
+        if shards < 1:
+            raise ValueError("'shards' must be a positive integer")
+        if not isinstance(brokers, Mapping):
+            brokers = {"default": brokers}
+
+        self.queue_name = queue_name
+        self.ring = HashRing(brokers)
+        self.shards = [
+            RedisQueue(
+                self.ring.get(f"{queue_name}:{i}"),
+                result_backend,
+                f"{queue_name}:{i}",
+                **options,
+            )
+            for i in range(shards)
+        ]
+
+        # Start every worker at a different shard.
+        self._next_shard = random.randrange(shards)
+        self._producer_shards = itertools.cycle(
+            random.sample(self.shards, len(self.shards))
+        )
+        self._owners = {}  # type: dict[str, RedisQueue]
+
+    @classmethod
+    def from_urls(
+        cls,
+        urls: Iterable[str],
+        result_backend: aioredis.Redis,
+        queue_name: str,
+        shards: int = 8,
+        **options: Any,
+    ) -> ShardedRedisQueue:
+        brokers = {url: aioredis.from_url(url) for url in urls}
+        return cls(brokers, result_backend, queue_name, shards, **options)
+
+    def _shard_for(
+        self, func: Callable, args: tuple[Any, ...], kwargs: dict[str, Any]
+    ) -> RedisQueue:
+        shard = self.shards[0]
+        if not shard.dedupe_ttl:
+            return next(self._producer_shards)
+
+        task_id = shard._content_hash(SimpleTask(func, *args, **kwargs))
+        return self.shards[int(task_id[:8], 16) % len(self.shards)]
+
+    async def submit(
+        self,
+        func: Callable,
+        args: tuple[Any, ...] = (),
+        kwargs: dict[str, Any] | None = None,
+        *,
+        priority: Priority = Priority.NORMAL,
+        eta: float | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        if eta is None:
+            shard = self._shard_for(func, args, kwargs or {})
+        else:
+            shard = next(self._producer_shards)
+        return await shard.submit(
+            func, args, kwargs, priority=priority, eta=eta, timeout=timeout
+        )
+
+    async def enqueue(self, func: Callable, *args: Any, **kwargs: Any) -> str:
+        return await self.submit(func, args, kwargs)
+
+    async def enqueue_many(
+        self,
+        calls: Iterable[Call],
+        chunk_size: int = 1000,
+        priority: Priority = Priority.NORMAL,
+        timeout: float | None = None,
+    ) -> list[str]:
+        """Deal the calls out to the shards and enqueue them concurrently."""
+        hands = {}  # type: dict[int, tuple[RedisQueue, list[int], list[Call]]]
+        n_calls = 0
+        for i, (func, args, kwargs) in enumerate(calls):
+            shard = self._shard_for(func, args, kwargs)
+            _, positions, shard_calls = hands.setdefault(id(shard), (shard, [], []))
+            positions.append(i)
+            shard_calls.append((func, args, kwargs))
+            n_calls += 1
+
+        task_ids = [""] * n_calls
+        shard_ids = await asyncio.gather(
+            *(
+                shard.enqueue_many(shard_calls, chunk_size, priority, timeout)
+                for shard, _, shard_calls in hands.values()
+            )
+        )
+        for (_, positions, _), ids in zip(hands.values(), shard_ids):
+            for position, task_id in zip(positions, ids):
+                task_ids[position] = task_id
+        return task_ids
+
+    async def _pop(self, max_items: int, timeout: float | None) -> list[SimpleTask]:
+        # A `timeout` of None doesn't block and 0 blocks indefinitely.
+        start = self._next_shard
+        self._next_shard = (start + 1) % len(self.shards)
+        order = self.shards[start:] + self.shards[:start]
+
+        tasks = []  # type: list[SimpleTask]
+        for shard in order:
+            for task in await shard.dequeue_batch(max_items - len(tasks), max_wait=0):
+                self._owners[task.id] = shard
+                tasks.append(task)
+            if len(tasks) == max_items:
+                break
+        if tasks or timeout is None:
+            return tasks
+
+        # Every shard is empty, so wait on one instance only.
+        home = order[0]
+        if home.reliable:
+            owner = home
+            popped = await home._fetch_reliable(1, timeout)
+        else:
+            shards_by_key = {
+                shard.queue_keys[priority]: shard
+                for priority in Priority
+                for shard in order
+                if shard.broker is home.broker
+            }
+            if not (
+                result := await home.broker.blpop(list(shards_by_key), timeout=timeout)
+            ):
+                return []
+            queue_key, serialized_task = result
+            owner = shards_by_key[queue_key.decode()]
+            popped = [serialized_task]
+
+        for task in await owner._accept(popped):
+            self._owners[task.id] = owner
+            tasks.append(task)
+        return tasks
+
+    async def fetch(self, timeout: float = 0) -> SimpleTask | None:
+        """Pop the next `task`, blocking for at most `timeout` seconds.
+
+        A `timeout` of 0 blocks indefinitely. Returns None when the wait expires.
+        """
+        tasks = await self._pop(1, timeout)
+        return tasks[0] if tasks else None
+
+    async def dequeue_batch(
+        self, max_items: int, max_wait: float = 1
+    ) -> list[SimpleTask]:
+        """Pop up to `max_items` tasks, stealing from the shards in turn."""
+        if max_items < 1:
+            raise ValueError("'max_items' must be a positive integer")
+        return await self._pop(max_items, max_wait or None)
+
+    async def run(self, task: SimpleTask) -> Any:
+        try:
+            return await self._owners[task.id].run(task)
+        except BaseException:
+            self._owners.pop(task.id, None)
+            raise
+
+    async def store_results(self, completed: list[tuple[SimpleTask, Any]]) -> None:
+        """Store the results through the shards that the tasks came from."""
+        by_owner = {}  # type: dict[int, tuple[RedisQueue, list]]
+        for task, result in completed:
+            owner = self._owners.pop(task.id, self.shards[0])
+            by_owner.setdefault(id(owner), (owner, []))[1].append((task, result))
+
+        for owner, owned in by_owner.values():
+            await owner.store_results(owned)
+
+    async def execute(self, task: SimpleTask) -> None:
+        result = await self.run(task)
+        await self.store_results([(task, result)])
+
+    async def dequeue(self) -> None:
+        task = await self.fetch()
+        await self.execute(task)  # type: ignore
+
+    async def get_result(self, task_id: str, timeout: float | None = None) -> Any:
+        return await self.shards[0].get_result(task_id, timeout)
+
+    async def flush_acks(self) -> None:
+        for shard in self.shards:
+            await shard.flush_acks()
+
+    async def reap(self, batch_size: int = 100) -> int:
+        return sum([await shard.reap(batch_size) for shard in self.shards])
+
+    async def promote_due(self, batch_size: int = 100) -> int:
+        return sum([await shard.promote_due(batch_size) for shard in self.shards])
+
+    async def get_length(self) -> int:
+        lengths = await asyncio.gather(*(shard.get_length() for shard in self.shards))
+        return sum(lengths)
+
+
+async def orchestrator() -> None:
+    urls = ["redis://localhost:6379/0", "redis://localhost:6379/2"]
+    result_backend = aioredis.from_url("redis://localhost:6379/1")
+    queue = ShardedRedisQueue.from_urls(urls, result_backend, "sharded")
+
+    await queue.enqueue_many([(foo, (i, 100), {}) for i in range(20)])
+    stop = asyncio.Event()
+    asyncio.get_running_loop().call_later(5, stop.set)
+    await worker_pool(queue, batch_size=10, stop=stop)  # type: ignore
+
+
+if __name__ == "__main__":
+    asyncio.run(orchestrator())
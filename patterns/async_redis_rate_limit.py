@@ -1,10 +1,41 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
 import hashlib
+import logging
+import math
+import random
+import time
+import uuid
+from collections.abc import AsyncIterator, Iterable, Mapping
+from typing import NamedTuple
 
 import aioredis
 
+from patterns.consistent_hash import HashRing
+from patterns.redis_scripts import evalsha_pipeline
+
+try:
+    import redis.exceptions as redis_exceptions
+except ImportError:  # pragma: no cover
+    redis_exceptions = None
+
+logger = logging.getLogger(__name__)
+
+# `redis.asyncio` clients, fakeredis's included, raise their own exceptions
+# rather than aioredis's, so catch those of both libraries.
+_CONNECTION_ERRORS = (
+    OSError,
+    aioredis.exceptions.ConnectionError,
+    aioredis.exceptions.TimeoutError,
+)  # type: tuple[type[Exception], ...]
+if redis_exceptions is not None:
+    _CONNECTION_ERRORS += (
+        redis_exceptions.ConnectionError,
+        redis_exceptions.TimeoutError,
+    )
+
 
 class TooManyRequests(Exception):
     pass
@@ -12,48 +43,591 @@ class TooManyRequests(Exception):
 
 REDIS_POOL = aioredis.Redis(host="127.0.0.1", port=6379, db=0)
 
+# Refill the bucket by the time elapsed since the last call, then try to take
+# ARGV[3] tokens out of it, or as many as are left up to ARGV[4]. The server's
+# clock is used so that every client agrees on the elapsed time. Returns
+# {granted tokens, remaining, retry after}; the floats are returned as strings
+# because Redis truncates Lua numbers.
+#
+# KEYS: bucket. ARGV: capacity, refill rate in tokens per second, tokens, max.
+_TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local wanted = math.max(requested, tonumber(ARGV[4]))
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local elapsed = math.max(0, now - (tonumber(bucket[2]) or now))
+tokens = math.min(capacity, tokens + elapsed * rate)
+
+local granted = 0
+local retry_after = 0
+if tokens >= requested then
+    granted = math.max(requested, math.min(wanted, math.floor(tokens)))
+    tokens = tokens - granted
+else
+    retry_after = (requested - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {granted, tostring(tokens), tostring(retry_after)}
+"""
+
+
+# Admit ARGV[3] requests, or as many as are left up to ARGV[4], if the requests of
+# the last ARGV[2] seconds leave room under ARGV[1]. Every admitted request is
+# logged in a sorted set, scored by its time in microseconds. This is exact, but
+# a key costs memory in proportion to its limit.
+#
+# KEYS: log. ARGV: limit, window in seconds, tokens, max, unique request id.
+_SLIDING_WINDOW_LOG = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2]) * 1000000
+local requested = tonumber(ARGV[3])
+local wanted = math.max(requested, tonumber(ARGV[4]))
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+if count + requested > limit then
+    -- Wait until enough of the oldest requests leave the window.
+    local oldest = redis.call(
+        'ZRANGE', KEYS[1], count + requested - limit - 1,
+        count + requested - limit - 1, 'WITHSCORES'
+    )
+    local retry_after = ARGV[2]
+    if oldest[2] then
+        retry_after = (tonumber(oldest[2]) + window - now) / 1000000
+    end
+    return {0, tostring(limit - count), tostring(retry_after)}
+end
+
+local granted = math.min(wanted, limit - count)
+for i = 1, granted do
+    redis.call('ZADD', KEYS[1], now, ARGV[5] .. ':' .. i)
+end
+redis.call('PEXPIRE', KEYS[1], math.ceil(window / 1000))
+return {granted, tostring(limit - count - granted), '0'}
+"""
+
+# Approximate the requests of the last ARGV[2] seconds from two fixed windows:
+# all of the current one plus the previous one, weighted by how much of it the
+# sliding window still covers. A key is a small hash whatever its limit.
+#
+# KEYS: counters. ARGV: limit, window in seconds, tokens, max.
+_SLIDING_WINDOW_COUNTER = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local wanted = math.max(requested, tonumber(ARGV[4]))
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local index = math.floor(now / window)
+
+local counters = redis.call('HMGET', KEYS[1], 'index', 'current', 'previous')
+local last = tonumber(counters[1])
+local current, previous = 0, 0
+if last == index then
+    current = tonumber(counters[2])
+    previous = tonumber(counters[3])
+elseif last == index - 1 then
+    previous = tonumber(counters[2])
+end
+
+local elapsed = now - index * window
+local estimate = previous * (1 - elapsed / window) + current
+if estimate + requested > limit then
+    -- The previous window's weight has to shrink; if that's not enough, wait
+    -- for the next window.
+    local retry_after = window - elapsed
+    if previous > 0 and limit - current - requested >= 0 then
+        local room = (limit - current - requested) / previous
+        retry_after = math.min(retry_after, window * (1 - room) - elapsed)
+    end
+    return {0, tostring(limit - estimate), tostring(retry_after)}
+end
+
+local granted = math.max(requested, math.min(wanted, math.floor(limit - estimate)))
+current = current + granted
+redis.call('HSET', KEYS[1], 'index', index, 'current', current, 'previous', previous)
+redis.call('PEXPIRE', KEYS[1], math.ceil(window * 2000))
+return {granted, tostring(limit - estimate - granted), '0'}
+"""
+
+# Drop the expired leases, then lease a slot to ARGV[3] if fewer than ARGV[1] are
+# held. Leases are scored by their expiry in milliseconds on the server's clock.
+#
+# KEYS: leases. ARGV: limit, lease in milliseconds, holder.
+_SEMAPHORE_ACQUIRE = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Extend the lease of ARGV[2] unless it has already expired.
+#
+# KEYS: leases. ARGV: lease in milliseconds, holder.
+_SEMAPHORE_RENEW = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local expires_at = tonumber(redis.call('ZSCORE', KEYS[1], ARGV[2]))
+if not expires_at or expires_at <= now then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[1]), ARGV[2])
+redis.call('PEXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+_STRATEGIES = {
+    "token_bucket": _TOKEN_BUCKET,
+    "sliding_window_log": _SLIDING_WINDOW_LOG,
+    "sliding_window_counter": _SLIDING_WINDOW_COUNTER,
+}
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    remaining: float
+    retry_after: float  # Seconds until the request would be allowed.
+
+
+class _Lease:
+    """Tokens that this process took from a Redis bucket in advance."""
+
+    __slots__ = ("tokens", "expires_at")
+
+    def __init__(self, tokens: int, expires_at: float) -> None:
+        self.tokens = tokens
+        self.expires_at = expires_at
+
+
+class _Line:
+    """Coroutines of this process waiting in `acquire` for the same bucket.
+
+    `retry_at` is the monotonic time before which probing Redis is pointless.
+    """
+
+    __slots__ = ("lock", "waiters", "retry_at")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.waiters = 0
+        self.retry_at = 0.0
+
+
+# Leases and lines outlive the `RateLimit` instances, which are usually created
+# per request, so they're kept per process and keyed by bucket.
+_LEASES = {}  # type: dict[str, _Lease]
+_MAX_LEASES = 10_000
+_LINES = {}  # type: dict[str, _Line]
+
 
 class RateLimit:
+    """Rate limiter shared through Redis.
+
+    `strategy` picks the algorithm; each one is a single atomic script call:
+
+    - "token_bucket" refills `rps` tokens per second up to a burst of `_ttl`
+      seconds' worth.
+    - "sliding_window_log" admits as many requests in any `_ttl` seconds. It's
+      exact, but logs every admitted request.
+    - "sliding_window_counter" estimates the same window from two fixed windows
+      in constant memory per key.
+
+    With a `lease_size`, the limiter takes up to that many tokens from Redis at
+    once and admits the following requests of the same key from memory until the
+    lease runs out or `lease_ttl` seconds pass. Leased tokens are already spent
+    in Redis, so the fleet never admits more than the limit. Every process can
+    hold back up to `lease_size` tokens per key, though; they're admitted up to
+    `lease_ttl` seconds late or lost when the lease expires. In this mode,
+    `Decision.remaining` counts the tokens left in the local lease.
+    """
+
     def __init__(
         self,
         header: dict[str, str],
         prefix: str | None = None,
         rps: int = 100,  # 10 requests per second.
         redis_pool: aioredis.Redis = REDIS_POOL,
+        lease_size: int | None = None,
+        lease_ttl: float = 1,
+        strategy: str = "token_bucket",
     ) -> None:
+        if strategy not in _STRATEGIES:
+            raise ValueError(f"unknown strategy '{strategy}'")
+
         self._header = header
         self._prefix = prefix
         self._rps = rps
         self._redis_pool = redis_pool
         self._ttl = 10  # Time to live = 10 seconds.
+        self._lease_size = lease_size
+        self._lease_ttl = lease_ttl
+
+        self._strategy = strategy
+
+        # A token bucket that refills at `rps` and holds `_ttl` seconds' worth of
+        # tokens. The fixed window that it replaces let `rps * _ttl` requests
+        # through after the one that opened the window, so keep that burst. The
+        # sliding windows admit as many requests per `_ttl` seconds.
+        self._capacity = rps * self._ttl + 1
+        # Registered scripts are sent with `EVALSHA`, and only loaded on a miss.
+        self._take = redis_pool.register_script(_STRATEGIES[strategy])
 
-    async def _limiter(self, target_attr: str) -> None:
+    def _key(self, target_attr: str) -> str:
         hash_val = hashlib.sha1(bytes(target_attr, encoding="UTF-8")).hexdigest()
 
         if self._prefix:
-            key = f"rate_limit:{self._prefix}:{hash_val}"
+            return f"rate_limit:{self._prefix}:{hash_val}"
+        return f"rate_limit:{hash_val}"
+
+    async def check(self, target_attr: str, tokens: int = 1) -> Decision:
+        """Take `tokens` from the bucket of `target_attr` in one round trip.
+
+        In lease mode, the round trip is only needed to renew the lease.
+        """
+        key = self._key(target_attr)
+        if (decision := self._take_leased(key, tokens)) is not None:
+            return decision
+
+        reply = await self._take(keys=[key], args=self._script_args(tokens))
+        return self._decide(key, tokens, reply)
+
+    async def check_many(
+        self, limits: Iterable[tuple[str, int]], tokens: int = 1
+    ) -> list[Decision]:
+        """Check several `(target_attr, rps)` limits in one pipelined round trip.
+
+        Every limit is decided on its own, in order: a request that one limit
+        denies still takes tokens from the others.
+        """
+        decisions = []  # type: list[Decision | None]
+        pending = []  # type: list[tuple[int, str, int]]
+        for i, (target_attr, rps) in enumerate(limits):
+            key = self._key(target_attr)
+            decisions.append(self._take_leased(key, tokens))
+            if decisions[-1] is None:
+                pending.append((i, key, rps))
+
+        if pending:
+            replies = await _evalsha_many(
+                self._redis_pool,
+                self._take,
+                [(key, self._script_args(tokens, rps)) for _, key, rps in pending],
+            )
+            for (i, key, _), reply in zip(pending, replies):
+                decisions[i] = self._decide(key, tokens, reply)
+
+        return decisions  # type: ignore
+
+    def _take_leased(self, key: str, tokens: int) -> Decision | None:
+        if not self._lease_size:
+            return None
+
+        lease = _LEASES.get(key)
+        if lease and lease.expires_at > time.monotonic() and lease.tokens >= tokens:
+            lease.tokens -= tokens
+            return Decision(True, lease.tokens, 0.0)
+        return None
+
+    def _decide(self, key: str, tokens: int, reply: list) -> Decision:
+        granted, remaining, retry_after = reply
+        if self._lease_size and granted:
+            lease = self._renew_lease(key, int(granted) - tokens)
+            return Decision(True, lease.tokens, 0.0)
+        return Decision(bool(granted), float(remaining), float(retry_after))
+
+    def _script_args(self, tokens: int, rps: int | None = None) -> list:
+        if rps is None:
+            rps, capacity = self._rps, self._capacity
         else:
-            key = f"rate_limit:{hash_val}"
+            capacity = rps * self._ttl + 1
+
+        wanted = self._lease_size or tokens
+        if self._strategy == "token_bucket":
+            return [capacity, rps, tokens, wanted]
+        if self._strategy == "sliding_window_log":
+            return [capacity, self._ttl, tokens, wanted, uuid.uuid4().hex]
+        return [capacity, self._ttl, tokens, wanted]
+
+    def _renew_lease(self, key: str, tokens: int) -> _Lease:
+        now = time.monotonic()
+        lease = _LEASES.get(key)
+        if lease is None or lease.expires_at <= now:
+            if len(_LEASES) >= _MAX_LEASES:
+                _evict_leases(now)
+            lease = _LEASES[key] = _Lease(0, now)
+
+        lease.tokens += tokens
+        lease.expires_at = now + self._lease_ttl
+        return lease
+
+    async def _limiter(self, target_attr: str) -> Decision:
+        decision = await self.check(target_attr)
+        if not decision.allowed:
+            raise TooManyRequests(
+                "429: The rate limiter is working as expected. "
+                "Please slow down with your requests. "
+                f"Retry after {decision.retry_after:.3f} seconds."
+            )
+        return decision
+
+    def _target(self) -> str | None:
+        return self._header.get("Authorization") or self._header.get("Host")
+
+    async def rate_limit(self) -> None:
+        if target_attr := self._target():
+            await self._limiter(target_attr)
+
+    async def acquire(
+        self, target_attr: str | None = None, tokens: int = 1
+    ) -> Decision:
+        """Wait until `tokens` can be taken instead of raising `TooManyRequests`.
+
+        `target_attr` defaults to the header that `rate_limit` uses. The callers
+        of a key line up behind a lock, and only the head of the line probes
+        Redis. It sleeps until the retry-after of the last denial first, and
+        after draining the bucket, the next in line sleeps until it refills. So
+        a limited key costs about one probe per grant.
+        """
+        if tokens > self._capacity:
+            raise ValueError(
+                f"'tokens' can't exceed the capacity of {self._capacity} tokens"
+            )
+        if not (target_attr := target_attr or self._target()):
+            return Decision(True, math.inf, 0.0)
+
+        key = self._key(target_attr)
+        if (line := _LINES.get(key)) is None:
+            line = _LINES[key] = _Line()
+        line.waiters += 1
+        try:
+            async with line.lock:
+                while True:
+                    if (delay := line.retry_at - time.monotonic()) > 0:
+                        await asyncio.sleep(delay)
+                    decision = await self.check(target_attr, tokens)
+                    now = time.monotonic()
+                    if not decision.allowed:
+                        # Floor the sleep so that rounding can't spin on Redis.
+                        line.retry_at = now + max(decision.retry_after, 0.001)
+                        continue
+                    if not self._lease_size and decision.remaining < tokens:
+                        # The bucket is drained, so the next in line waits for it
+                        # to refill. A lease's tokens say nothing about the bucket.
+                        line.retry_at = now + (tokens - decision.remaining) / self._rps
+                    return decision
+        finally:
+            line.waiters -= 1
+            if not line.waiters:
+                del _LINES[key]
 
-        value = await self._redis_pool.get(key)
 
-        if value is None:
-            await self._redis_pool.setex(key, self._ttl, self._rps * self._ttl)
+async def _evalsha_many(
+    redis_pool: aioredis.Redis,
+    script: aioredis.client.Script,
+    calls: list[tuple[str, list]],
+) -> list:
+    """Run `script` on every `(key, args)` pair in one pipelined round trip."""
+
+    def queue(pipe: aioredis.client.Pipeline) -> None:
+        for key, args in calls:
+            pipe.evalsha(script.sha, 1, key, *args)
+
+    return await evalsha_pipeline(redis_pool, script, queue)
+
+
+def _evict_leases(now: float) -> None:
+    expired = [key for key, lease in _LEASES.items() if lease.expires_at <= now]
+    for key in expired:
+        del _LEASES[key]
+    if not expired:
+        # Every lease is live, so drop the oldest one.
+        del _LEASES[next(iter(_LEASES))]
+
+
+class ShardedRateLimit(RateLimit):
+    """`RateLimit` that spreads its keys over the Redis pools of `ring`.
+
+    Every key lives on the pool that the consistent hashing ring maps its SHA-1
+    key to, so adding a node only moves about 1/N of the keys. Build the ring
+    once and share it; the limiter itself is cheap to create per request.
+
+    When a node can't be reached, its keys fail open, i.e. are allowed, or fail
+    closed, i.e. are denied with a `retry_after` of `failure_retry_after`.
+    `fail_open` is a policy for every node or a `{name: policy}` mapping; nodes
+    that it doesn't name fail closed.
+    """
+
+    def __init__(
+        self,
+        header: dict[str, str],
+        ring: HashRing[aioredis.Redis],
+        prefix: str | None = None,
+        rps: int = 100,
+        lease_size: int | None = None,
+        lease_ttl: float = 1,
+        strategy: str = "token_bucket",
+        fail_open: bool | Mapping[str, bool] = False,
+        failure_retry_after: float = 1,
+    ) -> None:
+        first = next(iter(ring.nodes.values()))
+        super().__init__(
+            header, prefix, rps, first, lease_size, lease_ttl, strategy=strategy
+        )
+        self._ring = ring
+        self._scripts = {
+            name: pool.register_script(_STRATEGIES[strategy])
+            for name, pool in ring.nodes.items()
+        }
+        if isinstance(fail_open, Mapping):
+            self._fail_open = {name: fail_open.get(name, False) for name in ring.nodes}
         else:
-            if int(value) > 0:
-                await self._redis_pool.decrby(key, 1)
+            self._fail_open = dict.fromkeys(ring.nodes, fail_open)
+        self._failure_retry_after = failure_retry_after
+
+    async def check(self, target_attr: str, tokens: int = 1) -> Decision:
+        """Take `tokens` from the bucket of `target_attr` on its node."""
+        key = self._key(target_attr)
+        if (decision := self._take_leased(key, tokens)) is not None:
+            return decision
+
+        name = self._ring.name_of(key)
+        decisions = await self._check_node(name, [(0, key, self._rps)], tokens)
+        return decisions[0]
+
+    async def check_many(
+        self, limits: Iterable[tuple[str, int]], tokens: int = 1
+    ) -> list[Decision]:
+        """Check several limits with one pipeline per node, all run concurrently."""
+        decisions = []  # type: list[Decision | None]
+        by_node = {}  # type: dict[str, list[tuple[int, str, int]]]
+        for i, (target_attr, rps) in enumerate(limits):
+            key = self._key(target_attr)
+            decisions.append(self._take_leased(key, tokens))
+            if decisions[-1] is None:
+                by_node.setdefault(self._ring.name_of(key), []).append((i, key, rps))
+
+        replies = await asyncio.gather(
+            *(
+                self._check_node(name, pending, tokens)
+                for name, pending in by_node.items()
+            )
+        )
+        for pending, node_decisions in zip(by_node.values(), replies):
+            for (i, _, _), decision in zip(pending, node_decisions):
+                decisions[i] = decision
+        return decisions  # type: ignore
+
+    async def _check_node(
+        self, name: str, pending: list[tuple[int, str, int]], tokens: int
+    ) -> list[Decision]:
+        calls = [(key, self._script_args(tokens, rps)) for _, key, rps in pending]
+        try:
+            if len(calls) == 1:
+                # A single `EVALSHA` needs no pipeline.
+                key, args = calls[0]
+                replies = [await self._scripts[name](keys=[key], args=args)]
             else:
-                raise TooManyRequests(
-                    "429: The rate limiter is working as expected. "
-                    "Please slow down with your requests."
+                replies = await _evalsha_many(
+                    self._ring.nodes[name], self._scripts[name], calls
                 )
+        except _CONNECTION_ERRORS:
+            fail_open = self._fail_open[name]
+            logger.warning(
+                f"Rate limit node {name} is unreachable, failing "
+                f"{'open' if fail_open else 'closed'}."
+            )
+            if fail_open:
+                return [Decision(True, math.inf, 0.0)] * len(pending)
+            return [Decision(False, 0.0, self._failure_retry_after)] * len(pending)
 
-    async def rate_limit(self) -> None:
-        if auth_token := self._header.get("Authorization"):
-            await self._limiter(auth_token)
+        return [
+            self._decide(key, tokens, reply)
+            for (_, key, _), reply in zip(pending, replies)
+        ]
+
+
+class DistributedSemaphore:
+    """Cap how many holders across the fleet run at once, like `asyncio.Semaphore`.
+
+    Every holder leases one of `limit` slots in a sorted set for `lease` seconds.
+    Acquiring and releasing take one round trip each. A holder that crashes
+    releases its slot when the lease expires; one that runs for longer than
+    `lease` has to `renew` it. `acquire` polls every `retry_interval` seconds,
+    with jitter, while the semaphore is full.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        lease: float = 30,
+        redis_pool: aioredis.Redis = REDIS_POOL,
+        retry_interval: float = 0.05,
+    ) -> None:
+        if limit < 1:
+            raise ValueError("'limit' must be a positive integer")
+
+        self._key = f"semaphore:{name}"
+        self._limit = limit
+        self._lease_ms = int(lease * 1000)
+        self._redis_pool = redis_pool
+        self._retry_interval = retry_interval
+        self._acquire = redis_pool.register_script(_SEMAPHORE_ACQUIRE)
+        self._renew = redis_pool.register_script(_SEMAPHORE_RENEW)
+
+    async def try_acquire(self) -> str | None:
+        """Lease a slot if one is free and return its token, else None."""
+        token = uuid.uuid4().hex
+        leased = await self._acquire(
+            keys=[self._key], args=[self._limit, self._lease_ms, token]
+        )
+        return token if leased else None
+
+    async def acquire(self, timeout: float | None = None) -> str:
+        """Wait for a slot and return its token.
+
+        Raises `asyncio.TimeoutError` if no slot frees up in `timeout` seconds.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while (token := await self.try_acquire()) is None:
+            delay = self._retry_interval * random.uniform(0.5, 1.5)
+            if deadline is not None:
+                if (remaining := deadline - loop.time()) <= 0:
+                    raise asyncio.TimeoutError
+                delay = min(delay, remaining)
+            await asyncio.sleep(delay)
+        return token
+
+    async def release(self, token: str) -> None:
+        await self._redis_pool.zrem(self._key, token)
+
+    async def renew(self, token: str) -> bool:
+        """Extend the lease of `token`. Returns False if it already expired."""
+        return bool(await self._renew(keys=[self._key], args=[self._lease_ms, token]))
 
-        elif host_ip := self._header.get("Host"):
-            await self._limiter(host_ip)
+    @contextlib.asynccontextmanager
+    async def hold(self, timeout: float | None = None) -> AsyncIterator[str]:
+        """Hold a slot for the duration of the `async with` block."""
+        token = await self.acquire(timeout)
+        try:
+            yield token
+        finally:
+            await self.release(token)
 
 
 async def func_to_be_rate_limited(call_count: int) -> None:
@@ -0,0 +1,130 @@
+"""Benchmarks for the rate limiting strategies in `async_redis_rate_limit.py`.
+
+===========
+Description
+===========
+
+For every `RateLimit` strategy, the script fills Redis with `n_keys` distinct
+limiter keys, `requests_per_key` admitted requests each, through pipelined
+script calls. It then reports:
+
+-> The Redis memory per key, the mean `MEMORY USAGE` of a sample of the keys.
+
+-> The latency percentiles of single `check` calls on random keys.
+
+The sliding window log stores every admitted request, so its memory grows with
+the traffic per key. The token bucket and the sliding window counter keep a
+small hash per key whatever the traffic.
+
+============
+Instructions
+============
+
+-> Spin up Redis as described in `async_redis_queue.py`. The script flushes
+   the database that it runs against, 15 by default.
+
+-> Run the script:
+
+```
+python -m patterns.async_redis_rate_limit_benchmark
+```
+
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from typing import NamedTuple
+
+import aioredis
+
+from patterns.async_redis_rate_limit import _STRATEGIES, RateLimit, _evalsha_many
+
+
+class StrategyStats(NamedTuple):
+    strategy: str
+    keys: int
+    bytes_per_key: float
+    p50_us: float
+    p99_us: float
+
+
+def _percentile(samples: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of the already sorted `samples`."""
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+async def benchmark_strategy(
+    redis: aioredis.Redis,
+    strategy: str,
+    n_keys: int = 1_000_000,
+    requests_per_key: int = 10,
+    samples: int = 10_000,
+    chunk_size: int = 10_000,
+) -> StrategyStats:
+    """Fill Redis with `n_keys` limiter keys and measure them."""
+    limiter = RateLimit(
+        {}, prefix=strategy, rps=100, redis_pool=redis, strategy=strategy
+    )
+    keys = [limiter._key(f"user:{i}") for i in range(n_keys)]
+    args = limiter._script_args(requests_per_key)
+
+    for start in range(0, n_keys, chunk_size):
+        chunk = keys[start : start + chunk_size]
+        await _evalsha_many(redis, limiter._take, [(key, args) for key in chunk])
+
+    sampled = random.sample(range(n_keys), min(samples, n_keys))
+    usage = [await redis.memory_usage(keys[i]) for i in sampled]
+
+    latencies = []
+    for i in sampled:
+        t0 = time.perf_counter()
+        await limiter.check(f"user:{i}")
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    latencies.sort()
+
+    return StrategyStats(
+        strategy=strategy,
+        keys=n_keys,
+        bytes_per_key=sum(usage) / len(usage),
+        p50_us=_percentile(latencies, 0.50),
+        p99_us=_percentile(latencies, 0.99),
+    )
+
+
+async def benchmark_strategies(
+    redis_url: str = "redis://localhost:6379/15",
+    n_keys: int = 1_000_000,
+    requests_per_key: int = 10,
+) -> list[StrategyStats]:
+    """Run `benchmark_strategy` for every strategy on a flushed database."""
+    redis = aioredis.from_url(redis_url)
+    stats = []
+    try:
+        for strategy in _STRATEGIES:
+            await redis.flushdb()
+            stats.append(
+                await benchmark_strategy(redis, strategy, n_keys, requests_per_key)
+            )
+        await redis.flushdb()
+    except (OSError, aioredis.exceptions.ConnectionError):
+        print(f"Redis isn't reachable at {redis_url}, skipping it.")
+    return stats
+
+
+def report(stats: list[StrategyStats]) -> None:
+    print(
+        f"{'strategy':<24}{'keys':>10}{'bytes/key':>12}"
+        f"{'p50 (us)':>12}{'p99 (us)':>12}"
+    )
+    for row in stats:
+        print(
+            f"{row.strategy:<24}{row.keys:>10}{row.bytes_per_key:>12.1f}"
+            f"{row.p50_us:>12.1f}{row.p99_us:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    report(asyncio.run(benchmark_strategies()))
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import abc
 import asyncio
+import contextlib
 import random
 import uuid
+from typing import Any, Awaitable, Callable, Dict, Iterable, Tuple, TypeVar
 
 import aioredis
 
@@ -11,15 +14,20 @@ STREAM_NAME = "dhaka"
 STREAM_MAP = {"dhaka": "$"}
 CONSUMER_GROUP_NAME = "demo_consumer"
 
+# An `(entry_id, fields)` pair as returned by `XREADGROUP`.
+Entry = Tuple[bytes, Dict[bytes, bytes]]
+
 
 # Create consumer group.
 async def create_consumer_group(
     stream_name: str = STREAM_NAME,
     consumer_group_name: str = CONSUMER_GROUP_NAME,
+    redis_pool: aioredis.Redis | None = None,
 ) -> None:
-    async with REDIS_POOL.client() as conn:
+    # Create the stream too, so that consumers can start before the producers.
+    async with (redis_pool or REDIS_POOL).client() as conn:
         try:
-            await conn.xgroup_create(stream_name, consumer_group_name)
+            await conn.xgroup_create(stream_name, consumer_group_name, mkstream=True)
         except Exception:
             pass
 
@@ -43,6 +51,175 @@ async def producer(
             await asyncio.sleep(0.2)
 
 
+class _Batcher(abc.ABC):
+    """Buffer items and send them in one round trip per batch.
+
+    The buffer is flushed once it holds `batch_size` items, or `linger` seconds
+    after its first item, whichever comes first. So a busy caller pays one round
+    trip per batch, and a quiet one waits at most `linger`.
+
+    A flush that fails in the background is raised by the next call or `close`.
+    """
+
+    def __init__(
+        self,
+        redis_pool: aioredis.Redis,
+        stream_name: str,
+        batch_size: int,
+        linger: float,
+    ) -> None:
+        if batch_size < 1:
+            raise ValueError("'batch_size' must be a positive integer")
+
+        self.redis_pool = redis_pool
+        self.stream_name = stream_name
+        self.batch_size = batch_size
+        self.linger = linger
+
+        self._buffer = []  # type: list
+        self._timer = None  # type: asyncio.Task | None
+        self._error = None  # type: Exception | None
+        # Keep the batches in order when flushes overlap.
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self: _B) -> _B:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    async def _extend(self, items: Iterable[Any]) -> None:
+        self._raise_error()
+        self._buffer.extend(items)
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+        elif self._timer is None and self._buffer:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.linger)
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception as exc:
+            self._error = exc
+
+    @abc.abstractmethod
+    async def _send(self, batch: list) -> list:
+        """Send `batch` in one round trip and return one reply per item."""
+
+    async def flush(self) -> list:
+        """Send the buffered items."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return []
+
+        async with self._lock:
+            return await self._send(batch)
+
+    async def close(self) -> None:
+        """Flush what's left in the buffer and wait for the running sends."""
+        await self.flush()
+        # The lock is fair, so this waits for a linger flush that's still sending.
+        async with self._lock:
+            pass
+        self._raise_error()
+
+
+_B = TypeVar("_B", bound=_Batcher)
+
+
+class BatchProducer(_Batcher):
+    """Buffer stream entries and add them with one pipelined round trip.
+
+    Entries are batched as described in `_Batcher`, and `flush` returns the IDs
+    of the entries that it added.
+
+    Every `XADD` trims the stream to about `maxlen` entries. The `~` lets Redis
+    trim whole macro nodes only, which is much cheaper than an exact trim but
+    may keep a few more entries.
+    """
+
+    def __init__(
+        self,
+        redis_pool: aioredis.Redis = REDIS_POOL,
+        stream_name: str = STREAM_NAME,
+        batch_size: int = 500,
+        linger: float = 0.005,
+        maxlen: int | None = 100_000,
+    ) -> None:
+        super().__init__(redis_pool, stream_name, batch_size, linger)
+        self.maxlen = maxlen
+
+    async def add(self, fields: dict) -> None:
+        """Buffer `fields` as a stream entry, flushing when the batch is full."""
+        await self._extend([fields])
+
+    async def _send(self, batch: list[dict]) -> list[bytes]:
+        async with self.redis_pool.pipeline(transaction=False) as pipe:
+            for fields in batch:
+                pipe.xadd(
+                    self.stream_name,
+                    fields,
+                    maxlen=self.maxlen,
+                    approximate=True,
+                )
+            return await pipe.execute()
+
+
+class AckBatcher(_Batcher):
+    """Buffer the IDs of processed entries and ack them with a single `XACK`.
+
+    IDs are batched as described in `_Batcher`. Acking late is safe: an entry
+    whose ack is lost in a crash stays pending and is processed again.
+    """
+
+    def __init__(
+        self,
+        redis_pool: aioredis.Redis = REDIS_POOL,
+        stream_name: str = STREAM_NAME,
+        consumer_group_name: str = CONSUMER_GROUP_NAME,
+        batch_size: int = 1000,
+        linger: float = 0.05,
+    ) -> None:
+        super().__init__(redis_pool, stream_name, batch_size, linger)
+        self.consumer_group_name = consumer_group_name
+
+    async def ack(self, *entry_ids: bytes) -> None:
+        """Buffer `entry_ids`, flushing when the batch is full."""
+        await self._extend(entry_ids)
+
+    async def _send(self, batch: list[bytes]) -> list[bytes]:
+        await self.redis_pool.xack(self.stream_name, self.consumer_group_name, *batch)
+        return batch
+
+
+async def batch_producer(
+    redis_pool: aioredis.Redis = REDIS_POOL,
+    stream_name: str = STREAM_NAME,
+    n_records: int = 10_000,
+) -> None:
+    async with BatchProducer(redis_pool, stream_name) as producer:
+        for _ in range(n_records):
+            await producer.add(
+                {
+                    "uuid": str(uuid.uuid4()),
+                    "temperature": random.randint(0, 100),
+                    "humidity": random.randint(0, 100),
+                }
+            )
+    print(f"producer added {n_records} records to {stream_name}")
+
+
 async def consumer(
     event: asyncio.Event,
     redis_pool: aioredis.Redis = REDIS_POOL,
@@ -64,6 +241,162 @@ async def consumer(
                 await asyncio.sleep(0.1)
 
 
+async def print_entries(stream_name: str, entries: list[Entry]) -> None:
+    print(f"consumer ingested {len(entries)} entries from {stream_name}")
+
+
+async def group_consumer(
+    redis_pool: aioredis.Redis = REDIS_POOL,
+    stream_name: str = STREAM_NAME,
+    consumer_group_name: str = CONSUMER_GROUP_NAME,
+    consumer_name: str | None = None,
+    handler: Callable[[str, list[Entry]], Awaitable[None]] = print_entries,
+    count: int = 500,
+    block_ms: int = 1000,
+    stop: asyncio.Event | None = None,
+    ack_batch_size: int = 1000,
+    ack_linger: float = 0.05,
+) -> None:
+    """Consume `stream_name` as `consumer_name` of `consumer_group_name`.
+
+    Every `XREADGROUP` returns up to `count` entries, and blocks for at most
+    `block_ms` milliseconds only when the stream is drained. So a busy stream
+    is read in batches without waiting, and an idle one without polling. Once
+    `handler` returns, the batch's IDs go to an `AckBatcher`, which acks up to
+    `ack_batch_size` IDs with one `XACK` at least every `ack_linger` seconds.
+
+    The consumer first replays its own pending entries, i.e. the ones that it
+    read but didn't ack before a crash, then switches to new entries. If
+    `handler` raises, the batch stays pending and the error propagates.
+
+    The loop runs until `stop` is set; `block_ms` bounds how long that takes.
+    """
+    consumer_name = consumer_name or f"consumer-{uuid.uuid4().hex[:8]}"
+    last_id = "0"  # Own pending entries first, then ">" for new ones.
+
+    acker = AckBatcher(
+        redis_pool, stream_name, consumer_group_name, ack_batch_size, ack_linger
+    )
+    async with acker, redis_pool.client() as conn:
+        while stop is None or not stop.is_set():
+            result = await conn.xreadgroup(
+                consumer_group_name,
+                consumer_name,
+                {stream_name: last_id},
+                count=count,
+                block=None if last_id == "0" else block_ms,
+            )
+            entries = result[0][1] if result else []
+            if not entries:
+                last_id = ">"
+                continue
+
+            await handler(stream_name, entries)
+            await acker.ack(*(entry_id for entry_id, _ in entries))
+            if last_id != ">":
+                last_id = entries[-1][0]
+
+
+def _parse_autoclaim(reply: list) -> tuple[bytes, list[Entry], list[bytes]]:
+    """Split an `XAUTOCLAIM` reply into the next cursor, entries and lost IDs.
+
+    The fields come as a flat list from the server, or as a dict when the client
+    parses the reply. Entries that were trimmed away while pending come back
+    with nil fields, and are returned as lost so they can be acked. Redis 7
+    drops them from the pending entries list itself and lists them in a third
+    element instead, which needs no handling.
+    """
+    entries = []  # type: list[Entry]
+    lost = []  # type: list[bytes]
+    for entry in reply[1]:
+        if entry is None or entry[0] is None:
+            continue
+        entry_id, fields = entry
+        if fields is None:
+            lost.append(entry_id)
+        elif isinstance(fields, dict):
+            entries.append((entry_id, fields))
+        else:
+            entries.append((entry_id, dict(zip(fields[::2], fields[1::2]))))
+    return reply[0], entries, lost
+
+
+async def reclaim_pending(
+    redis_pool: aioredis.Redis = REDIS_POOL,
+    stream_name: str = STREAM_NAME,
+    consumer_group_name: str = CONSUMER_GROUP_NAME,
+    consumer_name: str = "reclaimer",
+    handler: Callable[[str, list[Entry]], Awaitable[None]] = print_entries,
+    min_idle_ms: int = 60_000,
+    count: int = 100,
+) -> int:
+    """Claim and process the entries that have been pending for `min_idle_ms`.
+
+    One sweep walks the whole pending entries list with `XAUTOCLAIM`, `count`
+    entries per page. The claimed entries move to `consumer_name`, then go
+    through `handler` and get acked in batches. Pick a `min_idle_ms` well above
+    the time `handler` takes, or entries of live consumers get processed twice.
+
+    Returns the number of entries processed.
+    """
+    processed = 0
+    cursor = b"0-0"
+    async with AckBatcher(redis_pool, stream_name, consumer_group_name) as acker:
+        while True:
+            # aioredis has no `xautoclaim`, which is new in Redis 6.2.
+            reply = await redis_pool.execute_command(
+                "XAUTOCLAIM",
+                stream_name,
+                consumer_group_name,
+                consumer_name,
+                min_idle_ms,
+                cursor,
+                "COUNT",
+                count,
+            )
+            cursor, entries, lost = _parse_autoclaim(reply)
+            if lost:
+                await acker.ack(*lost)
+            if entries:
+                await handler(stream_name, entries)
+                await acker.ack(*(entry_id for entry_id, _ in entries))
+                processed += len(entries)
+            if cursor in (b"0-0", "0-0"):
+                return processed
+
+
+async def reclaimer(
+    redis_pool: aioredis.Redis = REDIS_POOL,
+    stream_name: str = STREAM_NAME,
+    consumer_group_name: str = CONSUMER_GROUP_NAME,
+    consumer_name: str = "reclaimer",
+    handler: Callable[[str, list[Entry]], Awaitable[None]] = print_entries,
+    min_idle_ms: int = 60_000,
+    count: int = 100,
+    interval: float = 5,
+    stop: asyncio.Event | None = None,
+) -> None:
+    """Run `reclaim_pending` every `interval` seconds until `stop` is set.
+
+    So the entries of a crashed consumer are processed at most about
+    `min_idle_ms` plus `interval` later, and the pending entries list doesn't
+    grow with every crash.
+    """
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        await reclaim_pending(
+            redis_pool,
+            stream_name,
+            consumer_group_name,
+            consumer_name,
+            handler,
+            min_idle_ms,
+            count,
+        )
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(stop.wait(), interval)
+
+
 async def orchestrator() -> None:
     # Create consumer groups.
     await create_consumer_group()
@@ -73,16 +406,13 @@ async def orchestrator() -> None:
     )
 
     # Create producer-consumer tasks.
-    event = asyncio.Event()
     task_coros = (
-        producer(event=event),
-        producer(event=event, stream_name="chittagong"),
-        consumer(event=event),
-        consumer(
-            event=event,
-            stream_name="chittagong",
-            stream_map={"chittagong": "$"},
-        ),
+        batch_producer(),
+        batch_producer(stream_name="chittagong"),
+        group_consumer(),
+        group_consumer(stream_name="chittagong", consumer_group_name="another"),
+        reclaimer(),
+        reclaimer(stream_name="chittagong", consumer_group_name="another"),
     )
 
     task_coros = [asyncio.create_task(task_coro) for task_coro in task_coros]
@@ -58,8 +58,8 @@ class Timeout:
             raise asyncio.TimeoutError
 
         # timeout didn't work and didn't raise TimeoutError.
-        self._state = _State.EXIT
         self.calloff()
+        self._state = _State.EXIT
 
     def calloff(self) -> None:
         if self._state not in (_State.INIT, _State.ENTER):
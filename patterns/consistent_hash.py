@@ -0,0 +1,62 @@
+"""Consistent hashing ring to spread keys over several Redis instances.
+
+===========
+Description
+===========
+
+Hashing a key modulo the number of instances moves almost every key when an
+instance is added or removed. A consistent hashing ring only moves about 1/N of
+them.
+
+This script roughly implements the following steps:
+
+-> Every node is placed on a ring of 64-bit integers at `replicas` points, the
+   hashes of `<name>#<i>`. The virtual nodes even out the share of each node.
+
+-> A key is hashed onto the same ring and belongs to the first node clockwise
+   from it. The lookup is a binary search over the sorted points.
+
+-> Nodes are given by name, e.g. a Redis URL, so that every process that knows
+   the same names builds the same ring.
+
+"""
+
+from __future__ import annotations
+
+import bisect
+import hashlib
+from collections.abc import Mapping
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+def _hash(key: str) -> int:
+    # The first 8 bytes of MD5 are evenly spread and cheap enough for routing.
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing(Generic[T]):
+    """Map keys to the nodes of `nodes`, a `{name: node}` mapping."""
+
+    def __init__(self, nodes: Mapping[str, T], replicas: int = 160) -> None:
+        if not nodes:
+            raise ValueError("'nodes' must not be empty")
+        if replicas < 1:
+            raise ValueError("'replicas' must be a positive integer")
+
+        self.nodes = dict(nodes)
+        points = sorted(
+            (_hash(f"{name}#{i}"), name) for name in nodes for i in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    def name_of(self, key: str) -> str:
+        """Return the name of the node that owns `key`."""
+        i = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._names[i]
+
+    def get(self, key: str) -> T:
+        """Return the node that owns `key`."""
+        return self.nodes[self.name_of(key)]
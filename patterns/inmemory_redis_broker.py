@@ -0,0 +1,210 @@
+"""In-process stand-in for the Redis broker used by `async_redis_queue.py`.
+
+===========
+Description
+===========
+
+`InMemoryBroker` implements the subset of `aioredis.Redis` that the plain FIFO
+path of `RedisQueue` relies on: list pushes and pops, blocking pops, string keys
+with expiry, multi-key gets, and non-transactional pipelines. Everything lives in
+the event loop's process, so there's no network or server overhead.
+
+This makes it useful as a baseline. Benchmarking the same queue workload against
+this broker and against a real Redis server separates the client's overhead from
+the server's.
+
+Lua scripts aren't interpreted. `register_script` only knows the Python
+equivalents of the scripts that `RedisQueue` needs for non-reliable batch pops;
+calling any other script raises `NotImplementedError`.
+
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import Callable, Iterable
+from typing import Any, Union
+
+from patterns import async_redis_queue as arq
+
+KeyT = Union[str, bytes]
+
+
+def _key(name: KeyT) -> str:
+    return name.decode() if isinstance(name, bytes) else name
+
+
+def _encode(value: Any) -> bytes:
+    # Mimic how Redis clients encode values on the wire.
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode()
+    if isinstance(value, (int, float)):
+        return repr(value).encode()
+    raise TypeError(f"invalid input of type {type(value).__name__!r}")
+
+
+class InMemoryBroker:
+    """Async, single-process broker with an `aioredis.Redis`-like interface."""
+
+    def __init__(self) -> None:
+        self._data = {}  # type: dict[str, Any]
+        self._expires_at = {}  # type: dict[str, float]
+        self._condition = None  # type: asyncio.Condition | None
+
+    @property
+    def _pushed(self) -> asyncio.Condition:
+        # Created lazily so that it's bound to the loop that uses the broker.
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def _get(self, name: KeyT) -> Any:
+        key = _key(name)
+        if (expires_at := self._expires_at.get(key)) and expires_at <= time.time():
+            self._data.pop(key, None)
+            self._expires_at.pop(key, None)
+        return self._data.get(key)
+
+    def _list(self, name: KeyT) -> deque[bytes]:
+        if (values := self._get(name)) is None:
+            values = self._data[_key(name)] = deque()
+        return values
+
+    def _pop(self, name: KeyT, count: int) -> list[bytes]:
+        values = self._get(name)
+        popped = [values.popleft() for _ in range(min(count, len(values or ())))]
+        if values is not None and not values:
+            self._delete(name)
+        return popped
+
+    def _delete(self, name: KeyT) -> int:
+        self._expires_at.pop(_key(name), None)
+        return int(self._data.pop(_key(name), None) is not None)
+
+    async def rpush(self, name: KeyT, *values: Any) -> int:
+        items = self._list(name)
+        items.extend(_encode(value) for value in values)
+        async with self._pushed:
+            self._pushed.notify_all()
+        return len(items)
+
+    async def lpop(self, name: KeyT, count: int | None = None) -> Any:
+        popped = self._pop(name, count or 1)
+        if count is None:
+            return popped[0] if popped else None
+        return popped or None
+
+    async def blpop(
+        self, keys: KeyT | Iterable[KeyT], timeout: float = 0
+    ) -> tuple[bytes, bytes] | None:
+        keys = [keys] if isinstance(keys, (str, bytes)) else list(keys)
+        deadline = time.monotonic() + timeout if timeout else None
+
+        async with self._pushed:
+            while True:
+                for key in keys:
+                    if popped := self._pop(key, 1):
+                        return _key(key).encode(), popped[0]
+
+                remaining = deadline - time.monotonic() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                try:
+                    await asyncio.wait_for(self._pushed.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    return None
+
+    async def llen(self, name: KeyT) -> int:
+        return len(self._get(name) or ())
+
+    async def set(self, name: KeyT, value: Any, ex: int | None = None) -> bool:
+        self._delete(name)
+        self._data[_key(name)] = _encode(value)
+        if ex:
+            self._expires_at[_key(name)] = time.time() + ex
+        return True
+
+    async def get(self, name: KeyT) -> bytes | None:
+        return self._get(name)
+
+    async def mget(self, keys: KeyT | Iterable[KeyT], *args: KeyT) -> list:
+        keys = [keys] if isinstance(keys, (str, bytes)) else list(keys)
+        return [self._get(name) for name in [*keys, *args]]
+
+    async def exists(self, *names: KeyT) -> int:
+        return sum(self._get(name) is not None for name in names)
+
+    async def expire(self, name: KeyT, time_: int) -> bool:
+        if self._get(name) is None:
+            return False
+        self._expires_at[_key(name)] = time.time() + time_
+        return True
+
+    async def delete(self, *names: KeyT) -> int:
+        return sum(self._delete(name) for name in names)
+
+    def pipeline(self, transaction: bool = True) -> _Pipeline:
+        return _Pipeline(self)
+
+    def register_script(self, script: str) -> _Script:
+        return _Script(self, _SCRIPTS.get(script))
+
+
+class _Pipeline:
+    """Buffer commands and run them back to back on `execute`."""
+
+    def __init__(self, broker: InMemoryBroker) -> None:
+        self._broker = broker
+        self._commands = []  # type: list[tuple[str, tuple, dict]]
+
+    async def __aenter__(self) -> _Pipeline:
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self._commands.clear()
+
+    def __getattr__(self, name: str) -> Callable[..., _Pipeline]:
+        if not hasattr(self._broker, name) or name.startswith("_"):
+            raise AttributeError(name)
+
+        def buffer(*args: Any, **kwargs: Any) -> _Pipeline:
+            self._commands.append((name, args, kwargs))
+            return self
+
+        return buffer
+
+    async def execute(self) -> list[Any]:
+        commands, self._commands = self._commands, []
+        return [
+            await getattr(self._broker, name)(*args, **kwargs)
+            for name, args, kwargs in commands
+        ]
+
+
+class _Script:
+    def __init__(
+        self, broker: InMemoryBroker, func: Callable[..., list[bytes]] | None
+    ) -> None:
+        self._broker = broker
+        self._func = func
+
+    async def __call__(
+        self, keys: list[KeyT] | None = None, args: list[Any] | None = None
+    ) -> Any:
+        if self._func is None:
+            raise NotImplementedError("InMemoryBroker can't run this Lua script")
+        return self._func(self._broker, keys or [], args or [])
+
+
+def _pop_batch(broker: InMemoryBroker, keys: list[KeyT], args: list[Any]) -> list:
+    payloads = []  # type: list[bytes]
+    for key in keys:
+        payloads.extend(broker._pop(key, int(args[0]) - len(payloads)))
+    return payloads
+
+
+_SCRIPTS = {arq._POP_BATCH: _pop_batch}
@@ -0,0 +1,62 @@
+"""Pipeline Lua scripts in a single round trip.
+
+===========
+Description
+===========
+
+A pipeline checks that the `Script` objects queued on it are loaded with an extra
+`SCRIPT EXISTS` round trip before it sends them. Queueing plain `EVALSHA`s skips
+that check, so a script is only loaded when Redis doesn't know it.
+
+This script roughly implements the following steps:
+
+-> The caller queues its commands on a non-transactional pipeline, calling the
+   script with `pipe.evalsha(script.sha, ...)`.
+
+-> If Redis replies NOSCRIPT, e.g. after a restart or a `SCRIPT FLUSH`, none of
+   the `EVALSHA`s ran. The script is loaded and the commands are sent again, so
+   the other commands must be safe to repeat.
+
+"""
+
+from __future__ import annotations
+
+from typing import Callable
+
+import aioredis
+
+try:
+    import redis.exceptions as redis_exceptions
+except ImportError:  # pragma: no cover
+    redis_exceptions = None
+
+# `redis.asyncio` clients, fakeredis's included, raise their own exceptions
+# rather than aioredis's, so catch those of both libraries.
+_NO_SCRIPT_ERRORS = (
+    aioredis.exceptions.NoScriptError,
+)  # type: tuple[type[Exception], ...]
+if redis_exceptions is not None:
+    _NO_SCRIPT_ERRORS += (redis_exceptions.NoScriptError,)
+
+
+async def evalsha_pipeline(
+    redis_pool: aioredis.Redis,
+    script: aioredis.client.Script,
+    queue: Callable[[aioredis.client.Pipeline], object],
+) -> list:
+    """Send the commands that `queue` puts on a pipeline, loading `script` if needed.
+
+    `queue` is called with the pipeline, and again if `script` had to be loaded.
+    Returns the replies of the commands.
+    """
+
+    async def send() -> list:
+        async with redis_pool.pipeline(transaction=False) as pipe:
+            queue(pipe)
+            return await pipe.execute()
+
+    try:
+        return await send()
+    except _NO_SCRIPT_ERRORS:
+        script.sha = await redis_pool.script_load(script.script)
+        return await send()
@@ -1,7 +1,10 @@
+import asyncio
 import importlib
 import logging
 import pickle
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import AsyncMock, patch
 
 import pytest
@@ -126,6 +129,39 @@ class TestRedisQueue:
         assert "Kwargs: {'start': 1, 'end': 2}" in caplog.text
         assert "Task processing complete" in caplog.text
 
+    async def test_enqueue_many(self):
+        length_before = await self.redis_queue.get_length()
+
+        # Call 'enqueue_many' with a chunk size that doesn't divide the batch.
+        calls = [(main.foo, (i, i + 10), {}) for i in range(5)]
+        task_ids = await self.redis_queue.enqueue_many(calls, chunk_size=2)
+
+        # Assert.
+        assert len(task_ids) == 5
+        assert all(is_valid_uuid(task_id) for task_id in task_ids)
+        assert await self.redis_queue.get_length() == length_before + 5
+
+    async def test_enqueue_many_invalid_chunk_size(self):
+        with pytest.raises(ValueError, match="chunk_size"):
+            await self.redis_queue.enqueue_many([], chunk_size=0)
+
+    async def test_dequeue_batch(self):
+        await self.redis_queue.broker.delete(self.redis_queue.queue_name)
+        await self.redis_queue.enqueue_many((main.foo, (i, 10), {}) for i in range(3))
+
+        # Call 'dequeue_batch' until the queue is drained.
+        first = await self.redis_queue.dequeue_batch(max_items=2, max_wait=0)
+        second = await self.redis_queue.dequeue_batch(max_items=2, max_wait=0)
+        third = await self.redis_queue.dequeue_batch(max_items=2, max_wait=0.01)
+
+        # Assert.
+        assert [task.args for task in first + second] == [(0, 10), (1, 10), (2, 10)]
+        assert third == []
+
+    async def test_dequeue_batch_invalid_max_items(self):
+        with pytest.raises(ValueError, match="max_items"):
+            await self.redis_queue.dequeue_batch(max_items=0)
+
     async def test_get_length(self):
         # Call 'enqueue'.
         await self.redis_queue.enqueue(func=main.foo, start=1, end=2)
@@ -189,3 +225,1003 @@ async def test_orchestrator(
     assert mock_asyncio_sleep.call_count == 10
     assert mock_random_randint.call_count == 10
     assert mock_aioredis_from_url.call_count == 2
+
+
+async def test_worker_pool():
+    queue = main.RedisQueue(
+        broker=FakeRedis.from_url("redis://localhost:6379/0"),
+        result_backend=FakeRedis.from_url("redis://localhost:6379/1"),
+        queue_name="test_worker_pool",
+    )
+    task_ids = await queue.enqueue_many((main.foo, (1, 2), {}) for _ in range(5))
+
+    # Run 'worker_pool' until the queue is drained.
+    stop = asyncio.Event()
+    processed = []
+    pool = asyncio.create_task(
+        main.worker_pool(
+            queue,
+            concurrency=2,
+            stop=stop,
+            poll_timeout=0.1,
+            on_processed=processed.append,
+        )
+    )
+    while await queue.get_length():
+        await asyncio.sleep(0.01)
+    stop.set()
+    await pool
+
+    # Assert.
+    assert sum(processed) == 5
+    for task_id in task_ids:
+        assert await queue.result_backend.exists(f"result:{task_id}")
+
+
+async def test_worker_pool_bounds_in_flight_tasks():
+    running = 0
+    peak = 0
+
+    async def slow_task():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    tasks = [main.SimpleTask(slow_task) for _ in range(10)]
+    stop = asyncio.Event()
+
+    async def dequeue_batch(max_items, max_wait):
+        assert max_items <= 2
+        if not tasks:
+            stop.set()
+        return [tasks.pop() for _ in range(min(max_items, len(tasks)))]
+
+    async def run(task):
+        return await task.process_task()
+
+    mock_queue = AsyncMock(spec=main.RedisQueue)
+    mock_queue.dequeue_batch.side_effect = dequeue_batch
+    mock_queue.run.side_effect = run
+
+    # Call 'worker_pool'.
+    await main.worker_pool(mock_queue, concurrency=3, stop=stop, batch_size=2)
+
+    # Assert.
+    assert peak == 3
+    assert mock_queue.run.await_count == 10
+    stored = [
+        pair
+        for call in mock_queue.store_results.await_args_list
+        for pair in call.args[0]
+    ]
+    assert len(stored) == 10
+    assert mock_queue.store_results.await_count < 10
+
+
+def make_flaky_queue(tasks, stop, fetch_errors=0, store_errors=0):
+    """Mock queue that serves `tasks`, then sets `stop`, failing a few calls."""
+    errors = {"fetch": fetch_errors, "store": store_errors}
+
+    async def dequeue_batch(max_items, max_wait):
+        if errors["fetch"]:
+            errors["fetch"] -= 1
+            raise ConnectionError("fetch failed")
+        if not tasks:
+            stop.set()
+        return [tasks.pop() for _ in range(min(max_items, len(tasks)))]
+
+    async def run(task):
+        return await task.process_task()
+
+    async def store_results(completed):
+        if errors["store"]:
+            errors["store"] -= 1
+            raise ConnectionError("store failed")
+
+    mock_queue = AsyncMock(spec=main.RedisQueue)
+    mock_queue.dequeue_batch.side_effect = dequeue_batch
+    mock_queue.run.side_effect = run
+    mock_queue.store_results.side_effect = store_results
+    return mock_queue
+
+
+def stored_results(mock_queue):
+    return [
+        result
+        for call in mock_queue.store_results.await_args_list
+        for _, result in call.args[0]
+    ]
+
+
+async def test_worker_pool_retries_failed_fetches_and_stores(caplog):
+    tasks = [main.SimpleTask(max, i, 0) for i in range(4)]
+    stop = asyncio.Event()
+    mock_queue = make_flaky_queue(tasks, stop, fetch_errors=2, store_errors=1)
+
+    # Call 'worker_pool'.
+    await asyncio.wait_for(
+        main.worker_pool(mock_queue, concurrency=2, stop=stop), timeout=5
+    )
+
+    # Assert.
+    assert "Fetching tasks failed, retrying in 0.1s." in caplog.text
+    assert "Fetching tasks failed, retrying in 0.2s." in caplog.text
+    assert "Storing results failed, retrying in 0.1s." in caplog.text
+    assert mock_queue.run.await_count == 4
+    assert sorted(stored_results(mock_queue)[-4:]) == [0, 1, 2, 3]
+    mock_queue.flush_acks.assert_awaited_once()
+
+
+async def test_worker_pool_finishes_in_flight_tasks_on_error():
+    started = asyncio.Event()
+
+    async def slow_task():
+        started.set()
+        await asyncio.sleep(0.05)
+        return "done"
+
+    stop = asyncio.Event()
+    mock_queue = make_flaky_queue(
+        [main.SimpleTask(slow_task), main.SimpleTask(max, 1, 2)], stop
+    )
+
+    def on_processed(count):
+        raise RuntimeError("callback failed")
+
+    # Call 'worker_pool' with a callback that fails the pool.
+    with pytest.raises(RuntimeError, match="callback failed"):
+        await main.worker_pool(
+            mock_queue, concurrency=2, stop=stop, on_processed=on_processed
+        )
+
+    # Assert the slow task still finished and was stored and acknowledged.
+    assert started.is_set()
+    assert "done" in stored_results(mock_queue)
+    mock_queue.flush_acks.assert_awaited_once()
+
+
+async def test_worker_pool_invalid_arguments():
+    with pytest.raises(ValueError, match="concurrency"):
+        await main.worker_pool(AsyncMock(), concurrency=0)
+    with pytest.raises(ValueError, match="batch_size"):
+        await main.worker_pool(AsyncMock(), batch_size=0)
+
+
+class TestReliableRedisQueue:
+    def setup_method(self):
+        self.redis_queue = main.RedisQueue(
+            broker=FakeRedis.from_url("redis://localhost:6379/0"),
+            result_backend=FakeRedis.from_url("redis://localhost:6379/1"),
+            queue_name=f"test_reliable_{uuid.uuid4()}",
+            reliable=True,
+            worker_id="test_worker",
+        )
+
+    async def test_fetch_leases_task(self):
+        await self.redis_queue.enqueue(main.foo, start=1, end=2)
+
+        # Call 'fetch'.
+        task = await self.redis_queue.fetch(timeout=1)
+
+        # Assert.
+        broker = self.redis_queue.broker
+        assert task.kwargs == {"start": 1, "end": 2}
+        assert await broker.llen(self.redis_queue.processing_key) == 1
+        assert await broker.zcard(self.redis_queue.leases_key) == 1
+
+    async def test_dequeue_batch_leases_tasks(self):
+        for i in range(3):
+            await self.redis_queue.enqueue(main.foo, start=i, end=10)
+
+        # Call 'dequeue_batch'.
+        tasks = await self.redis_queue.dequeue_batch(max_items=2, max_wait=0)
+
+        # Assert.
+        broker = self.redis_queue.broker
+        assert [task.kwargs["start"] for task in tasks] == [0, 1]
+        assert await broker.zcard(self.redis_queue.leases_key) == 2
+        assert await self.redis_queue.get_length() == 1
+
+    async def test_fetch_times_out_when_empty(self):
+        # Call 'fetch' on an empty queue.
+        task = await self.redis_queue.fetch(timeout=0.01)
+
+        # Assert.
+        assert task is None
+        assert await self.redis_queue.broker.zcard(self.redis_queue.leases_key) == 0
+
+    async def test_execute_acks_on_next_fetch(self):
+        await self.redis_queue.enqueue(main.foo, start=1, end=2)
+        await self.redis_queue.enqueue(main.foo, start=3, end=4)
+
+        # Execute one task and fetch the next one.
+        await self.redis_queue.execute(await self.redis_queue.fetch(timeout=1))
+        await self.redis_queue.fetch(timeout=1)
+
+        # Assert only the unfinished task is still leased.
+        broker = self.redis_queue.broker
+        assert await broker.llen(self.redis_queue.processing_key) == 1
+        assert await broker.zcard(self.redis_queue.leases_key) == 1
+
+    async def test_flush_acks(self):
+        await self.redis_queue.enqueue(main.foo, start=1, end=2)
+        await self.redis_queue.execute(await self.redis_queue.fetch(timeout=1))
+
+        # Call 'flush_acks'.
+        await self.redis_queue.flush_acks()
+
+        # Assert.
+        broker = self.redis_queue.broker
+        assert await broker.llen(self.redis_queue.processing_key) == 0
+        assert await broker.zcard(self.redis_queue.leases_key) == 0
+
+    async def test_reap_requeues_expired_leases(self):
+        self.redis_queue.visibility_timeout = -1
+        for i in range(3):
+            await self.redis_queue.enqueue(main.foo, start=i, end=10)
+        for _ in range(3):
+            await self.redis_queue.fetch(timeout=1)
+
+        # Call 'reap' with a batch smaller than the number of expired leases.
+        assert await self.redis_queue.reap(batch_size=2) == 2
+        assert await self.redis_queue.reap(batch_size=2) == 1
+
+        # Assert.
+        broker = self.redis_queue.broker
+        assert await self.redis_queue.get_length() == 3
+        assert await broker.llen(self.redis_queue.processing_key) == 0
+        assert await broker.zcard(self.redis_queue.leases_key) == 0
+
+    async def test_reap_keeps_live_leases(self):
+        await self.redis_queue.enqueue(main.foo, start=1, end=2)
+        await self.redis_queue.fetch(timeout=1)
+
+        # Assert.
+        assert await self.redis_queue.reap() == 0
+        assert await self.redis_queue.get_length() == 0
+
+    async def crash_after_blocking_move(self):
+        """Fetch from an empty queue and die before the moved task is leased."""
+        queue = self.redis_queue
+        pop, task_ids = queue._reliable_pop, []
+
+        async def crashing_pop(*args, **kwargs):
+            if task_ids:
+                raise ConnectionError("worker died")
+            popped = await pop(*args, **kwargs)
+            # The task lands right after the pop, so 'BLMOVE' gets it.
+            task_ids.append(await queue.enqueue(main.foo, start=1, end=2))
+            return popped
+
+        queue._reliable_pop = crashing_pop
+        with pytest.raises(ConnectionError):
+            await queue.fetch(timeout=1)
+
+        # Assert the task was moved but not leased.
+        broker = queue.broker
+        assert await broker.llen(queue.processing_key) == 1
+        assert await broker.zcard(queue.leases_key) == 0
+        return task_ids[0]
+
+    async def test_restarted_worker_leases_orphaned_task(self):
+        task_id = await self.crash_after_blocking_move()
+
+        # Call 'fetch' from a worker with the same id.
+        restarted = main.RedisQueue(
+            self.redis_queue.broker,
+            self.redis_queue.result_backend,
+            self.redis_queue.queue_name,
+            reliable=True,
+            worker_id="test_worker",
+        )
+        task = await restarted.fetch(timeout=1)
+
+        # Assert.
+        assert task.id == task_id
+        assert await restarted.broker.zcard(restarted.leases_key) == 1
+
+    async def test_reap_requeues_task_of_dead_worker(self):
+        self.redis_queue.visibility_timeout = -1
+        task_id = await self.crash_after_blocking_move()
+        other = main.RedisQueue(
+            self.redis_queue.broker,
+            self.redis_queue.result_backend,
+            self.redis_queue.queue_name,
+            reliable=True,
+            worker_id="other_worker",
+        )
+
+        # Call 'reap' once the dead worker's heartbeat ran out.
+        assert await other.reap() == 1
+
+        # Assert.
+        task = await other.fetch(timeout=1)
+        assert task.id == task_id
+        broker = other.broker
+        assert await broker.llen(self.redis_queue.processing_key) == 0
+        assert (
+            await broker.zscore(other.heartbeats_key, self.redis_queue.processing_key)
+            is None
+        )
+        assert await other.reap() == 0
+
+    async def test_reap_keeps_live_worker_heartbeat(self):
+        await self.redis_queue.enqueue(main.foo, start=1, end=2)
+        await self.redis_queue.fetch(timeout=1)
+
+        # Call 'reap'.
+        await self.redis_queue.reap()
+
+        # Assert.
+        broker = self.redis_queue.broker
+        assert await broker.llen(self.redis_queue.processing_key) == 1
+        assert await broker.zscore(
+            self.redis_queue.heartbeats_key, self.redis_queue.processing_key
+        )
+
+
+async def test_reaper():
+    mock_queue = AsyncMock(spec=main.RedisQueue)
+    stop = asyncio.Event()
+
+    async def reap(batch_size):
+        if mock_queue.reap.await_count == 3:
+            stop.set()
+        return batch_size if mock_queue.reap.await_count == 1 else 0
+
+    mock_queue.reap.side_effect = reap
+
+    # Call 'reaper'.
+    await main.reaper(mock_queue, interval=0.01, batch_size=5, stop=stop)
+
+    # Assert.
+    assert mock_queue.reap.await_count == 3
+    mock_queue.reap.assert_awaited_with(5)
+
+
+def test_task_registry():
+    registry = main.TaskRegistry()
+
+    @registry.task(name="double")
+    async def double(num):
+        return num * 2
+
+    # Assert.
+    assert registry.get("double") is double
+    assert registry.name_of(double) == "double"
+    assert main.registry.name_of(main.foo) == "foo"
+    with pytest.raises(LookupError):
+        registry.get("foo")
+    with pytest.raises(LookupError):
+        registry.name_of(main.foo)
+    with pytest.raises(ValueError, match="already registered"):
+        registry.task(name="double")(main.foo)
+
+
+@pytest.mark.parametrize(
+    "serializer",
+    [main.PickleSerializer(), main.JSONSerializer(), main.MsgpackSerializer()],
+)
+def test_task_envelope_roundtrip(serializer):
+    task = main.SimpleTask(main.foo, 1, end=2)
+
+    # Serialize the envelope and rebuild the task from it.
+    payload = serializer.dumps(task.to_envelope(main.registry))
+    rebuilt = main.SimpleTask.from_envelope(serializer.loads(payload), main.registry)
+
+    # Assert.
+    assert rebuilt.id == task.id
+    assert rebuilt.func is main.foo
+    assert tuple(rebuilt.args) == (1,)
+    assert rebuilt.kwargs == {"end": 2}
+    assert rebuilt.timeout is None
+    assert rebuilt.group_id is None
+
+
+async def test_redis_queue_with_serializer():
+    queue = main.RedisQueue(
+        broker=FakeRedis.from_url("redis://localhost:6379/0"),
+        result_backend=FakeRedis.from_url("redis://localhost:6379/1"),
+        queue_name=f"test_serializer_{uuid.uuid4()}",
+        serializer=main.JSONSerializer(),
+    )
+
+    # Enqueue a registered task and an unregistered one.
+    task_id = await queue.enqueue(main.foo, start=1, end=2)
+    with pytest.raises(LookupError):
+        await queue.enqueue(AsyncMock(), start=1, end=2)
+
+    # Assert the wire payload is a JSON envelope and the task can be fetched.
+    payload = await queue.broker.lindex(queue.queue_name, 0)
+    assert main.json.loads(payload)["name"] == "foo"
+    task = await queue.fetch(timeout=1)
+    assert task.id == task_id
+    assert task.func is main.foo
+
+
+class TestRedisQueueResults:
+    def setup_method(self):
+        self.redis_queue = main.RedisQueue(
+            broker=FakeRedis.from_url("redis://localhost:6379/0"),
+            result_backend=FakeRedis.from_url("redis://localhost:6379/1"),
+            queue_name="test_results",
+            result_ttl=60,
+        )
+
+    async def test_store_results(self):
+        tasks = [main.SimpleTask(main.foo, 1, 2) for _ in range(3)]
+
+        # Call 'store_results' with a batch.
+        await self.redis_queue.store_results([(task, 42) for task in tasks])
+
+        # Assert.
+        result_backend = self.redis_queue.result_backend
+        for task in tasks:
+            assert 0 < await result_backend.ttl(f"result:{task.id}") <= 60
+            assert 0 < await result_backend.ttl(f"result:{task.id}:ready") <= 60
+            assert await self.redis_queue.get_result(task.id) == 42
+
+    async def test_get_result_waits_for_notification(self):
+        task = main.SimpleTask(main.foo, 1, 2)
+
+        # Wait for the result before it's stored.
+        waiters = [
+            asyncio.create_task(self.redis_queue.get_result(task.id, timeout=1))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0.05)
+        await self.redis_queue.execute(task)
+
+        # Assert every waiter was woken up.
+        results = await asyncio.gather(*waiters)
+        assert results[0] == results[1]
+        assert 1 <= results[0] <= 2
+
+    async def test_get_result_timeout(self):
+        with pytest.raises(asyncio.TimeoutError):
+            await self.redis_queue.get_result(str(uuid.uuid4()), timeout=0.01)
+
+
+class TestPriorityAndDelayedTasks:
+    def setup_method(self):
+        self.redis_queue = main.RedisQueue(
+            broker=FakeRedis.from_url("redis://localhost:6379/0"),
+            result_backend=FakeRedis.from_url("redis://localhost:6379/1"),
+            queue_name=f"test_priority_{uuid.uuid4()}",
+        )
+
+    async def test_fetch_in_priority_order(self):
+        for start, priority in enumerate(("low", "normal", "high")):
+            await self.redis_queue.submit(main.foo, (start, 10), priority=priority)
+
+        # Call 'fetch' for every task.
+        tasks = [await self.redis_queue.fetch(timeout=1) for _ in range(3)]
+
+        # Assert.
+        assert [task.args for task in tasks] == [(2, 10), (1, 10), (0, 10)]
+        assert await self.redis_queue.get_length() == 0
+
+    async def test_dequeue_batch_in_priority_order(self):
+        await self.redis_queue.enqueue_many(
+            [(main.foo, (0, 1), {})], priority=main.Priority.LOW
+        )
+        await self.redis_queue.enqueue_many([(main.foo, (1, 2), {})] * 2)
+        await self.redis_queue.enqueue_many(
+            [(main.foo, (2, 3), {})], priority=main.Priority.HIGH
+        )
+
+        # Call 'dequeue_batch'.
+        tasks = await self.redis_queue.dequeue_batch(max_items=3, max_wait=0)
+
+        # Assert.
+        assert [task.args for task in tasks] == [(2, 3), (1, 2), (1, 2)]
+        assert await self.redis_queue.get_length() == 1
+
+    @pytest.mark.parametrize("priority", [main.Priority.HIGH, main.Priority.LOW])
+    async def test_blocked_reliable_fetch_wakes_up_for_other_levels(self, priority):
+        self.redis_queue.reliable = True
+        self.redis_queue.poll_interval = 0.05
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        # Call 'fetch' on an empty queue, then submit a task.
+        fetch = asyncio.create_task(self.redis_queue.fetch(timeout=2))
+        await asyncio.sleep(0.1)
+        task_id = await self.redis_queue.submit(main.foo, (1, 10), priority=priority)
+        task = await fetch
+
+        # Assert.
+        assert task.id == task_id
+        assert loop.time() - start < 1
+        broker = self.redis_queue.broker
+        assert await broker.zcard(self.redis_queue.leases_key) == 1
+
+    async def test_promote_due(self):
+        await self.redis_queue.enqueue_in(-1, main.foo, 1, 2)
+        await self.redis_queue.enqueue_in(main.timedelta(hours=1), main.foo, 3, 4)
+        await self.redis_queue.enqueue_at(
+            main.datetime.now() - main.timedelta(seconds=1), main.foo, 5, 6
+        )
+        await self.redis_queue.submit(
+            main.foo, (7, 8), priority=main.Priority.HIGH, eta=main.time.time() - 1
+        )
+        assert await self.redis_queue.get_length() == 0
+
+        # Call 'promote_due'.
+        promoted = await self.redis_queue.promote_due()
+
+        # Assert.
+        assert promoted == 3
+        assert await self.redis_queue.get_length() == 3
+        assert (await self.redis_queue.fetch(timeout=1)).args == (7, 8)
+
+    async def test_reap_restores_priority(self):
+        self.redis_queue.reliable = True
+        self.redis_queue.visibility_timeout = -1
+        await self.redis_queue.submit(main.foo, (1, 2), priority=main.Priority.HIGH)
+        await self.redis_queue.fetch(timeout=1)
+
+        # Call 'reap'.
+        assert await self.redis_queue.reap() == 1
+
+        # Assert.
+        high_key = self.redis_queue.queue_keys[main.Priority.HIGH]
+        assert await self.redis_queue.broker.llen(high_key) == 1
+
+
+async def test_scheduler():
+    mock_queue = AsyncMock(spec=main.RedisQueue)
+    stop = asyncio.Event()
+
+    async def promote_due(batch_size):
+        stop.set()
+        return 0
+
+    mock_queue.promote_due.side_effect = promote_due
+
+    # Call 'scheduler'.
+    await main.scheduler(mock_queue, interval=0.01, batch_size=5, stop=stop)
+
+    # Assert.
+    mock_queue.promote_due.assert_awaited_once_with(5)
+
+
+async def test_simple_task_runs_sync_func_in_executor():
+    loop_thread = threading.get_ident()
+
+    def blocking(num):
+        return num, threading.get_ident()
+
+    # Call 'process_task' with the default executor and an explicit one.
+    task = main.SimpleTask(blocking, 42)
+    with ThreadPoolExecutor(1, thread_name_prefix="test") as executor:
+        default_result = await task.process_task()
+        executor_result = await task.process_task(executor)
+
+    # Assert.
+    assert default_result[0] == executor_result[0] == 42
+    assert default_result[1] != loop_thread
+    assert executor_result[1] != loop_thread
+
+
+async def test_redis_queue_routes_sync_tasks_to_executors():
+    registry = main.TaskRegistry()
+
+    @registry.task(executor="threads")
+    def routed():
+        return threading.current_thread().name
+
+    @registry.task(executor="missing")
+    def unrouted():
+        pass
+
+    with ThreadPoolExecutor(1, thread_name_prefix="routed") as executor:
+        queue = main.RedisQueue(
+            broker=FakeRedis.from_url("redis://localhost:6379/0"),
+            result_backend=FakeRedis.from_url("redis://localhost:6379/1"),
+            queue_name="test_executors",
+            registry=registry,
+            executors={"threads": executor},
+        )
+
+        # Call 'run'.
+        thread_name = await queue.run(main.SimpleTask(routed))
+        with pytest.raises(LookupError, match="missing"):
+            await queue.run(main.SimpleTask(unrouted))
+
+    # Assert.
+    assert thread_name.startswith("routed")
+    assert registry.executor_of(routed) == "threads"
+    assert registry.executor_of(main.foo) is None
+
+
+class TestDedupeRedisQueue:
+    def setup_method(self):
+        self.redis_queue = main.RedisQueue(
+            broker=FakeRedis.from_url("redis://localhost:6379/0"),
+            result_backend=FakeRedis.from_url("redis://localhost:6379/1"),
+            queue_name=f"test_dedupe_{uuid.uuid4()}",
+            dedupe_ttl=60,
+        )
+
+    async def test_duplicates_collapse_onto_inflight_task(self):
+        # Enqueue the same call twice, with the kwargs in a different order.
+        first = await self.redis_queue.enqueue(main.foo, start=1, end=2)
+        second = await self.redis_queue.enqueue(main.foo, end=2, start=1)
+        other = await self.redis_queue.enqueue(main.foo, start=1, end=3)
+
+        # Assert.
+        assert first == second != other
+        assert not is_valid_uuid(first)
+        assert await self.redis_queue.get_length() == 2
+
+    async def test_results_are_memoized(self):
+        task_id = await self.redis_queue.enqueue(main.foo, start=1, end=2)
+        await self.redis_queue.dequeue()
+
+        # Enqueue the same call after it finished.
+        assert await self.redis_queue.enqueue(main.foo, start=1, end=2) == task_id
+
+        # Assert.
+        assert await self.redis_queue.get_length() == 0
+        assert not await self.redis_queue.broker.exists(
+            self.redis_queue._inflight_key(task_id)
+        )
+
+    async def test_failed_task_can_be_resubmitted(self):
+        self.redis_queue.serializer = main.JSONSerializer()
+        registry = self.redis_queue.registry = main.TaskRegistry()
+
+        @registry.task()
+        async def fail():
+            raise RuntimeError
+
+        task_id = await self.redis_queue.enqueue(fail)
+        with pytest.raises(RuntimeError):
+            await self.redis_queue.dequeue()
+
+        # Assert.
+        assert await self.redis_queue.enqueue(fail) == task_id
+        assert await self.redis_queue.get_length() == 1
+
+    async def test_delayed_tasks_are_not_deduplicated(self):
+        first = await self.redis_queue.enqueue_in(10, main.foo, start=1, end=2)
+        second = await self.redis_queue.enqueue_in(10, main.foo, start=1, end=2)
+
+        # Assert.
+        assert is_valid_uuid(first)
+        assert first != second
+
+    async def test_batches_are_deduplicated(self):
+        task_id = await self.redis_queue.enqueue(main.foo, start=2, end=9)
+        calls = [(main.foo, (), {"start": 2, "end": 9}), (main.foo, (2, 8), {})]
+
+        # Call 'enqueue_many' with calls in flight, then with duplicate calls.
+        for _ in range(3):
+            task_ids = await self.redis_queue.enqueue_many(calls)
+        twins = await self.redis_queue.enqueue_many([(main.foo, (7, 11), {})] * 2)
+
+        # Assert.
+        assert task_ids[0] == task_id
+        assert twins[0] == twins[1]
+        assert await self.redis_queue.get_length() == 3
+
+    async def test_batches_serve_memoized_results(self):
+        task_id = await self.redis_queue.enqueue(main.foo, start=3, end=9)
+        await self.redis_queue.dequeue()
+
+        # Call 'enqueue_many'.
+        task_ids = await self.redis_queue.enqueue_many(
+            [(main.foo, (), {"start": 3, "end": 9})]
+        )
+
+        # Assert.
+        assert task_ids == [task_id]
+        assert await self.redis_queue.get_length() == 0
+
+    async def test_batches_take_two_round_trips(self):
+        # Load the script with a first call.
+        await self.redis_queue.enqueue(main.foo, start=4, end=9)
+        connection_class = self.redis_queue.broker.connection_pool.connection_class
+
+        # Call 'enqueue_many' with 50 calls.
+        with patch.object(
+            connection_class,
+            "send_packed_command",
+            autospec=True,
+            side_effect=connection_class.send_packed_command,
+        ) as round_trips:
+            await self.redis_queue.enqueue_many(
+                [(main.foo, (4, i), {}) for i in range(10, 60)]
+            )
+
+        # Assert the results are looked up and the tasks pushed in one each.
+        assert round_trips.call_count == 2
+        assert await self.redis_queue.get_length() == 51
+
+    async def test_groups_are_rejected(self):
+        with pytest.raises(ValueError, match="dedupe_ttl"):
+            await self.redis_queue.group([(main.foo, (1, 2), {})], sum)
+
+
+class TestOffloadedPayloads:
+    def setup_method(self):
+        self.redis_queue = main.RedisQueue(
+            broker=FakeRedis.from_url("redis://localhost:6379/0"),
+            result_backend=FakeRedis.from_url("redis://localhost:6379/1"),
+            queue_name=f"test_offload_{uuid.uuid4()}",
+            offload_threshold=1024,
+        )
+        self.data = "abcdefgh" * 1024
+
+    async def test_small_payloads_stay_inline(self):
+        task_id = await self.redis_queue.enqueue(len, "abc")
+
+        # Assert.
+        payload = await self.redis_queue.broker.lindex(self.redis_queue.queue_name, 0)
+        assert not payload.startswith(main._OFFLOAD_PREFIX)
+        assert not await self.redis_queue.broker.exists(
+            self.redis_queue._payload_key(task_id)
+        )
+
+    @pytest.mark.parametrize("compression", ["zlib", "lz4"])
+    async def test_large_payloads_are_offloaded(self, compression):
+        if compression == "lz4":
+            pytest.importorskip("lz4")
+        self.redis_queue.compression = compression
+        task_id = await self.redis_queue.enqueue(len, self.data)
+
+        # Assert.
+        broker = self.redis_queue.broker
+        payload_key = self.redis_queue._payload_key(task_id)
+        stub = await broker.lindex(self.redis_queue.queue_name, 0)
+        assert stub == main._OFFLOAD_PREFIX + payload_key.encode()
+        assert await broker.strlen(payload_key) < len(self.data) // 4
+        assert 0 < await broker.ttl(payload_key) <= self.redis_queue.offload_ttl
+
+        # Run the task, which deletes its payload.
+        await self.redis_queue.dequeue()
+        assert await self.redis_queue.get_result(task_id) == len(self.data)
+        assert not await broker.exists(payload_key)
+
+    async def test_batch_fetches_payloads_in_one_round_trip(self):
+        calls = [(len, (self.data,), {}), (len, ("abc",), {})] * 2
+        await self.redis_queue.enqueue_many(calls)
+
+        with patch.object(
+            self.redis_queue.broker, "mget", wraps=self.redis_queue.broker.mget
+        ) as mock_mget:
+            tasks = await self.redis_queue.dequeue_batch(4)
+
+        # Assert.
+        mock_mget.assert_called_once()
+        assert [task.args for task in tasks] == [c[1] for c in calls]
+
+    async def test_reliable_fetch_keeps_stub_in_receipt(self):
+        self.redis_queue.reliable = True
+        task_id = await self.redis_queue.enqueue(len, self.data)
+        task = await self.redis_queue.fetch()
+
+        # Assert.
+        assert task.args == (self.data,)
+        assert self.redis_queue._receipts[task_id].endswith(
+            self.redis_queue._payload_key(task_id).encode()
+        )
+
+    async def test_expired_payload_drops_task(self, caplog):
+        task_id = await self.redis_queue.enqueue(len, self.data)
+        await self.redis_queue.broker.delete(self.redis_queue._payload_key(task_id))
+
+        # Assert.
+        assert await self.redis_queue.fetch(timeout=1) is None
+        assert "expired" in caplog.text
+
+    def test_invalid_compression(self):
+        with pytest.raises(ValueError, match="unknown compression"):
+            main.RedisQueue(None, None, "test", compression="brotli")
+
+
+class TestTaskTimeouts:
+    def setup_method(self):
+        self.registry = main.TaskRegistry()
+        self.redis_queue = main.RedisQueue(
+            broker=FakeRedis.from_url("redis://localhost:6379/0"),
+            result_backend=FakeRedis.from_url("redis://localhost:6379/1"),
+            queue_name=f"test_timeouts_{uuid.uuid4()}",
+            serializer=main.JSONSerializer(),
+            registry=self.registry,
+        )
+
+        @self.registry.task(name="sleep")
+        async def sleep(delay):
+            await asyncio.sleep(delay)
+            return delay
+
+        self.sleep = sleep
+
+    async def test_timeout_is_sent_with_the_task(self):
+        await self.redis_queue.submit(self.sleep, (1,), timeout=0.5)
+        await self.redis_queue.enqueue_many([(self.sleep, (1,), {})], timeout=2)
+
+        # Assert.
+        tasks = await self.redis_queue.dequeue_batch(2)
+        assert [task.timeout for task in tasks] == [0.5, 2]
+
+    async def test_timed_out_task_is_recorded(self, caplog):
+        task_id = await self.redis_queue.submit(self.sleep, (10,), timeout=0.05)
+
+        # Call 'dequeue'.
+        await asyncio.wait_for(self.redis_queue.dequeue(), timeout=1)
+
+        # Assert.
+        assert "timed out" in caplog.text
+        with pytest.raises(main.TaskTimeout):
+            await self.redis_queue.get_result(task_id)
+
+    async def test_task_within_timeout_succeeds(self):
+        task_id = await self.redis_queue.submit(self.sleep, (0,), timeout=1)
+        await self.redis_queue.dequeue()
+
+        # Assert.
+        assert await self.redis_queue.get_result(task_id) == 0
+
+    async def test_timed_out_task_frees_its_slot(self):
+        stuck = await self.redis_queue.submit(self.sleep, (10,), timeout=0.05)
+        quick = await self.redis_queue.enqueue(self.sleep, 0)
+
+        # Run 'worker_pool' with a single slot.
+        stop = asyncio.Event()
+        pool = asyncio.create_task(
+            main.worker_pool(self.redis_queue, concurrency=1, stop=stop)
+        )
+        assert await self.redis_queue.get_result(quick, timeout=1) == 0
+        stop.set()
+        await pool
+
+        # Assert.
+        with pytest.raises(main.TaskTimeout):
+            await self.redis_queue.get_result(stuck)
+
+    async def test_timed_out_duplicate_can_be_resubmitted(self):
+        self.redis_queue.dedupe_ttl = 60
+        task_id = await self.redis_queue.submit(self.sleep, (10,), timeout=0.05)
+        await self.redis_queue.dequeue()
+
+        # Assert.
+        assert await self.redis_queue.submit(self.sleep, (10,)) == task_id
+        assert await self.redis_queue.get_length() == 1
+
+
+class TestTaskGroups:
+    def setup_method(self):
+        self.redis_queue = main.RedisQueue(
+            broker=FakeRedis.from_url("redis://localhost:6379/0"),
+            result_backend=FakeRedis.from_url("redis://localhost:6379/1"),
+            queue_name=f"test_groups_{uuid.uuid4()}",
+            result_ttl=60,
+        )
+
+    async def drain(self):
+        while task := await self.redis_queue.fetch(timeout=0.1):
+            await self.redis_queue.execute(task)
+
+    async def test_group_reduces_results_in_order(self):
+        group_id = await self.redis_queue.group(
+            [(max, (i, 2), {}) for i in range(5)], sum
+        )
+
+        # Assert the tasks carry the group and the reducer waits for them.
+        tasks = await self.redis_queue.dequeue_batch(5)
+        assert [task.id for task in tasks] == [f"{group_id}:{i}" for i in range(5)]
+        assert {task.group_id for task in tasks} == {group_id}
+        assert await self.redis_queue.get_length() == 0
+
+        # Store the results in reverse order.
+        for task in reversed(tasks):
+            await self.redis_queue.execute(task)
+        reduce_task = await self.redis_queue.fetch(timeout=0.1)
+        assert reduce_task.id == group_id
+        assert reduce_task.args == ([2, 2, 2, 3, 4],)
+
+        await self.redis_queue.execute(reduce_task)
+        assert await self.redis_queue.get_result(group_id) == 13
+        assert not await self.redis_queue.result_backend.keys(f"group:{group_id}:*")
+
+    async def test_group_fetches_results_with_one_mget(self):
+        group_id = await self.redis_queue.group(
+            [(max, (i, 0), {}) for i in range(3)], sorted
+        )
+        tasks = await self.redis_queue.dequeue_batch(3)
+
+        with patch.object(
+            self.redis_queue.result_backend,
+            "mget",
+            wraps=self.redis_queue.result_backend.mget,
+        ) as mock_mget:
+            await self.redis_queue.store_results([(task, 1) for task in tasks])
+
+        # Assert.
+        mock_mget.assert_called_once()
+        await self.drain()
+        assert await self.redis_queue.get_result(group_id) == [1, 1, 1]
+
+    async def test_redelivered_task_counts_once(self):
+        group_id = await self.redis_queue.group([(max, (1, 2), {})] * 2, sum)
+        first, second = await self.redis_queue.dequeue_batch(2)
+
+        # Store the first result twice.
+        await self.redis_queue.store_results([(first, 2)])
+        await self.redis_queue.store_results([(first, 2)])
+
+        # Assert.
+        assert await self.redis_queue.get_length() == 0
+        await self.redis_queue.store_results([(second, 2)])
+        await self.drain()
+        assert await self.redis_queue.get_result(group_id) == 4
+
+    async def test_empty_group(self):
+        group_id = await self.redis_queue.group([], sum)
+        await self.drain()
+
+        # Assert.
+        assert await self.redis_queue.get_result(group_id) == 0
+
+    async def test_timed_out_results_are_none(self):
+        group_id = await self.redis_queue.group([(max, (1, 2), {})] * 2, list)
+        first, second = await self.redis_queue.dequeue_batch(2)
+        await self.redis_queue.store_results([(first, main.TaskTimeout()), (second, 2)])
+        await self.drain()
+
+        # Assert.
+        assert await self.redis_queue.get_result(group_id) == [None, 2]
+
+    async def test_failed_reduce_can_be_retried(self):
+        group_id = await self.redis_queue.group([(max, (1, 2), {})] * 2, sum)
+        tasks = await self.redis_queue.dequeue_batch(2)
+        push_tasks = self.redis_queue._push_tasks
+
+        async def fail_once(*args, **kwargs):
+            self.redis_queue._push_tasks = push_tasks
+            raise ConnectionError("push failed")
+
+        # Call 'store_results' again after the reducer's push failed.
+        self.redis_queue._push_tasks = fail_once
+        with pytest.raises(ConnectionError):
+            await self.redis_queue.store_results([(task, 2) for task in tasks])
+        await self.redis_queue.store_results([(task, 2) for task in tasks])
+
+        # Assert.
+        assert await self.redis_queue.get_length() == 1
+        await self.drain()
+        assert await self.redis_queue.get_result(group_id) == 4
+        assert not await self.redis_queue.result_backend.keys(f"group:{group_id}:*")
+
+    async def test_late_redelivery_is_ignored(self):
+        group_id = await self.redis_queue.group([(max, (1, 2), {})], sum)
+        (task,) = await self.redis_queue.dequeue_batch(1)
+        await self.redis_queue.store_results([(task, 2)])
+        await self.drain()
+
+        # Store the result again after the group was reduced.
+        await self.redis_queue.store_results([(task, 2)])
+
+        # Assert.
+        assert await self.redis_queue.get_length() == 0
+        assert not await self.redis_queue.result_backend.keys(f"group:{group_id}:*")
+
+    async def test_failed_tasks_count_as_done(self, caplog):
+        group_id = await self.redis_queue.group(
+            [(max, (1, 2), {}), (max, (), {})], list
+        )
+
+        # Run the tasks; 'max' raises without arguments.
+        with caplog.at_level(logging.ERROR):
+            await self.drain()
+
+        # Assert.
+        assert f"Task {group_id}:1 failed." in caplog.text
+        assert await self.redis_queue.get_result(group_id) == [2, None]
+        with pytest.raises(main.TaskFailed):
+            await self.redis_queue.get_result(f"{group_id}:1")
@@ -0,0 +1,103 @@
+import patterns.async_redis_queue_benchmark as main
+
+
+def test_benchmark_serializers():
+    # Call 'benchmark_serializers'.
+    stats = main.benchmark_serializers(rounds=10)
+
+    # Assert.
+    names = [row.name for row in stats]
+    assert names[:3] == ["pickled task", "pickle envelope", "json envelope"]
+    by_name = {row.name: row for row in stats}
+    assert (
+        by_name["json envelope"].payload_bytes < by_name["pickled task"].payload_bytes
+    )
+    assert all(row.encode_us > 0 and row.decode_us > 0 for row in stats)
+
+
+def test_report(capsys):
+    # Call 'report'.
+    main.report([main.SerializerStats("json envelope", 85, 1.5, 2.5)])
+
+    # Assert.
+    out, err = capsys.readouterr()
+    assert err == ""
+    assert "json envelope" in out
+    assert "85" in out
+
+
+async def test_benchmark_queue():
+    # Call 'benchmark_queue'.
+    stats = await main.benchmark_queue(
+        "in-memory",
+        main.InMemoryBroker(),
+        main.InMemoryBroker(),
+        n_tasks=20,
+        batch_size=5,
+    )
+
+    # Assert.
+    assert [row.operation for row in stats] == [
+        "enqueue",
+        "fetch",
+        "enqueue_many",
+        "dequeue_batch",
+    ]
+    assert all(row.tasks == 20 for row in stats)
+    assert all(0 < row.p50_us <= row.p95_us <= row.p99_us for row in stats)
+    assert main.arq.logger.level == main.logging.INFO
+
+
+async def test_benchmark_brokers(capsys):
+    # Call 'benchmark_brokers' with an unreachable Redis.
+    stats = await main.benchmark_brokers("redis://localhost:1", n_tasks=10)
+
+    # Assert.
+    out, err = capsys.readouterr()
+    assert "skipping" in out
+    assert {row.broker for row in stats} == {"in-memory"}
+
+
+def test_report_queue(capsys):
+    # Call 'report_queue'.
+    main.report_queue([main.QueueStats("redis", "fetch", 10, 1000.0, 1, 2, 3)])
+
+    # Assert.
+    out, err = capsys.readouterr()
+    assert err == ""
+    assert "redis" in out
+    assert "fetch" in out
+
+
+async def test_benchmark_payloads():
+    # Call 'benchmark_payloads'.
+    stats = await main.benchmark_payloads(
+        "in-memory",
+        main.InMemoryBroker(),
+        main.InMemoryBroker(),
+        sizes=(100, 10_000),
+        rounds=5,
+        offload_threshold=1000,
+    )
+
+    # Assert.
+    rows = {(row.mode, row.payload_bytes): row for row in stats}
+    assert rows["inline", 10_000].offloaded_bytes == 0
+    assert rows["inline", 10_000].list_bytes > 10_000
+    assert rows["offload", 100].offloaded_bytes == 0
+    assert rows["offload", 10_000].list_bytes < 100
+    assert rows["offload", 10_000].offloaded_bytes < 10_000
+    assert main.arq.logger.level == main.logging.INFO
+
+
+def test_report_payloads(capsys):
+    # Call 'report_payloads'.
+    main.report_payloads(
+        [main.PayloadStats("in-memory", "offload", 1024, 60, 700, 10.0, 12.0)]
+    )
+
+    # Assert.
+    out, err = capsys.readouterr()
+    assert err == ""
+    assert "offload" in out
+    assert "1024" in out
@@ -0,0 +1,97 @@
+import logging
+import multiprocessing
+import threading
+from unittest.mock import patch
+
+import patterns.async_redis_queue_prefork as main
+
+
+@patch("patterns.async_redis_queue_prefork.signal.signal", autospec=True)
+@patch("patterns.async_redis_queue_prefork.worker_pool", autospec=True)
+def test_work(mock_worker_pool, mock_signal):
+    async def worker_pool(queue, concurrency, batch_size, on_processed):
+        on_processed(3)
+        on_processed(4)
+
+    mock_worker_pool.side_effect = worker_pool
+    counters = multiprocessing.Array("Q", 2)
+
+    # Call '_work'.
+    main._work(lambda: "queue", counters, 1, concurrency=5, batch_size=2)
+
+    # Assert.
+    assert counters[:] == [0, 7]
+    mock_worker_pool.assert_called_once()
+    assert mock_worker_pool.call_args.args == ("queue",)
+    mock_signal.assert_any_call(main.signal.SIGTERM, main.signal.SIG_DFL)
+
+
+def test_supervisor_restarts_children(caplog):
+    def crashing_work(queue_factory, counters, slot, concurrency, batch_size):
+        with counters.get_lock():
+            counters[slot] += 1
+        raise SystemExit(1)
+
+    supervisor = main.Supervisor(lambda: None, processes=2, report_interval=0.05)
+    threading.Timer(0.5, supervisor.stop).start()
+
+    # Call 'run'.
+    with patch.object(main, "_work", crashing_work):
+        with caplog.at_level(logging.INFO):
+            supervisor.run()
+
+    # Assert.
+    assert supervisor.restarts >= 1
+    assert supervisor.processed == supervisor.restarts + 2
+    assert "restarting" in caplog.text
+    assert "throughput" in caplog.text
+    assert "Supervisor stopped" in caplog.text
+
+
+def test_supervisor_backs_off_crashing_children(caplog):
+    def crashing_work(queue_factory, counters, slot, concurrency, batch_size):
+        raise SystemExit(1)
+
+    supervisor = main.Supervisor(
+        lambda: None, processes=2, restart_delay=0.05, report_interval=1
+    )
+    threading.Timer(0.5, supervisor.stop).start()
+
+    # Call 'run' with children that die right away.
+    with patch.object(main, "_work", crashing_work):
+        with caplog.at_level(logging.INFO):
+            supervisor.run()
+
+    # Assert every slot waited 0.05, 0.1, 0.2, ... seconds between restarts.
+    assert 2 <= supervisor.restarts <= 2 * 4
+    assert "restarting in 0.1s" in caplog.text
+    assert "restarting in 0.2s" in caplog.text
+
+
+def test_restart_delay():
+    supervisor = main.Supervisor(
+        lambda: None, processes=1, restart_delay=1, max_restart_delay=5, min_uptime=10
+    )
+    supervisor._started[0] = main.time.monotonic()
+
+    # Call '_restart_delay' for a child that keeps crashing.
+    delays = [supervisor._restart_delay(0) for _ in range(5)]
+
+    # Assert.
+    assert delays == [1, 2, 4, 5, 5]
+
+    # Assert the delay resets once a child ran for 'min_uptime'.
+    supervisor._started[0] -= 10
+    assert supervisor._restart_delay(0) == 0
+    supervisor._started[0] = main.time.monotonic()
+    assert supervisor._restart_delay(0) == 1
+
+
+def test_make_queue():
+    with patch.object(main.aioredis, "from_url", autospec=True) as mock_from_url:
+        # Call 'make_queue'.
+        queue = main.make_queue()
+
+    # Assert.
+    assert queue.queue_name == "default"
+    assert mock_from_url.call_count == 2
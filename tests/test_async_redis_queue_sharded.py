@@ -0,0 +1,171 @@
+import asyncio
+import uuid
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+import patterns.async_redis_queue_sharded as main
+
+
+def make_queue(shards=4, **options):
+    brokers = {
+        "redis://localhost:6379/2": FakeRedis.from_url("redis://localhost:6379/2"),
+        "redis://localhost:6379/3": FakeRedis.from_url("redis://localhost:6379/3"),
+    }
+    return main.ShardedRedisQueue(
+        brokers,
+        FakeRedis.from_url("redis://localhost:6379/1"),
+        f"test_sharded_{uuid.uuid4()}",
+        shards=shards,
+        **options,
+    )
+
+
+def test_shards_are_spread_over_brokers():
+    queue = make_queue(shards=16)
+
+    # Assert.
+    assert [shard.queue_name for shard in queue.shards][:2] == [
+        f"{queue.queue_name}:0",
+        f"{queue.queue_name}:1",
+    ]
+    assert len({id(shard.broker) for shard in queue.shards}) == 2
+
+    with pytest.raises(ValueError, match="'shards' must be a positive integer"):
+        make_queue(shards=0)
+
+
+async def test_enqueue_spreads_tasks_over_shards():
+    queue = make_queue()
+
+    # Call 'enqueue' and 'enqueue_many'.
+    for i in range(4):
+        await queue.enqueue(max, i, 100)
+    task_ids = await queue.enqueue_many([(max, (i, 100), {}) for i in range(8)])
+
+    # Assert.
+    assert len(set(task_ids)) == 8
+    assert [await shard.get_length() for shard in queue.shards] == [3, 3, 3, 3]
+    assert await queue.get_length() == 12
+
+
+async def test_enqueue_many_keeps_call_order():
+    queue = make_queue()
+    task_ids = await queue.enqueue_many([(max, (i, 100), {}) for i in range(6)])
+
+    # Assert.
+    tasks = await queue.dequeue_batch(6)
+    by_id = {task.id: task.args for task in tasks}
+    assert [by_id[task_id] for task_id in task_ids] == [(i, 100) for i in range(6)]
+
+
+async def test_dequeue_batch_steals_from_other_shards():
+    queue = make_queue()
+    await queue.shards[2].enqueue(max, 1, 100)
+    await queue.shards[3].enqueue(max, 2, 100)
+    queue._next_shard = 0
+
+    # Call 'dequeue_batch'.
+    tasks = await queue.dequeue_batch(5, max_wait=0)
+
+    # Assert.
+    assert sorted(task.args for task in tasks) == [(1, 100), (2, 100)]
+    assert queue._next_shard == 1
+    assert {queue._owners[task.id] for task in tasks} == set(queue.shards[2:])
+
+
+async def test_fetch_rotates_the_start_shard():
+    queue = make_queue()
+    for shard in queue.shards:
+        await shard.enqueue(max, 1, 100)
+    queue._next_shard = 0
+
+    # Call 'fetch' once per shard.
+    owners = []
+    for _ in queue.shards:
+        task = await queue.fetch(timeout=1)
+        owners.append(queue._owners[task.id])
+
+    # Assert.
+    assert owners == queue.shards
+
+
+async def test_fetch_blocks_on_one_instance():
+    queue = make_queue()
+
+    # Assert an empty queue times out.
+    assert await queue.fetch(timeout=0.1) is None
+
+    # Assert a blocked fetch wakes up on the home instance.
+    home = queue.shards[queue._next_shard]
+    fetch = asyncio.create_task(queue.fetch(timeout=1))
+    await asyncio.sleep(0.05)
+    task_id = await home.enqueue(max, 1, 100)
+    task = await fetch
+    assert task.id == task_id
+    assert queue._owners[task_id] is home
+
+
+async def test_results_go_through_the_owner_shard():
+    queue = make_queue(reliable=True)
+    task_id = await queue.enqueue(max, 1, 1)
+    task = await queue.fetch(timeout=1)
+    owner = queue._owners[task_id]
+
+    # Call 'store_results'.
+    await queue.store_results([(task, 42)])
+
+    # Assert.
+    assert await queue.get_result(task_id) == 42
+    assert task_id not in queue._owners
+    assert len(owner._pending_acks) == 1
+    await queue.flush_acks()
+    assert not owner._pending_acks
+
+
+async def test_duplicates_meet_on_one_shard():
+    queue = make_queue(dedupe_ttl=60)
+
+    # Call 'enqueue' twice with the same arguments.
+    first = await queue.enqueue(max, 1, 100)
+    second = await queue.enqueue(max, 1, 100)
+
+    # Assert.
+    assert first == second
+    assert await queue.get_length() == 1
+
+
+async def test_batch_duplicates_meet_on_one_shard():
+    queue = make_queue(dedupe_ttl=60)
+    task_id = await queue.enqueue(max, 2, 100)
+
+    # Call 'enqueue_many' with the in-flight call and a duplicated one.
+    for _ in range(3):
+        task_ids = await queue.enqueue_many([(max, (2, 100), {}), (max, (3, 100), {})])
+
+    # Assert.
+    assert task_ids[0] == task_id
+    assert await queue.get_length() == 2
+
+
+async def test_worker_pool_drains_shards():
+    queue = make_queue()
+    task_ids = await queue.enqueue_many([(max, (i, 1), {}) for i in range(10)])
+    stop = asyncio.Event()
+
+    async def stop_when_done():
+        for task_id in task_ids:
+            await queue.get_result(task_id, timeout=5)
+        stop.set()
+
+    # Call 'worker_pool'.
+    await asyncio.gather(
+        main.worker_pool(queue, batch_size=4, stop=stop, poll_timeout=0.1),
+        stop_when_done(),
+    )
+
+    # Assert.
+    assert await queue.get_length() == 0
+    assert [await queue.get_result(task_id) for task_id in task_ids] == [
+        max(i, 1) for i in range(10)
+    ]
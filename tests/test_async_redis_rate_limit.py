@@ -1,9 +1,23 @@
+import asyncio
+import uuid
 from unittest.mock import patch
 
 import fakeredis.aioredis  # aioredis 2.0 fake.
 import pytest
 
 import patterns.async_redis_rate_limit as main
+from patterns.consistent_hash import HashRing
+
+
+def count_round_trips(redis):
+    """Count the commands, or pipelines of commands, sent to the server."""
+    connection_class = redis.connection_pool.connection_class
+    return patch.object(
+        connection_class,
+        "send_packed_command",
+        autospec=True,
+        side_effect=connection_class.send_packed_command,
+    )
 
 
 def test_too_many_requests():
@@ -27,6 +41,402 @@ async def test_rate_limit():
             await rl.rate_limit()
 
 
+async def test_check_returns_decision():
+    rl = main.RateLimit(
+        rps=10,
+        header={"Authorization": "dummy_auth"},
+        redis_pool=fakeredis.aioredis.FakeRedis(),
+    )
+
+    # Drain the bucket in one call, so that it can't refill in between.
+    first = await rl.check("decision")
+    last = await rl.check("decision", tokens=100)
+    denied = await rl.check("decision")
+
+    # Assert.
+    assert first.allowed
+    assert first.remaining == pytest.approx(100, abs=0.1)
+    assert last.allowed
+    assert not denied.allowed
+    assert 0 < denied.retry_after <= 0.1
+
+    # Assert the bucket refills with time.
+    await asyncio.sleep(denied.retry_after + 0.01)
+    assert (await rl.check("decision")).allowed
+
+
+async def test_concurrent_checks_dont_overshoot():
+    rl = main.RateLimit(
+        rps=1,
+        header={"Authorization": "dummy_auth"},
+        redis_pool=fakeredis.aioredis.FakeRedis(),
+    )
+
+    # Call 'check' concurrently.
+    decisions = await asyncio.gather(*(rl.check("burst") for _ in range(50)))
+
+    # Assert.
+    assert sum(decision.allowed for decision in decisions) == 11
+
+
+@pytest.mark.parametrize("strategy", list(main._STRATEGIES))
+async def test_strategies_enforce_the_limit(strategy):
+    rl = main.RateLimit(
+        rps=1,
+        header={"Authorization": "dummy_auth"},
+        redis_pool=fakeredis.aioredis.FakeRedis(),
+        strategy=strategy,
+    )
+
+    # Call 'check' concurrently.
+    decisions = await asyncio.gather(*(rl.check(strategy) for _ in range(20)))
+
+    # Assert.
+    assert sum(decision.allowed for decision in decisions) == 11
+    denied = [decision for decision in decisions if not decision.allowed]
+    assert all(0 < decision.retry_after <= 10 for decision in denied)
+    assert all(decision.remaining < 1 for decision in denied)
+
+
+@pytest.mark.parametrize("strategy", list(main._STRATEGIES))
+async def test_strategies_support_leases(strategy):
+    rl = main.RateLimit(
+        rps=1,
+        header={"Authorization": "dummy_auth"},
+        redis_pool=fakeredis.aioredis.FakeRedis(),
+        lease_size=4,
+        strategy=strategy,
+    )
+
+    # Assert.
+    decisions = [await rl.check(f"lease_{strategy}") for _ in range(12)]
+    assert [decision.allowed for decision in decisions] == [True] * 11 + [False]
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError, match="unknown strategy 'fixed_window'"):
+        main.RateLimit(header={}, strategy="fixed_window")
+
+
+@pytest.mark.parametrize("strategy", list(main._STRATEGIES))
+async def test_check_many(strategy):
+    redis = fakeredis.aioredis.FakeRedis()
+    rl = main.RateLimit(
+        header={"Authorization": "dummy_auth"}, redis_pool=redis, strategy=strategy
+    )
+    limits = [(f"token_{strategy}", 1), (f"ip_{strategy}", 2), (f"route_{strategy}", 3)]
+    await redis.ping()  # Connect first.
+
+    # Call 'check_many' until every limit is exhausted.
+    with count_round_trips(redis) as round_trips:
+        rounds = [await rl.check_many(limits) for _ in range(32)]
+
+    # Assert one round trip per call, after loading the script once, and one
+    # decision per limit.
+    assert round_trips.call_count == 32 + 2
+    allowed = [sum(round[i].allowed for round in rounds) for i in range(3)]
+    assert allowed == [11, 21, 31]
+
+
+async def test_check_many_reloads_flushed_script():
+    redis = fakeredis.aioredis.FakeRedis()
+    rl = main.RateLimit(header={}, redis_pool=redis)
+    await rl.check_many([("flushed", 1)])
+    await redis.script_flush()
+
+    # Call 'check_many' after the script cache was flushed.
+    with count_round_trips(redis) as round_trips:
+        decisions = await rl.check_many([("flushed", 1), ("flushed", 1)])
+
+    # Assert the batch is sent again once the script is loaded.
+    assert round_trips.call_count == 3
+    assert [decision.remaining for decision in decisions] == [
+        pytest.approx(9, abs=0.1),
+        pytest.approx(8, abs=0.1),
+    ]
+
+
+async def test_check_many_serves_leases_locally():
+    redis = fakeredis.aioredis.FakeRedis()
+    rl = main.RateLimit(
+        header={"Authorization": "dummy_auth"}, redis_pool=redis, lease_size=5
+    )
+    await rl.check("many_leased")
+
+    # Assert only the limit without a lease goes to Redis.
+    with patch.object(redis, "pipeline", wraps=redis.pipeline) as mock_pipeline:
+        decisions = await rl.check_many([("many_leased", 1)])
+    assert decisions == [main.Decision(True, 3, 0.0)]
+    mock_pipeline.assert_not_called()
+
+    decisions = await rl.check_many([("many_leased", 1), ("many_new", 1)])
+    assert [decision.remaining for decision in decisions] == [2, 4]
+
+
+async def test_acquire_paces_waiters():
+    rl = main.RateLimit(
+        rps=50,
+        header={"Authorization": "acquire"},
+        redis_pool=fakeredis.aioredis.FakeRedis(),
+    )
+    check, probes = rl.check, []
+
+    async def count_probes(*args, **kwargs):
+        decision = await check(*args, **kwargs)
+        probes.append(decision.allowed)
+        return decision
+
+    rl.check = count_probes
+
+    # Drain the bucket, then call 'acquire' concurrently.
+    assert (await check("acquire", tokens=rl._capacity)).allowed
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    decisions = await asyncio.gather(*(rl.acquire() for _ in range(20)))
+
+    # Assert the waiters were let through one refill at a time.
+    assert all(decision.allowed for decision in decisions)
+    assert loop.time() - start >= 0.35
+    assert probes.count(True) == 20
+    # Only the head of the line is denied, when it finds the bucket drained.
+    assert probes.count(False) <= 2
+    assert main._LINES == {}
+
+
+async def test_acquire_more_than_capacity():
+    rl = main.RateLimit(header={}, rps=1, redis_pool=fakeredis.aioredis.FakeRedis())
+
+    # Assert.
+    with pytest.raises(ValueError, match="capacity of 11 tokens"):
+        await rl.acquire("too_many", tokens=12)
+
+
+async def test_acquire_without_target():
+    rl = main.RateLimit(header={}, redis_pool=fakeredis.aioredis.FakeRedis())
+
+    # Assert requests without a target aren't limited.
+    assert (await rl.acquire()).allowed
+
+
+async def test_leased_tokens_are_served_locally():
+    rl = main.RateLimit(
+        rps=1,
+        header={"Authorization": "dummy_auth"},
+        redis_pool=fakeredis.aioredis.FakeRedis(),
+        lease_size=5,
+    )
+    token_bucket, round_trips = rl._take, []
+
+    async def count_round_trips(**kwargs):
+        round_trips.append(kwargs)
+        return await token_bucket(**kwargs)
+
+    rl._take = count_round_trips
+
+    # Call 'check' until the bucket is empty.
+    decisions = [await rl.check("lease") for _ in range(12)]
+
+    # Assert 11 tokens were leased in 3 round trips, and a 4th denied the last call.
+    assert [decision.allowed for decision in decisions] == [True] * 11 + [False]
+    assert [decision.remaining for decision in decisions[:6]] == [4, 3, 2, 1, 0, 4]
+    assert len(round_trips) == 4
+
+
+async def test_expired_lease_is_dropped():
+    rl = main.RateLimit(
+        rps=1,
+        header={"Authorization": "dummy_auth"},
+        redis_pool=fakeredis.aioredis.FakeRedis(),
+        lease_size=10,
+        lease_ttl=0.01,
+    )
+
+    # Lease 10 tokens and let the lease expire.
+    assert (await rl.check("expired")).remaining == 9
+    await asyncio.sleep(0.02)
+
+    # Assert the unused tokens are lost.
+    decision = await rl.check("expired")
+    assert decision.allowed
+    assert decision.remaining == 0
+    assert not (await rl.check("expired")).allowed
+
+
+@patch.object(main, "_MAX_LEASES", 2)
+@patch.dict(main._LEASES, clear=True)
+def test_evict_leases():
+    main._LEASES.update(
+        {
+            "old": main._Lease(1, 10),
+            "live": main._Lease(1, 30),
+            "new": main._Lease(1, 40),
+        }
+    )
+
+    # Assert expired leases go first, then the oldest live ones.
+    main._evict_leases(now=20)
+    assert list(main._LEASES) == ["live", "new"]
+    main._evict_leases(now=20)
+    assert list(main._LEASES) == ["new"]
+
+
+class TestDistributedSemaphore:
+    def setup_method(self):
+        self.redis = fakeredis.aioredis.FakeRedis()
+        self.semaphore = main.DistributedSemaphore(
+            f"test_{uuid.uuid4()}", limit=2, redis_pool=self.redis, retry_interval=0.01
+        )
+
+    async def test_try_acquire_respects_the_limit(self):
+        first = await self.semaphore.try_acquire()
+        second = await self.semaphore.try_acquire()
+
+        # Assert.
+        assert first is not None
+        assert second not in (None, first)
+        assert await self.semaphore.try_acquire() is None
+
+        await self.semaphore.release(first)
+        assert await self.semaphore.try_acquire() is not None
+
+    async def test_hold_caps_concurrency(self):
+        running, peak = 0, 0
+
+        async def work():
+            nonlocal running, peak
+            async with self.semaphore.hold(timeout=1):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.02)
+                running -= 1
+
+        # Call 'hold' from more coroutines than there are slots.
+        await asyncio.gather(*(work() for _ in range(6)))
+
+        # Assert.
+        assert peak == 2
+        assert await self.redis.zcard(self.semaphore._key) == 0
+
+    async def test_acquire_timeout(self):
+        await self.semaphore.acquire()
+        await self.semaphore.acquire()
+
+        # Assert.
+        with pytest.raises(asyncio.TimeoutError):
+            await self.semaphore.acquire(timeout=0.05)
+
+    async def test_expired_lease_is_released(self):
+        semaphore = main.DistributedSemaphore(
+            self.semaphore._key, limit=1, lease=0.05, redis_pool=self.redis
+        )
+        crashed = await semaphore.acquire()
+
+        # Assert the crashed holder's slot frees up once its lease expires.
+        assert await semaphore.try_acquire() is None
+        await asyncio.sleep(0.06)
+        assert not await semaphore.renew(crashed)
+        token = await semaphore.try_acquire()
+        assert token is not None
+        assert await semaphore.renew(token)
+
+    def test_invalid_limit(self):
+        with pytest.raises(ValueError, match="'limit' must be a positive integer"):
+            main.DistributedSemaphore("test", limit=0)
+
+
+class TestShardedRateLimit:
+    def setup_method(self):
+        self.servers = {name: fakeredis.FakeServer() for name in ("a", "b", "c")}
+        self.ring = HashRing(
+            {
+                name: fakeredis.aioredis.FakeRedis(server=server)
+                for name, server in self.servers.items()
+            }
+        )
+
+    def make_limiter(self, **options):
+        return main.ShardedRateLimit(
+            {}, self.ring, prefix=f"test_{uuid.uuid4()}", rps=2, **options
+        )
+
+    async def test_keys_are_spread_over_the_ring(self):
+        rl = self.make_limiter()
+        targets = [f"user:{i}" for i in range(30)]
+
+        # Call 'check_many'.
+        decisions = await rl.check_many([(target, 2) for target in targets])
+
+        # Assert every key lives on the node that the ring maps it to.
+        assert all(decision.allowed for decision in decisions)
+        for target in targets:
+            key = rl._key(target)
+            owner = self.ring.name_of(key)
+            for name, pool in self.ring.nodes.items():
+                assert await pool.exists(key) == (name == owner)
+        assert all([await pool.dbsize() for pool in self.ring.nodes.values()])
+
+    async def test_check_enforces_the_limit(self):
+        rl = self.make_limiter()
+
+        # Call 'check' past the capacity.
+        decisions = [await rl.check("user:1") for _ in range(rl._capacity + 1)]
+
+        # Assert.
+        assert all(decision.allowed for decision in decisions[:-1])
+        assert not decisions[-1].allowed
+        assert decisions[-1].retry_after > 0
+
+    async def test_round_trips(self):
+        rl = self.make_limiter()
+        targets = [f"user:{i}" for i in range(30)]
+        await rl.check_many([(target, 2) for target in targets])
+
+        # Call 'check' and 'check_many' once the scripts are loaded.
+        with count_round_trips(self.ring.get("")) as round_trips:
+            await rl.check("user:1")
+            assert round_trips.call_count == 1
+            await rl.check_many([(target, 2) for target in targets])
+
+        # Assert one 'EVALSHA' per check and one pipeline per node.
+        assert round_trips.call_count == 1 + 3
+
+    @pytest.mark.parametrize("fail_open", [True, False])
+    async def test_unreachable_node(self, fail_open):
+        rl = self.make_limiter(fail_open={"a": fail_open}, failure_retry_after=2)
+        targets = [f"user:{i}" for i in range(30)]
+        self.servers["a"].connected = False
+
+        # Call 'check_many' while node 'a' is down.
+        decisions = await rl.check_many([(target, 2) for target in targets])
+
+        # Assert node 'a' follows its policy and the other nodes still count.
+        for target, decision in zip(targets, decisions):
+            if self.ring.name_of(rl._key(target)) == "a":
+                assert decision.allowed is fail_open
+                assert decision.retry_after == (0.0 if fail_open else 2)
+            else:
+                assert decision.allowed
+                assert decision.remaining == pytest.approx(rl._capacity - 1, abs=0.1)
+
+    async def test_unnamed_nodes_fail_closed(self):
+        rl = self.make_limiter(fail_open={"a": True})
+        for server in self.servers.values():
+            server.connected = False
+
+        # Call 'check' on a target of every node.
+        decisions = {}
+        for i in range(30):
+            name = self.ring.name_of(rl._key(f"user:{i}"))
+            decisions[name] = await rl.check(f"user:{i}")
+
+        # Assert.
+        assert {name: decision.allowed for name, decision in decisions.items()} == {
+            "a": True,
+            "b": False,
+            "c": False,
+        }
+
+
 @patch(
     "patterns.async_redis_rate_limit.RateLimit",
     autospec=True,
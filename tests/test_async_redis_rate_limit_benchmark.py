@@ -0,0 +1,45 @@
+from unittest.mock import AsyncMock, patch
+
+import fakeredis.aioredis
+import pytest
+
+import patterns.async_redis_rate_limit_benchmark as main
+
+
+@pytest.mark.parametrize("strategy", list(main._STRATEGIES))
+async def test_benchmark_strategy(strategy):
+    redis = fakeredis.aioredis.FakeRedis()
+
+    # Call 'benchmark_strategy'. The fake server has no 'MEMORY USAGE'.
+    with patch.object(redis, "memory_usage", AsyncMock(return_value=80)):
+        stats = await main.benchmark_strategy(
+            redis, strategy, n_keys=50, requests_per_key=3, samples=10, chunk_size=20
+        )
+
+    # Assert.
+    assert stats.strategy == strategy
+    assert stats.keys == 50
+    assert stats.bytes_per_key == 80
+    assert 0 < stats.p50_us <= stats.p99_us
+    assert len(await redis.keys(f"rate_limit:{strategy}:*")) == 50
+
+
+async def test_benchmark_strategies_without_redis(capsys):
+    # Call 'benchmark_strategies' with an unreachable Redis.
+    stats = await main.benchmark_strategies("redis://localhost:1/15", n_keys=10)
+
+    # Assert.
+    out, err = capsys.readouterr()
+    assert "skipping" in out
+    assert stats == []
+
+
+def test_report(capsys):
+    # Call 'report'.
+    main.report([main.StrategyStats("sliding_window_log", 1000, 912.5, 80.0, 150.0)])
+
+    # Assert.
+    out, err = capsys.readouterr()
+    assert err == ""
+    assert "sliding_window_log" in out
+    assert "912.5" in out
@@ -1,6 +1,9 @@
+import asyncio
+import uuid
 from unittest.mock import patch
 
 import fakeredis.aioredis
+import pytest
 
 import patterns.async_redis_stream as main
 
@@ -24,3 +27,338 @@ async def test_create_consumer_group():
         stream_name=stream_name,
         consumer_group_name=consumer_group_name,
     )
+
+
+class TestGroupConsumer:
+    def setup_method(self):
+        self.redis = fakeredis.aioredis.FakeRedis()
+        self.stream_name = f"test_stream_{uuid.uuid4()}"
+        self.batches = []
+        self.stop = asyncio.Event()
+
+    async def handler(self, stream_name, entries):
+        self.batches.append([fields[b"i"] for _, fields in entries])
+        if sum(map(len, self.batches)) >= 5:
+            self.stop.set()
+
+    async def consume(self, **options):
+        await main.group_consumer(
+            self.redis,
+            self.stream_name,
+            "test_group",
+            handler=self.handler,
+            stop=self.stop,
+            **options,
+        )
+
+    async def test_reads_in_batches_and_acks(self):
+        await main.create_consumer_group(self.stream_name, "test_group", self.redis)
+        for i in range(5):
+            await self.redis.xadd(self.stream_name, {"i": i})
+
+        # Call 'group_consumer'.
+        await asyncio.wait_for(self.consume(count=2, block_ms=50), timeout=1)
+
+        # Assert.
+        assert self.batches == [[b"0", b"1"], [b"2", b"3"], [b"4"]]
+        pending = await self.redis.xpending(self.stream_name, "test_group")
+        assert pending["pending"] == 0
+
+    async def test_blocks_until_entries_arrive(self):
+        await main.create_consumer_group(self.stream_name, "test_group", self.redis)
+
+        # Call 'group_consumer' before the producer adds entries.
+        consume = asyncio.create_task(self.consume(block_ms=1000))
+        await asyncio.sleep(0.05)
+        for i in range(5):
+            await self.redis.xadd(self.stream_name, {"i": i})
+        await asyncio.wait_for(consume, timeout=1)
+
+        # Assert.
+        assert sum(self.batches, []) == [b"0", b"1", b"2", b"3", b"4"]
+
+    async def test_replays_own_pending_entries(self):
+        await main.create_consumer_group(self.stream_name, "test_group", self.redis)
+        for i in range(3):
+            await self.redis.xadd(self.stream_name, {"i": i})
+        # Read without acking, as a consumer that crashed would.
+        await self.redis.xreadgroup(
+            "test_group", "worker", {self.stream_name: ">"}, count=3
+        )
+        for i in range(3, 5):
+            await self.redis.xadd(self.stream_name, {"i": i})
+
+        # Call 'group_consumer' as the same consumer.
+        await asyncio.wait_for(
+            self.consume(consumer_name="worker", block_ms=50), timeout=1
+        )
+
+        # Assert the pending entries come first.
+        assert self.batches == [[b"0", b"1", b"2"], [b"3", b"4"]]
+
+    async def test_failed_batch_stays_pending(self):
+        await main.create_consumer_group(self.stream_name, "test_group", self.redis)
+        await self.redis.xadd(self.stream_name, {"i": 0})
+
+        async def handler(stream_name, entries):
+            raise RuntimeError("boom")
+
+        # Call 'group_consumer' with a failing handler.
+        with pytest.raises(RuntimeError, match="boom"):
+            await main.group_consumer(
+                self.redis, self.stream_name, "test_group", handler=handler
+            )
+
+        # Assert.
+        pending = await self.redis.xpending(self.stream_name, "test_group")
+        assert pending["pending"] == 1
+
+
+class TestBatchProducer:
+    def setup_method(self):
+        self.redis = fakeredis.aioredis.FakeRedis()
+        self.stream_name = f"test_stream_{uuid.uuid4()}"
+
+    async def test_flushes_full_batches_in_one_pipeline(self):
+        producer = main.BatchProducer(
+            self.redis, self.stream_name, batch_size=3, linger=10
+        )
+
+        # Call 'add' past one batch.
+        with patch.object(
+            self.redis, "pipeline", wraps=self.redis.pipeline
+        ) as pipeline:
+            for i in range(4):
+                await producer.add({"i": i})
+
+            # Assert.
+            assert pipeline.call_count == 1
+            assert await self.redis.xlen(self.stream_name) == 3
+
+            await producer.close()
+            assert pipeline.call_count == 2
+        entries = await self.redis.xrange(self.stream_name)
+        assert [fields[b"i"] for _, fields in entries] == [b"0", b"1", b"2", b"3"]
+
+    async def test_flushes_after_linger(self):
+        producer = main.BatchProducer(
+            self.redis, self.stream_name, batch_size=100, linger=0.02
+        )
+
+        # Call 'add' less than a batch.
+        await producer.add({"i": 0})
+        await producer.add({"i": 1})
+
+        # Assert.
+        assert await self.redis.xlen(self.stream_name) == 0
+        await asyncio.sleep(0.05)
+        assert await self.redis.xlen(self.stream_name) == 2
+        assert producer._timer is None
+
+    async def test_trims_the_stream(self):
+        # Call 'add' with more entries than 'maxlen'.
+        async with main.BatchProducer(
+            self.redis, self.stream_name, batch_size=50, maxlen=100
+        ) as producer:
+            for i in range(500):
+                await producer.add({"i": i})
+
+        # Assert.
+        assert await self.redis.xlen(self.stream_name) <= 150
+
+    async def test_background_flush_error_is_raised(self):
+        producer = main.BatchProducer(
+            self.redis, self.stream_name, batch_size=100, linger=0.01
+        )
+        await self.redis.set(self.stream_name, "not a stream")
+
+        # Call 'add' and let the background flush fail.
+        await producer.add({"i": 0})
+        await asyncio.sleep(0.03)
+
+        # Assert.
+        with pytest.raises(Exception, match="WRONGTYPE"):
+            await producer.add({"i": 1})
+
+    async def test_close_waits_for_linger_flush(self):
+        producer = main.BatchProducer(
+            self.redis, self.stream_name, batch_size=100, linger=0.01
+        )
+        sent = []
+
+        async def slow_send(batch):
+            await asyncio.sleep(0.05)
+            sent.extend(batch)
+            raise RuntimeError("send failed")
+
+        producer._send = slow_send
+        await producer.add({"i": 0})
+        await asyncio.sleep(0.02)
+
+        # Call 'close' while the linger flush is still sending.
+        with pytest.raises(RuntimeError, match="send failed"):
+            await producer.close()
+
+        # Assert.
+        assert sent == [{"i": 0}]
+
+    def test_invalid_batch_size(self):
+        with pytest.raises(ValueError, match="'batch_size' must be a positive integer"):
+            main.BatchProducer(self.redis, self.stream_name, batch_size=0)
+
+
+async def test_batch_producer(capsys):
+    redis = fakeredis.aioredis.FakeRedis()
+    stream_name = f"test_stream_{uuid.uuid4()}"
+
+    # Call 'batch_producer'.
+    await main.batch_producer(redis, stream_name, n_records=1200)
+
+    # Assert.
+    out, err = capsys.readouterr()
+    assert err == ""
+    assert f"producer added 1200 records to {stream_name}" in out
+    assert await redis.xlen(stream_name) == 1200
+
+
+class TestAckBatcher:
+    def setup_method(self):
+        self.redis = fakeredis.aioredis.FakeRedis()
+        self.stream_name = f"test_stream_{uuid.uuid4()}"
+
+    async def read_pending(self, n):
+        await main.create_consumer_group(self.stream_name, "test_group", self.redis)
+        for i in range(n):
+            await self.redis.xadd(self.stream_name, {"i": i})
+        result = await self.redis.xreadgroup(
+            "test_group", "worker", {self.stream_name: ">"}, count=n
+        )
+        return [entry_id for entry_id, _ in result[0][1]]
+
+    async def pending(self):
+        return (await self.redis.xpending(self.stream_name, "test_group"))["pending"]
+
+    async def test_acks_a_batch_with_one_xack(self):
+        entry_ids = await self.read_pending(5)
+        acker = main.AckBatcher(
+            self.redis, self.stream_name, "test_group", batch_size=4, linger=10
+        )
+
+        # Call 'ack' past one batch.
+        with patch.object(self.redis, "xack", wraps=self.redis.xack) as xack:
+            for entry_id in entry_ids:
+                await acker.ack(entry_id)
+
+            # Assert.
+            assert xack.call_count == 1
+            assert await self.pending() == 1
+            await acker.close()
+            assert xack.call_count == 2
+        assert await self.pending() == 0
+
+    async def test_acks_after_linger(self):
+        entry_ids = await self.read_pending(2)
+        acker = main.AckBatcher(self.redis, self.stream_name, "test_group", linger=0.02)
+
+        # Call 'ack' less than a batch.
+        await acker.ack(*entry_ids)
+
+        # Assert.
+        assert await self.pending() == 2
+        await asyncio.sleep(0.05)
+        assert await self.pending() == 0
+
+
+def test_parse_autoclaim():
+    # Call '_parse_autoclaim' on a raw and on a parsed reply.
+    raw = [b"5-0", [[b"1-0", [b"a", b"1", b"b", b"2"]], [b"2-0", None], None], []]
+    parsed = [b"0-0", [(b"3-0", {b"a": b"3"}), (None, None)]]
+
+    # Assert.
+    assert main._parse_autoclaim(raw) == (
+        b"5-0",
+        [(b"1-0", {b"a": b"1", b"b": b"2"})],
+        [b"2-0"],
+    )
+    assert main._parse_autoclaim(parsed) == (b"0-0", [(b"3-0", {b"a": b"3"})], [])
+
+
+class TestReclaimPending:
+    def setup_method(self):
+        self.redis = fakeredis.aioredis.FakeRedis()
+        self.stream_name = f"test_stream_{uuid.uuid4()}"
+        self.batches = []
+
+    async def handler(self, stream_name, entries):
+        self.batches.append([fields[b"i"] for _, fields in entries])
+
+    async def crash_with_pending(self, n):
+        await main.create_consumer_group(self.stream_name, "test_group", self.redis)
+        for i in range(n):
+            await self.redis.xadd(self.stream_name, {"i": i})
+        await self.redis.xreadgroup(
+            "test_group", "dead", {self.stream_name: ">"}, count=n
+        )
+
+    async def test_reclaims_in_pages(self):
+        await self.crash_with_pending(5)
+
+        # Call 'reclaim_pending'.
+        with patch.object(
+            self.redis, "execute_command", wraps=self.redis.execute_command
+        ) as execute_command:
+            processed = await main.reclaim_pending(
+                self.redis,
+                self.stream_name,
+                "test_group",
+                "live",
+                self.handler,
+                min_idle_ms=0,
+                count=2,
+            )
+
+        # Assert.
+        assert processed == 5
+        assert self.batches == [[b"0", b"1"], [b"2", b"3"], [b"4"]]
+        assert [call.args[0] for call in execute_command.call_args_list].count(
+            "XAUTOCLAIM"
+        ) == 3
+        pending = await self.redis.xpending(self.stream_name, "test_group")
+        assert pending["pending"] == 0
+
+    async def test_skips_recent_entries(self):
+        await self.crash_with_pending(3)
+
+        # Call 'reclaim_pending' with a long idle threshold.
+        processed = await main.reclaim_pending(
+            self.redis, self.stream_name, "test_group", "live", self.handler
+        )
+
+        # Assert.
+        assert processed == 0
+        assert self.batches == []
+        pending = await self.redis.xpending(self.stream_name, "test_group")
+        assert pending["consumers"] == [{"name": b"dead", "pending": 3}]
+
+    async def test_reclaimer_runs_until_stopped(self):
+        await self.crash_with_pending(3)
+        stop = asyncio.Event()
+        asyncio.get_running_loop().call_later(0.05, stop.set)
+
+        # Call 'reclaimer'.
+        await asyncio.wait_for(
+            main.reclaimer(
+                self.redis,
+                self.stream_name,
+                "test_group",
+                "live",
+                self.handler,
+                min_idle_ms=0,
+                interval=0.01,
+                stop=stop,
+            ),
+            timeout=1,
+        )
+
+        # Assert.
+        assert self.batches == [[b"0", b"1", b"2"]]
@@ -45,6 +45,15 @@ async def test_ephemera_with_timeout_at():
             await asyncio.sleep(1)
 
 
+async def test_ephemera_exits_before_deadline():
+    async with main.ephemera(timeout=1) as timeout:
+        await asyncio.sleep(0)
+
+    # Assert the timer was called off.
+    assert timeout._state == main._State.EXIT
+    assert timeout._timeout_handler is None
+
+
 @patch("patterns.async_timeout.asyncio.sleep", autospec=True)
 async def test_func(mock_asyncio_sleep, capsys):
     delay = 1
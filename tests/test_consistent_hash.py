@@ -0,0 +1,41 @@
+import pytest
+
+import patterns.consistent_hash as main
+
+
+def test_hash_ring_spreads_keys():
+    ring = main.HashRing({"a": 1, "b": 2, "c": 3})
+
+    # Call 'get' on many keys.
+    counts = {1: 0, 2: 0, 3: 0}
+    for i in range(3000):
+        counts[ring.get(f"key:{i}")] += 1
+
+    # Assert every node gets a fair share.
+    assert all(700 < count < 1300 for count in counts.values())
+
+
+def test_hash_ring_moves_few_keys():
+    keys = [f"key:{i}" for i in range(1000)]
+    before = main.HashRing(dict.fromkeys("abcd"))
+    after = main.HashRing(dict.fromkeys("abcde"))
+
+    # Assert only the keys that the new node owns move.
+    moved = [key for key in keys if before.name_of(key) != after.name_of(key)]
+    assert all(after.name_of(key) == "e" for key in moved)
+    assert len(moved) < 350
+
+
+def test_hash_ring_is_deterministic():
+    # Assert rings built from the same names agree.
+    first = main.HashRing({"x": object(), "y": object()})
+    second = main.HashRing({"y": None, "x": None})
+    assert all(first.name_of(str(i)) == second.name_of(str(i)) for i in range(100))
+
+
+def test_hash_ring_invalid_arguments():
+    with pytest.raises(ValueError, match="'nodes' must not be empty"):
+        main.HashRing({})
+
+    with pytest.raises(ValueError, match="'replicas' must be a positive integer"):
+        main.HashRing({"a": 1}, replicas=0)
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+import patterns.async_redis_queue as arq
+import patterns.inmemory_redis_broker as main
+
+
+async def test_list_commands():
+    broker = main.InMemoryBroker()
+
+    # Call the list commands.
+    assert await broker.rpush("queue", b"a", "b", 3) == 3
+    assert await broker.llen("queue") == 3
+    assert await broker.lpop("queue") == b"a"
+    assert await broker.lpop("queue", 5) == [b"b", b"3"]
+
+    # Assert popping the last item removes the key.
+    assert await broker.lpop("queue") is None
+    assert await broker.lpop("queue", 2) is None
+    assert await broker.exists("queue") == 0
+
+
+async def test_blpop():
+    broker = main.InMemoryBroker()
+    await broker.rpush("low", b"x")
+
+    # Assert keys are checked in order and the wait times out.
+    assert await broker.blpop(["high", "low"], timeout=1) == (b"low", b"x")
+    assert await broker.blpop("high", timeout=0.01) is None
+
+    # Assert a push wakes up a blocked pop.
+    blpop = asyncio.create_task(broker.blpop(["high", "low"]))
+    await asyncio.sleep(0.01)
+    await broker.rpush(b"high", b"y")
+    assert await blpop == (b"high", b"y")
+
+
+async def test_string_commands():
+    broker = main.InMemoryBroker()
+
+    # Call the string commands.
+    await broker.set("key", 42)
+    await broker.set("short", b"x", ex=-1)
+
+    # Assert.
+    assert await broker.get("key") == b"42"
+    assert await broker.get("short") is None
+    assert await broker.expire("key", -1) is True
+    assert await broker.get("key") is None
+    assert await broker.expire("missing", 10) is False
+    with pytest.raises(TypeError):
+        await broker.set("key", object())
+
+
+async def test_pipeline():
+    broker = main.InMemoryBroker()
+
+    # Buffer commands in a pipeline.
+    async with broker.pipeline(transaction=False) as pipe:
+        pipe.rpush("queue", b"a", b"b").llen("queue")
+        pipe.set("key", b"value")
+        assert await broker.llen("queue") == 0
+        results = await pipe.execute()
+
+    # Assert.
+    assert results == [2, 2, True]
+    with pytest.raises(AttributeError):
+        pipe.unknown_command()
+
+
+async def test_register_script():
+    broker = main.InMemoryBroker()
+    await broker.rpush("high", b"a")
+    await broker.rpush("normal", b"b", b"c")
+
+    # Call the known batch pop script and an unknown one.
+    pop_batch = broker.register_script(arq._POP_BATCH)
+    assert await pop_batch(keys=["high", "normal"], args=[2]) == [b"a", b"b"]
+    with pytest.raises(NotImplementedError):
+        await broker.register_script("return 1")()
+
+
+async def test_redis_queue_on_inmemory_broker():
+    queue = arq.RedisQueue(main.InMemoryBroker(), main.InMemoryBroker(), "test")
+
+    # Enqueue, execute, and wait for the results.
+    task_ids = await queue.enqueue_many([(arq.foo, (1, 2), {})] * 3)
+    await queue.dequeue()
+    tasks = await queue.dequeue_batch(max_items=5, max_wait=0)
+    for task in tasks:
+        await queue.execute(task)
+
+    # Assert.
+    assert len(tasks) == 2
+    assert await queue.get_length() == 0
+    for task_id in task_ids:
+        assert 1 <= await queue.get_result(task_id, timeout=1) <= 2
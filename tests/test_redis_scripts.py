@@ -0,0 +1,60 @@
+from unittest.mock import patch
+
+import fakeredis.aioredis
+
+import patterns.redis_scripts as main
+
+INCR_BY = "return redis.call('INCRBY', KEYS[1], ARGV[1])"
+
+
+def count_round_trips(redis):
+    """Count the commands, or pipelines of commands, sent to the server."""
+    connection_class = redis.connection_pool.connection_class
+    return patch.object(
+        connection_class,
+        "send_packed_command",
+        autospec=True,
+        side_effect=connection_class.send_packed_command,
+    )
+
+
+def queue_incr_by(script, keys):
+    def queue(pipe):
+        pipe.set("other", 1)
+        for i, key in enumerate(keys):
+            pipe.evalsha(script.sha, 1, key, i + 1)
+
+    return queue
+
+
+async def test_evalsha_pipeline_loads_the_script():
+    redis = fakeredis.aioredis.FakeRedis()
+    script = redis.register_script(INCR_BY)
+    await redis.ping()
+
+    # Call 'evalsha_pipeline' before the script is loaded.
+    with count_round_trips(redis) as round_trips:
+        replies = await main.evalsha_pipeline(
+            redis, script, queue_incr_by(script, ["a", "b"])
+        )
+
+    # Assert the pipeline is sent again once the script is loaded.
+    assert round_trips.call_count == 3
+    assert replies == [True, 1, 2]
+    assert await redis.mget("a", "b", "other") == [b"1", b"2", b"1"]
+
+
+async def test_evalsha_pipeline_takes_one_round_trip():
+    redis = fakeredis.aioredis.FakeRedis()
+    script = redis.register_script(INCR_BY)
+    await redis.script_load(INCR_BY)
+
+    # Call 'evalsha_pipeline' with the script loaded.
+    with count_round_trips(redis) as round_trips:
+        replies = await main.evalsha_pipeline(
+            redis, script, queue_incr_by(script, [f"key:{i}" for i in range(10)])
+        )
+
+    # Assert.
+    assert round_trips.call_count == 1
+    assert replies == [True, *range(1, 11)]